@@ -0,0 +1,62 @@
+"""Версионированные ключи кэша.
+
+Вместо удаления записей по шаблону каждая группа ключей хранит номер
+версии: при изменении данных версия увеличивается, и старые записи
+просто перестают читаться, пока не истечёт их срок жизни.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _version_key(namespace):
+    return f'version:{namespace}'
+
+
+def _initial_version():
+    # Начальная версия зависит от времени, поэтому после вытеснения ключа
+    # или перезапуска кэша старые записи не совпадут с новыми.
+    return time.time_ns()
+
+
+def get_version(namespace):
+    """Возвращает текущую версию пространства имён кэша."""
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        version = _initial_version()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def get_versions(namespaces):
+    """Возвращает версии нескольких пространств имён одним запросом."""
+    keys = {_version_key(namespace): namespace for namespace in namespaces}
+    found = cache.get_many(keys)
+    versions = {keys[key]: version for key, version in found.items()}
+    for key, namespace in keys.items():
+        if namespace not in versions:
+            versions[namespace] = get_version(namespace)
+    return versions
+
+
+def bump_version(namespace):
+    """Увеличивает версию, делая все записи пространства имён устаревшими."""
+    key = _version_key(namespace)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = _initial_version()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def bump_version_on_commit(namespace):
+    """Увеличивает версию после фиксации текущей транзакции.
+
+    Иначе параллельный запрос может успеть закэшировать ещё не
+    изменённые данные под новой версией.
+    """
+    transaction.on_commit(lambda: bump_version(namespace))
@@ -1,3 +1,5 @@
+import os
+
 from .utils import build_broker_url, build_engine_url
 
 
@@ -13,3 +15,23 @@ result_serializer = 'json'
 # Часовой пояс
 timezone = 'UTC'
 enable_utc = True
+
+# Периодические задачи (celery -A foodgram beat)
+beat_schedule = {
+    'update-recipe-rankings': {
+        'task': 'recipes.tasks.update_recipe_rankings_task',
+        'schedule': float(os.getenv('RECIPE_RANKING_INTERVAL', 600)),
+    },
+    'refresh-similar-recipes': {
+        'task': 'recipes.tasks.refresh_similar_recipes_task',
+        'schedule': float(os.getenv('RECIPE_SIMILAR_INTERVAL', 3600)),
+    },
+    'apply-pantry-index-changes': {
+        'task': 'recipes.tasks.apply_pantry_changes_task',
+        'schedule': float(os.getenv('PANTRY_INDEX_INTERVAL', 60)),
+    },
+    'delete-expired-exports': {
+        'task': 'recipes.tasks.delete_expired_exports_task',
+        'schedule': float(os.getenv('EXPORT_CLEANUP_INTERVAL', 3600)),
+    },
+}
@@ -0,0 +1,35 @@
+"""Условные GET-запросы (ETag / Last-Modified / 304)."""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """Строгий ETag по значениям, от которых зависит ответ."""
+    raw = ':'.join(str(part) for part in parts)
+    return '"{}"'.format(hashlib.sha1(raw.encode()).hexdigest())
+
+
+def conditional_response(request, build_response, etag, last_modified=None):
+    """Возвращает 304, если валидаторы клиента совпали, иначе ответ.
+
+    build_response вызывается только когда ответ действительно нужен,
+    поэтому тяжёлые запросы к БД при совпадении ETag не выполняются.
+    last_modified — datetime или None.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=timestamp
+    )
+    if response is None:
+        response = build_response()
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    patch_vary_headers(response, ('Authorization',))
+    return response
@@ -0,0 +1,49 @@
+"""Хранимые счётчики связанных записей.
+
+Счётчики меняются выражениями F() в той же транзакции, что и сама
+связь (см. recipes/signals.py), поэтому параллельные запросы не
+теряют изменения. Расхождения после массовых операций без сигналов
+(bulk_create, QuerySet.update) исправляет команда recount.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+class CounterFieldsMixin:
+    """Не даёт save() затереть счётчики значениями, прочитанными раньше.
+
+    Обычное сохранение существующей записи обновляет все поля, кроме
+    перечисленных в counter_fields и task_fields. В task_fields — поля,
+    которые пишут только фоновые задачи через QuerySet.update().
+    """
+    counter_fields = ()
+    task_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')
+                and not self._state.adding):
+            kwargs['update_fields'] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.name not in self.task_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарно меняет счётчик записи; значение не уходит ниже нуля."""
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+def related_count(model, field):
+    """Подзапрос: число записей model, ссылающихся полем field на pk."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(count=Count('pk')).values('count')
+    ), 0)
@@ -0,0 +1,194 @@
+"""Уменьшенные копии загруженных изображений.
+
+Метаданные EXIF (в том числе координаты съёмки) удаляются из оригинала
+ещё при загрузке через API (ImageUploadField), а копии нужных размеров
+в WebP и JPEG строятся в фоне задачей Celery. Задача повторно очищает
+оригинал, загруженный в обход API (например, через админку).
+"""
+import io
+import logging
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .media import get_media_resolver
+
+logger = logging.getLogger(__name__)
+
+# Защита от «бомб»: Pillow откажется открывать изображения, в которых
+# пикселей вдвое больше допустимого при загрузке
+Image.MAX_IMAGE_PIXELS = settings.IMAGE_UPLOAD_MAX_PIXELS
+
+EXIF_ORIENTATION = 0x0112
+
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'method': 4}),
+    'jpeg': ('JPEG', {'optimize': True, 'progressive': True}),
+}
+
+
+def _open(field_file):
+    with field_file.open('rb') as file:
+        image = Image.open(file)
+        image.load()
+    return image
+
+
+def _flatten(image):
+    """RGB без прозрачности: JPEG не умеет хранить альфа-канал."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def encode_without_metadata(source):
+    """Изображение без EXIF в исходном формате или None, если EXIF нет.
+
+    Поворот из EXIF применяется к пикселям, чтобы изображение не
+    легло набок. JPEG сохраняется с исходными таблицами квантования.
+    """
+    with Image.open(source) as image:
+        image.load()
+    exif = image.getexif()
+    if not exif and 'exif' not in image.info:
+        return None
+    image_format = image.format
+    options = {}
+    if exif.get(EXIF_ORIENTATION, 1) != 1:
+        image = ImageOps.exif_transpose(image)
+        if image_format == 'JPEG':
+            options['quality'] = 95
+    elif image_format == 'JPEG':
+        options['quality'] = 'keep'
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def strip_metadata(field_file):
+    """Сохраняет оригинал без EXIF и возвращает имя нового файла.
+
+    Исходный файл не удаляется: он может быть общим для нескольких
+    записей.
+    """
+    with field_file.open('rb') as file:
+        content = encode_without_metadata(file)
+    if content is None:
+        return field_file.name
+    return field_file.storage.save(field_file.name, ContentFile(content))
+
+
+def render_variants(field_file, sizes, quality):
+    """Сохраняет уменьшенные копии и возвращает их описание.
+
+    sizes — {название: наибольшая сторона}. Результат:
+    {название: {'width', 'height', 'webp': имя, 'jpeg': имя}}.
+    """
+    image = _flatten(_open(field_file))
+    storage = field_file.storage
+    directory, filename = posixpath.split(field_file.name)
+    stem = posixpath.splitext(filename)[0]
+    variants = {}
+    for size_name, max_side in sizes.items():
+        copy = image.copy()
+        copy.thumbnail((max_side, max_side), Image.LANCZOS)
+        variant = {'width': copy.width, 'height': copy.height}
+        for extension, (image_format, options) in VARIANT_FORMATS.items():
+            buffer = io.BytesIO()
+            copy.save(buffer, image_format, quality=quality, **options)
+            variant[extension] = storage.save(
+                posixpath.join(
+                    directory, 'variants', f'{stem}_{size_name}.{extension}'
+                ),
+                ContentFile(buffer.getvalue())
+            )
+        variants[size_name] = variant
+    return variants
+
+
+def process_image_variants(model, pk, field, variants_field, image_name,
+                           sizes, quality):
+    """Строит копии изображения объекта и сохраняет их описание.
+
+    Если изображение успело смениться, результат отбрасывается: для
+    нового изображения поставлена своя задача. Файлы копий и старого
+    оригинала остаются до сборки мусора (collect_media_garbage).
+    """
+    obj = model.objects.filter(pk=pk).only(field, variants_field).first()
+    field_file = getattr(obj, field, None)
+    if not field_file or field_file.name != image_name:
+        return None
+
+    field_file.name = strip_metadata(field_file)
+    variants = render_variants(field_file, sizes, quality)
+    updated = model.objects.filter(pk=pk, **{field: image_name}).update(**{
+        field: field_file.name,
+        variants_field: variants,
+        'updated': timezone.now(),
+    })
+    return variants if updated else None
+
+
+def reset_image_variants(instance, variants_field):
+    """Забывает копии прежнего изображения после сохранения нового.
+
+    Поле копий пишут только задачи, save() его не сохраняет (task_fields
+    в CounterFieldsMixin). Сброс идёт после save(): копии, которые задача
+    для прежнего изображения успела записать раньше, тоже удаляются.
+    """
+    setattr(instance, variants_field, {})
+    type(instance).objects.filter(pk=instance.pk).update(
+        **{variants_field: {}}
+    )
+
+
+def schedule_image_variants(task, pk, image_name):
+    """Ставит задачу построения копий после фиксации транзакции.
+
+    Недоступный брокер не должен ломать сохранение: до построения копий
+    клиенты получают оригинал.
+    """
+    def enqueue():
+        try:
+            task.delay(pk, image_name)
+        except Exception:
+            logger.warning(
+                'Не удалось поставить задачу %s для %s',
+                task.name, image_name, exc_info=True
+            )
+
+    transaction.on_commit(enqueue)
+
+
+def get_variant_url(variants, size_name, extension='jpeg', request=None):
+    """URL копии нужного размера или None, если её ещё нет."""
+    variant = (variants or {}).get(size_name)
+    if not variant or not variant.get(extension):
+        return None
+    return get_media_resolver(request).file_url(variant[extension])
+
+
+def get_variant_urls(variants, request=None):
+    """{размер: {'width', 'height', 'webp': url, 'jpeg': url}} для API."""
+    if not variants:
+        return None
+    resolver = get_media_resolver(request)
+    return {
+        size_name: {
+            'width': variant['width'],
+            'height': variant['height'],
+            **{
+                extension: resolver.file_url(variant.get(extension))
+                for extension in VARIANT_FORMATS
+            },
+        }
+        for size_name, variant in variants.items()
+    }
@@ -0,0 +1,64 @@
+"""Полные URL медиафайлов в ответах API.
+
+Начало URL (схема, хост и порт или адрес CDN из MEDIA_PUBLIC_URL)
+вычисляется один раз на запрос, а с CDN — один раз на процесс. Для
+каждого объекта к готовому префиксу только дописывается имя файла.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.http.request import split_domain_port
+from django.utils.encoding import filepath_to_uri
+
+from .storage import get_image_storage
+
+
+class MediaUrlResolver:
+    """Строит URL файлов хранилища изображений по готовому префиксу."""
+    __slots__ = ('origin', 'prefix')
+
+    def __init__(self, origin, base_url):
+        self.origin = origin
+        self.prefix = origin + base_url
+
+    def file_url(self, name):
+        """URL файла по его имени в хранилище."""
+        if not name:
+            return None
+        return self.prefix + filepath_to_uri(name)
+
+
+@lru_cache(maxsize=64)
+def _get_resolver(origin, base_url):
+    return MediaUrlResolver(origin, base_url)
+
+
+def get_media_origin(request=None):
+    """Схема, хост и порт, с которых клиенты получают медиафайлы.
+
+    Без MEDIA_PUBLIC_URL и без запроса URL остаются относительными.
+    Для хостов из MEDIA_DEV_PORTS порт заменяется: при локальной
+    разработке фронтенд и медиафайлы отдаются не тем портом, что API.
+    """
+    if settings.MEDIA_PUBLIC_URL:
+        return settings.MEDIA_PUBLIC_URL.rstrip('/')
+    if request is None:
+        return ''
+    host = request.get_host()
+    domain, _ = split_domain_port(host)
+    dev_port = settings.MEDIA_DEV_PORTS.get(domain)
+    if dev_port:
+        host = f'{domain}:{dev_port}'
+    return f'{request.scheme}://{host}'
+
+
+def get_media_resolver(request=None):
+    """Построитель URL, общий для всего запроса."""
+    resolver = getattr(request, '_media_resolver', None)
+    if resolver is None:
+        resolver = _get_resolver(
+            get_media_origin(request), get_image_storage().base_url
+        )
+        if request is not None:
+            request._media_resolver = resolver
+    return resolver
@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -91,6 +92,108 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Версионированные ключи (foodgram.cache) корректно инвалидируются только
+# в общем для всех воркеров кэше, поэтому в docker-compose используется Redis.
+
+REDIS_URL = os.getenv('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Время жизни множеств избранного, корзины и подписок пользователя (секунды)
+VIEWER_STATE_CACHE_TIMEOUT = int(os.getenv('VIEWER_STATE_CACHE_TIMEOUT', 600))
+
+# Время жизни закэшированных ответов API рецептов для анонимов (секунды)
+RECIPE_RESPONSE_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_RESPONSE_CACHE_TIMEOUT', 300)
+)
+
+# Время жизни независимых от пользователя фрагментов рецептов (секунды)
+RECIPE_FRAGMENT_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_FRAGMENT_CACHE_TIMEOUT', 3600)
+)
+
+# Уменьшенные копии изображений: {название: наибольшая сторона в пикселях}
+RECIPE_IMAGE_VARIANTS = {'card': 640, 'detail': 1280}
+AVATAR_IMAGE_VARIANTS = {'avatar': 256}
+IMAGE_VARIANT_QUALITY = int(os.getenv('IMAGE_VARIANT_QUALITY', 80))
+
+# Ограничения загружаемых изображений: размер файла в байтах и число
+# пикселей, проверяемое по заголовку до декодирования
+IMAGE_UPLOAD_MAX_SIZE = int(os.getenv('IMAGE_UPLOAD_MAX_SIZE', 10 * 2 ** 20))
+IMAGE_UPLOAD_MAX_PIXELS = int(os.getenv('IMAGE_UPLOAD_MAX_PIXELS', 40_000_000))
+
+# Лента подписок: с какого числа подписок лента пользователя хранится
+# в FeedEntry (меньше — собирается из рецептов при чтении) и по сколько
+# записей задача раскладывает рецепт по лентам
+FEED_FANOUT_MIN_SUBSCRIPTIONS = int(
+    os.getenv('FEED_FANOUT_MIN_SUBSCRIPTIONS', 20)
+)
+FEED_FANOUT_CHUNK_SIZE = int(os.getenv('FEED_FANOUT_CHUNK_SIZE', 1000))
+
+# Рейтинги рецептов: период полураспада оценок (секунды), веса
+# публикации, добавления в избранное и корзину и одного просмотра
+RECIPE_POPULAR_HALF_LIFE = int(
+    os.getenv('RECIPE_POPULAR_HALF_LIFE', 30 * 24 * 3600)
+)
+RECIPE_TRENDING_HALF_LIFE = int(
+    os.getenv('RECIPE_TRENDING_HALF_LIFE', 24 * 3600)
+)
+RECIPE_RANKING_WEIGHTS = {
+    'publish': 1.0,
+    'favorite': 3.0,
+    'shopping_cart': 2.0,
+    'view': 0.1,
+}
+# Просмотры копятся в кэше по интервалам такой длины (секунды)
+RECIPE_VIEWS_BUCKET = int(os.getenv('RECIPE_VIEWS_BUCKET', 300))
+# Активность моложе этого (секунды) ждёт следующего запуска: её
+# транзакции могли ещё не зафиксироваться
+RECIPE_RANKING_LAG = int(os.getenv('RECIPE_RANKING_LAG', 60))
+
+# Похожие рецепты: длина списка, мера сходства наборов ингредиентов
+# (cosine или jaccard) и число рецептов в одном блоке вычислений
+RECIPE_SIMILAR_COUNT = int(os.getenv('RECIPE_SIMILAR_COUNT', 10))
+RECIPE_SIMILAR_METRIC = os.getenv('RECIPE_SIMILAR_METRIC', 'cosine')
+RECIPE_SIMILAR_CHUNK_SIZE = int(os.getenv('RECIPE_SIMILAR_CHUNK_SIZE', 512))
+
+# Поиск рецептов по продуктам: сколько ингредиентов можно указать,
+# сколько разрешить недостающих и сколько изменений рецептов переносит
+# в индекс один запуск задачи
+PANTRY_MAX_INGREDIENTS = int(os.getenv('PANTRY_MAX_INGREDIENTS', 50))
+PANTRY_MAX_MISSING = int(os.getenv('PANTRY_MAX_MISSING', 5))
+PANTRY_CHANGES_BATCH = int(os.getenv('PANTRY_CHANGES_BATCH', 5000))
+
+# Конфигурация полнотекстового поиска рецептов PostgreSQL
+RECIPE_SEARCH_CONFIG = os.getenv('RECIPE_SEARCH_CONFIG', 'russian')
+
+# Порог похожести для нечёткого поиска ингредиентов (0..1)
+INGREDIENT_FUZZY_THRESHOLD = float(
+    os.getenv('INGREDIENT_FUZZY_THRESHOLD', 0.4)
+)
+
+# Сколько ингредиентов возвращает нечёткий поиск, если limit не указан
+INGREDIENT_FUZZY_LIMIT = 10
+
+# Как часто процесс сверяет версию справочника ингредиентов (секунды)
+INGREDIENT_CATALOG_CHECK_INTERVAL = float(
+    os.getenv('INGREDIENT_CATALOG_CHECK_INTERVAL', 1)
+)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -140,6 +243,44 @@ AUTH_USER_MODEL = 'users.User'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.getenv('MEDIA_ROOT', BASE_DIR / 'media')
 
+# Адрес, с которого клиенты получают медиафайлы (например, CDN):
+# https://cdn.example.com. Если не задан, URL строятся по хосту запроса
+MEDIA_PUBLIC_URL = os.getenv('MEDIA_PUBLIC_URL', '')
+
+# При локальной разработке медиафайлы отдаёт nginx на другом порту
+MEDIA_DEV_PORTS = {'localhost': 8080, '127.0.0.1': 8080}
+
+# Изображения рецептов и аватары хранятся под именами по содержимому
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'images': {
+        'BACKEND': 'foodgram.storage.ContentAddressedStorage',
+    },
+    # Выгрузки списков покупок: вне MEDIA_ROOT, отдаются только через API
+    'exports': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {
+            'location': os.getenv('EXPORTS_ROOT', BASE_DIR / 'exports'),
+        },
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Выгрузка списка покупок: каталог готовых файлов, срок действия ссылки
+# на скачивание (в секундах) и шрифт для PDF
+SHOPPING_LIST_EXPORT_DIR = 'shopping_lists'
+SHOPPING_LIST_EXPORT_LINK_MAX_AGE = int(
+    os.getenv('SHOPPING_LIST_EXPORT_LINK_MAX_AGE', 3600)
+)
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 # REST Framework настройки
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -0,0 +1,45 @@
+"""Хранилище изображений с именами по содержимому.
+
+Файл называется SHA-256 своего содержимого, поэтому одинаковые загрузки
+ссылаются на один файл, а содержимое по URL никогда не меняется и nginx
+отдаёт его с долгим кэшированием. Из-за общих файлов код приложения их
+не удаляет: неиспользуемые файлы удаляет команда collect_media_garbage.
+"""
+import hashlib
+import os
+import posixpath
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage, storages
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, где имя файла — хэш его содержимого."""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_content_name(name, content)
+        if self.exists(name):
+            # Свежее время изменения не даст сборщику мусора удалить файл,
+            # пока запись со ссылкой на него не сохранена
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def get_content_name(self, name, content):
+        """Имя в том же каталоге: хэш содержимого и исходное расширение."""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest.hexdigest() + extension)
+
+
+def get_image_storage():
+    """Хранилище изображений рецептов и аватаров (STORAGES['images'])."""
+    return storages['images']
@@ -0,0 +1,192 @@
+"""Загрузка изображений в base64 и файлом из multipart/form-data.
+
+Файл из multipart/form-data пишется во временный файл по частям и не
+держится в памяти целиком. Слишком большие запросы отклоняются по
+Content-Length ещё до чтения тела, а изображения с чрезмерным числом
+пикселей — по заголовку, без декодирования. Метаданные EXIF удаляются
+до сохранения файла.
+"""
+import io
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from drf_extra_fields.fields import Base64ImageField
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+from rest_framework.fields import ImageField
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+
+from .images import Image, encode_without_metadata
+
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF')
+
+
+class RequestTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Размер запроса превышает допустимый.'
+    default_code = 'request_too_large'
+
+
+def get_max_request_size(base64_encoded=False):
+    """Наибольший допустимый размер тела запроса с изображением.
+
+    Кроме файла в запросе есть обычные поля, их объём Django ограничивает
+    DATA_UPLOAD_MAX_MEMORY_SIZE. В base64 файл занимает на треть больше.
+    """
+    max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+    if base64_encoded:
+        max_size = max_size * 4 // 3 + 4
+    return max_size + settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """Пишет файлы во временный файл и обрывает слишком большие загрузки."""
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        if content_length > get_max_request_size():
+            raise RequestTooLarge()
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.file.close()
+            raise RequestTooLarge('Размер файла превышает допустимый.')
+        return super().receive_data_chunk(raw_data, start)
+
+
+class LimitedBodyParserMixin:
+    """Отклоняет тело больше допустимого до его чтения.
+
+    JSON и urlencoded парсеры читают тело целиком в память, а
+    изображение в них приходит строкой base64.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = (parser_context or {}).get('request')
+        if request is not None:
+            try:
+                content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                content_length = 0
+            if content_length > get_max_request_size(base64_encoded=True):
+                raise RequestTooLarge()
+        return super().parse(stream, media_type, parser_context)
+
+
+class LimitedJSONParser(LimitedBodyParserMixin, JSONParser):
+    pass
+
+
+class LimitedFormParser(LimitedBodyParserMixin, FormParser):
+    pass
+
+
+class LimitedMultiPartParser(MultiPartParser):
+    """multipart/form-data с ограничением размера загружаемых файлов.
+
+    Обработчик загрузки подключается только здесь, а не в
+    FILE_UPLOAD_HANDLERS: RequestTooLarge — исключение DRF, и вне API
+    (например, в админке) оно превратилось бы в ответ 500.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        django_request = parser_context['request']._request
+        django_request.upload_handlers = [
+            LimitedTemporaryFileUploadHandler(django_request)
+        ]
+        return super().parse(stream, media_type, parser_context)
+
+
+UPLOAD_PARSER_CLASSES = [
+    LimitedJSONParser, LimitedFormParser, LimitedMultiPartParser
+]
+
+
+def inspect_image(source):
+    """Проверяет формат и размеры изображения по его заголовку.
+
+    Пиксели не декодируются, поэтому «бомба» из маленького файла с
+    огромными размерами отклоняется, не заняв память.
+    """
+    try:
+        with Image.open(source) as image:
+            image_format = image.format
+            width, height = image.size
+    except Image.DecompressionBombError:
+        width = height = None
+    except (OSError, SyntaxError, ValueError):
+        raise serializers.ValidationError(
+            'Загрузите корректное изображение.'
+        )
+    max_pixels = settings.IMAGE_UPLOAD_MAX_PIXELS
+    if width is None or width * height > max_pixels:
+        raise serializers.ValidationError(
+            f'Изображение больше {max_pixels} пикселей.'
+        )
+    if image_format not in ALLOWED_FORMATS:
+        raise serializers.ValidationError(
+            'Допустимы изображения JPEG, PNG и GIF.'
+        )
+    return image_format
+
+
+class ImageUploadField(Base64ImageField):
+    """Изображение строкой base64 или файлом из multipart/form-data."""
+
+    def to_internal_value(self, data):
+        max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+        if isinstance(data, UploadedFile):
+            if data.size > max_size:
+                raise serializers.ValidationError(self.size_message())
+            if hasattr(data, 'temporary_file_path'):
+                image_format = inspect_image(data.temporary_file_path())
+            else:
+                image_format = inspect_image(data)
+                data.seek(0)
+            # Имя от клиента не используется, как и при загрузке в base64
+            extension = {'JPEG': 'jpg'}.get(
+                image_format, image_format.lower()
+            )
+            data.name = f'{self.get_file_name(None)}.{extension}'
+            return self.remove_metadata(
+                ImageField.to_internal_value(self, data)
+            )
+        if isinstance(data, str):
+            # Размер известен до декодирования: 4 символа base64 на 3 байта.
+            # Строку не копируем, она может занимать десятки мегабайт
+            header_end = data.find(';base64,', 0, 256)
+            encoded_length = len(data)
+            if header_end >= 0:
+                encoded_length -= header_end + len(';base64,')
+            if encoded_length * 3 // 4 > max_size + 2:
+                raise serializers.ValidationError(self.size_message())
+        return self.remove_metadata(super().to_internal_value(data))
+
+    def remove_metadata(self, file):
+        """Файл без EXIF: координаты съёмки не попадают в хранилище."""
+        if file is None:
+            return file
+        content = encode_without_metadata(file)
+        file.seek(0)
+        if content is None:
+            return file
+        return ContentFile(content, name=file.name)
+
+    def get_file_extension(self, filename, decoded_file):
+        if len(decoded_file) > settings.IMAGE_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(self.size_message())
+        # BytesIO не копирует bytes, пока в него не пишут
+        inspect_image(io.BytesIO(decoded_file))
+        return super().get_file_extension(filename, decoded_file)
+
+    def size_message(self):
+        max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+        return f'Размер изображения больше {max_size // 2 ** 20} МБ.'
+
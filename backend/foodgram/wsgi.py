@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
 application = get_wsgi_application()
+
+# Справочник ингредиентов загружается при старте, а не на первом запросе
+from django.db import DatabaseError  # noqa: E402
+
+from ingredients.catalog import get_catalog  # noqa: E402
+
+try:
+    get_catalog()
+except DatabaseError:
+    pass
@@ -1,4 +1,7 @@
 from django.contrib import admin
+
+from foodgram.counters import related_count
+from recipes.models import RecipeIngredient
 from .models import Ingredient
 
 
@@ -8,6 +11,12 @@ class IngredientAdmin(admin.ModelAdmin):
     search_fields = ('name', 'measurement_unit')
     list_filter = ('measurement_unit',)
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipes_count=related_count(RecipeIngredient, 'ingredient')
+        )
+
     def recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
     recipes_count.short_description = 'Кол-во рецептов'
+    recipes_count.admin_order_field = 'recipes_count'
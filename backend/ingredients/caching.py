@@ -0,0 +1,18 @@
+"""Версия справочника ингредиентов для кэшей и ETag."""
+from django.db import transaction
+
+from foodgram.cache import bump_version_on_commit, get_version
+
+INGREDIENTS_NAMESPACE = 'ingredients'
+
+
+def get_ingredients_version():
+    return get_version(INGREDIENTS_NAMESPACE)
+
+
+def invalidate_ingredients_catalog():
+    """Увеличивает версию справочника после фиксации транзакции."""
+    from .catalog import expire_catalog
+
+    bump_version_on_commit(INGREDIENTS_NAMESPACE)
+    transaction.on_commit(expire_catalog)
@@ -0,0 +1,143 @@
+"""Справочник ингредиентов в памяти процесса.
+
+Справочник меняется редко, а читается на каждое нажатие клавиши в
+автодополнении, при каждом сохранении рецепта и при выгрузке списка
+покупок. Поэтому каждый процесс держит неизменяемый снимок таблицы и
+перечитывает его, когда меняется версия справочника в кэше.
+"""
+import threading
+import time
+from bisect import bisect_left
+from functools import cached_property
+
+from django.conf import settings
+
+from .caching import get_ingredients_version
+from .models import Ingredient
+from .trigrams import TrigramIndex
+
+
+class IngredientCatalog:
+    """Неизменяемый снимок таблицы ингредиентов."""
+
+    def __init__(self, rows, version):
+        self.version = version
+        self.by_id = {pk: (name, unit) for pk, name, unit in rows}
+        self.ids = frozenset(self.by_id)
+        entries = sorted(
+            (name.casefold(), name, pk) for pk, name, unit in rows
+        )
+        # Префиксный индекс: отсортированные названия в нижнем регистре
+        self.keys = [key for key, _, _ in entries]
+        self.items = [
+            {'id': pk, 'name': name, 'measurement_unit': self.by_id[pk][1]}
+            for _, name, pk in entries
+        ]
+
+    @classmethod
+    def load(cls, version):
+        rows = Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit'
+        ).order_by()
+        return cls(list(rows), version)
+
+    def search(self, prefix):
+        """Ингредиенты, название которых начинается с prefix."""
+        if not prefix:
+            return self.items
+        prefix = prefix.casefold()
+        start = bisect_left(self.keys, prefix)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(prefix):
+            end += 1
+        return self.items[start:end]
+
+    @cached_property
+    def trigram_index(self):
+        """Индекс для нечёткого поиска, строится при первом обращении."""
+        return TrigramIndex(self.items)
+
+    def missing(self, ids):
+        """id из ids, которых нет в справочнике."""
+        return set(ids) - self.ids
+
+
+class CatalogHolder:
+    """Хранит текущий снимок и сверяет его версию с кэшем.
+
+    Версия проверяется не чаще раза в INGREDIENT_CATALOG_CHECK_INTERVAL
+    секунд; изменения в этом же процессе сбрасывают проверку сразу.
+    """
+
+    def __init__(self):
+        self.catalog = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def get(self):
+        catalog = self.catalog
+        interval = settings.INGREDIENT_CATALOG_CHECK_INTERVAL
+        if (
+            catalog is not None
+            and time.monotonic() - self.checked_at < interval
+        ):
+            return catalog
+        version = get_ingredients_version()
+        if catalog is None or catalog.version != version:
+            with self.lock:
+                if self.catalog is None or self.catalog.version != version:
+                    self.catalog = IngredientCatalog.load(version)
+                catalog = self.catalog
+        self.checked_at = time.monotonic()
+        return catalog
+
+    def reload(self):
+        with self.lock:
+            self.catalog = IngredientCatalog.load(get_ingredients_version())
+            self.checked_at = time.monotonic()
+            return self.catalog
+
+    def expire(self):
+        self.checked_at = 0.0
+
+
+_holder = CatalogHolder()
+
+
+def get_catalog():
+    """Текущий справочник ингредиентов процесса."""
+    return _holder.get()
+
+
+def reload_catalog():
+    """Перечитывает справочник из БД независимо от версии."""
+    return _holder.reload()
+
+
+def expire_catalog():
+    """Заставляет следующее обращение сверить версию справочника."""
+    _holder.expire()
+
+
+def _get_catalog_with(ids):
+    """Справочник, в котором есть все существующие ингредиенты из ids.
+
+    Если каких-то id нет в снимке, но они есть в БД (ингредиент только
+    что добавлен или записан без сигналов), снимок перечитывается.
+    """
+    catalog = get_catalog()
+    missing = catalog.missing(ids)
+    if missing and Ingredient.objects.filter(pk__in=missing).exists():
+        catalog = reload_catalog()
+    return catalog
+
+
+def find_missing_ingredients(ids):
+    """id ингредиентов, которых нет в справочнике."""
+    return _get_catalog_with(ids).missing(ids)
+
+
+def get_ingredient_info(ids):
+    """{id: (название, единица)} для переданных id ингредиентов."""
+    catalog = _get_catalog_with(ids)
+    return {pk: catalog.by_id[pk] for pk in ids if pk in catalog.by_id}
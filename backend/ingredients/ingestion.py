@@ -0,0 +1,175 @@
+"""Потоковое чтение справочника ингредиентов из CSV и JSON.
+
+Файл читается по частям и разбирается генераторами, поэтому память не
+растёт с размером каталога: в каждый момент в памяти находится только
+текущая пачка записей.
+"""
+import csv
+import json
+import re
+from itertools import islice
+
+# Синонимы единиц измерения и их написание в справочнике
+UNIT_ALIASES = {
+    'гр': 'г',
+    'гр.': 'г',
+    'г.': 'г',
+    'грамм': 'г',
+    'граммов': 'г',
+    'кг.': 'кг',
+    'килограмм': 'кг',
+    'мл.': 'мл',
+    'миллилитр': 'мл',
+    'миллилитров': 'мл',
+    'л.': 'л',
+    'литр': 'л',
+    'шт': 'шт.',
+    'штука': 'шт.',
+    'штук': 'шт.',
+    'ч.л.': 'ч. л.',
+    'ч.л': 'ч. л.',
+    'чайная ложка': 'ч. л.',
+    'ст.л.': 'ст. л.',
+    'ст.л': 'ст. л.',
+    'столовая ложка': 'ст. л.',
+}
+
+NAME_MAX_LENGTH = 128
+UNIT_MAX_LENGTH = 64
+JSON_CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = re.compile(r'\s+')
+
+
+class RecordError(ValueError):
+    """Запись файла не может быть загружена."""
+
+
+def iter_csv_records(file):
+    """Выдаёт (номер строки, название, единица) из CSV файла."""
+    for row_num, row in enumerate(csv.reader(file), start=1):
+        if len(row) < 2:
+            yield row_num, None, None
+            continue
+        yield row_num, row[0], row[1]
+
+
+def iter_json_array(file, chunk_size=JSON_CHUNK_SIZE):
+    """Выдаёт элементы JSON массива верхнего уровня по одному.
+
+    Файл читается блоками по chunk_size символов, каждый элемент
+    разбирается json.JSONDecoder.raw_decode, как только он целиком
+    оказался в буфере.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = file.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[position:] + chunk
+        position = 0
+
+    def skip_whitespace():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position < len(buffer) or eof:
+                return
+            fill()
+
+    skip_whitespace()
+    if buffer[position:position + 1] != '[':
+        raise json.JSONDecodeError(
+            'Ожидался массив', buffer, position
+        )
+    position += 1
+    expect_item = True
+
+    while True:
+        skip_whitespace()
+        if position >= len(buffer):
+            raise json.JSONDecodeError(
+                'Массив не закрыт', buffer, position
+            )
+        char = buffer[position]
+        if char == ']':
+            return
+        if char == ',' and not expect_item:
+            position += 1
+            expect_item = True
+            continue
+        if not expect_item:
+            raise json.JSONDecodeError(
+                'Ожидалась запятая', buffer, position
+            )
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            # Число на границе блока могло прочитаться не полностью
+            if end == len(buffer) and not eof:
+                fill()
+                continue
+            break
+        position = end
+        expect_item = False
+        yield item
+
+
+def iter_json_records(file, chunk_size=JSON_CHUNK_SIZE):
+    """Выдаёт (номер элемента, название, единица) из JSON файла."""
+    items = iter_json_array(file, chunk_size)
+    for item_num, item in enumerate(items, start=1):
+        if not isinstance(item, dict):
+            yield item_num, None, None
+            continue
+        yield item_num, item.get('name', ''), item.get('measurement_unit', '')
+
+
+def normalize_unit(unit):
+    unit = WHITESPACE.sub(' ', unit.strip().lower())
+    return UNIT_ALIASES.get(unit, unit)
+
+
+def normalize_record(name, unit):
+    """Проверяет запись и приводит её к виду, в котором она хранится."""
+    if name is None or unit is None:
+        raise RecordError('неверный формат')
+    if not isinstance(name, str) or not isinstance(unit, str):
+        raise RecordError('значения должны быть строками')
+    name = WHITESPACE.sub(' ', name.strip())
+    unit = normalize_unit(unit)
+    if not name or not unit:
+        raise RecordError('пустые значения')
+    if len(name) > NAME_MAX_LENGTH or len(unit) > UNIT_MAX_LENGTH:
+        raise RecordError('слишком длинное значение')
+    return name, unit
+
+
+def iter_batches(records, batch_size, on_error):
+    """Группирует нормализованные записи в пачки без повторов.
+
+    on_error(номер, причина) вызывается для каждой отброшенной записи.
+    """
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, batch_size))
+        if not chunk:
+            return
+        batch = {}
+        for number, name, unit in chunk:
+            try:
+                batch[normalize_record(name, unit)] = None
+            except RecordError as error:
+                on_error(number, error)
+        yield len(chunk), list(batch)
@@ -1,13 +1,27 @@
 """
 Management команда для загрузки ингредиентов из CSV или JSON файла.
+
+Файл разбирается потоково и записывается пачками фиксированного размера.
 """
 import csv
+import io
 import json
 import os
+import time
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.db import connection, transaction
+from ingredients.caching import invalidate_ingredients_catalog
+from ingredients.ingestion import (
+    iter_batches,
+    iter_csv_records,
+    iter_json_records,
+)
 from ingredients.models import Ingredient
 
+# Сколько новых ингредиентов показывать в отчёте --dry-run
+DRY_RUN_PREVIEW = 50
+
 
 class Command(BaseCommand):
     help = 'Загружает ингредиенты из CSV или JSON файла в базу данных'
@@ -26,6 +40,24 @@ class Command(BaseCommand):
             help='Формат файла (csv или json)',
             default='csv'
         )
+        parser.add_argument(
+            '--mode',
+            type=str,
+            choices=['bulk', 'copy'],
+            help='Способ записи: bulk_create пачками или COPY (PostgreSQL)',
+            default='bulk'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Количество строк в одной пачке',
+            default=1000
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, какие ингредиенты будут созданы'
+        )
 
     def handle(self, *args, **options):
         file_path = options.get('file')
@@ -90,143 +122,163 @@ class Command(BaseCommand):
         self.stdout.write(f'Загрузка ингредиентов из файла: {file_path}')
 
         if file_format == 'csv' or file_path.endswith('.csv'):
-            self.load_from_csv(file_path)
+            iter_records, label = iter_csv_records, 'Строка'
         else:
-            self.load_from_json(file_path)
+            iter_records, label = iter_json_records, 'Элемент'
 
-    def load_from_csv(self, file_path):
-        """Загрузка ингредиентов из CSV файла."""
-        created_count = 0
-        updated_count = 0
-        error_count = 0
-
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                reader = csv.reader(file)
-                for row_num, row in enumerate(reader, start=1):
-                    if len(row) < 2:
-                        self.stdout.write(
-                            self.style.WARNING(
-                                f'Строка {row_num}: пропущена (недостаточно данных)'
-                            )
-                        )
-                        error_count += 1
-                        continue
-
-                    name = row[0].strip()
-                    measurement_unit = row[1].strip()
-
-                    if not name or not measurement_unit:
-                        self.stdout.write(
-                            self.style.WARNING(
-                                f'Строка {row_num}: пропущена (пустые значения)'
-                            )
-                        )
-                        error_count += 1
-                        continue
-
-                    # Создаем или обновляем ингредиент
-                    ingredient, created = Ingredient.objects.get_or_create(
-                        name=name,
-                        defaults={'measurement_unit': measurement_unit}
-                    )
-
-                    if created:
-                        created_count += 1
-                    else:
-                        # Обновляем единицу измерения, если она изменилась
-                        if ingredient.measurement_unit != measurement_unit:
-                            ingredient.measurement_unit = measurement_unit
-                            ingredient.save()
-                            updated_count += 1
-
-        except Exception as e:
+        if options['mode'] == 'copy' and connection.vendor != 'postgresql':
             self.stdout.write(
-                self.style.ERROR(f'Ошибка при чтении CSV файла: {e}')
+                self.style.ERROR('Режим copy доступен только для PostgreSQL')
             )
             return
 
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'\nЗагрузка завершена!\n'
-                f'Создано: {created_count}\n'
-                f'Обновлено: {updated_count}\n'
-                f'Ошибок: {error_count}'
-            )
-        )
+        self.error_count = 0
 
-    def load_from_json(self, file_path):
-        """Загрузка ингредиентов из JSON файла."""
-        created_count = 0
-        updated_count = 0
-        error_count = 0
+        def on_error(number, reason):
+            self.stdout.write(
+                self.style.WARNING(f'{label} {number}: пропущена ({reason})')
+            )
+            self.error_count += 1
 
+        self.started = time.perf_counter()
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-
-            # Проверяем формат JSON
-            if not isinstance(data, list):
-                self.stdout.write(
-                    self.style.ERROR('JSON файл должен содержать список объектов')
+            with open(file_path, 'r', encoding='utf-8', newline='') as file:
+                batches = iter_batches(
+                    iter_records(file), options['batch_size'], on_error
                 )
-                return
-
-            # Если это список словарей
-            for item_num, item in enumerate(data, start=1):
-                if not isinstance(item, dict):
-                    self.stdout.write(
-                        self.style.WARNING(
-                            f'Элемент {item_num}: пропущен (неверный формат)'
-                        )
+                if options['mode'] == 'copy':
+                    read_count, created_count = self.load_with_copy(
+                        batches, options['dry_run']
                     )
-                    error_count += 1
-                    continue
-
-                name = item.get('name', '').strip()
-                measurement_unit = item.get('measurement_unit', '').strip()
-
-                if not name or not measurement_unit:
-                    self.stdout.write(
-                        self.style.WARNING(
-                            f'Элемент {item_num}: пропущен (пустые значения)'
-                        )
-                    )
-                    error_count += 1
-                    continue
-
-                # Создаем или обновляем ингредиент
-                ingredient, created = Ingredient.objects.get_or_create(
-                    name=name,
-                    defaults={'measurement_unit': measurement_unit}
-                )
-
-                if created:
-                    created_count += 1
                 else:
-                    # Обновляем единицу измерения, если она изменилась
-                    if ingredient.measurement_unit != measurement_unit:
-                        ingredient.measurement_unit = measurement_unit
-                        ingredient.save()
-                        updated_count += 1
-
+                    read_count, created_count = self.load_with_bulk(
+                        batches, options['dry_run']
+                    )
         except json.JSONDecodeError as e:
             self.stdout.write(
                 self.style.ERROR(f'Ошибка при парсинге JSON файла: {e}')
             )
             return
-        except Exception as e:
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
             self.stdout.write(
-                self.style.ERROR(f'Ошибка при чтении JSON файла: {e}')
+                self.style.ERROR(f'Ошибка при чтении файла: {e}')
             )
             return
+        elapsed = time.perf_counter() - self.started
+
+        if created_count and not options['dry_run']:
+            invalidate_ingredients_catalog()
 
+        rate = read_count / elapsed if elapsed else 0
         self.stdout.write(
             self.style.SUCCESS(
-                f'\nЗагрузка завершена!\n'
-                f'Создано: {created_count}\n'
-                f'Обновлено: {updated_count}\n'
-                f'Ошибок: {error_count}'
+                f'\n{"Проверка" if options["dry_run"] else "Загрузка"} '
+                f'завершена!\n'
+                f'Записей в файле: {read_count}\n'
+                f'{"Будет создано" if options["dry_run"] else "Создано"}: '
+                f'{created_count}\n'
+                f'Ошибок: {self.error_count}\n'
+                f'Время: {elapsed * 1000:.0f} мс ({rate:.0f} записей/с)'
             )
         )
 
+    def report_batch(self, number, read_count, created_count):
+        """Строка прогресса после каждой пачки."""
+        elapsed = time.perf_counter() - self.started
+        rate = read_count / elapsed if elapsed else 0
+        self.stdout.write(
+            f'Пачка {number}: прочитано {read_count}, '
+            f'новых {created_count}, {rate:.0f} записей/с'
+        )
+
+    def load_with_bulk(self, batches, dry_run):
+        """Создаёт отсутствующие ингредиенты пачками через bulk_create.
+
+        Для каждой пачки одним запросом выбираются уже существующие пары,
+        поэтому повторная загрузка того же файла ничего не записывает.
+        При --dry-run в базу ничего не пишется, поэтому пары из прошлых
+        пачек запоминаются, чтобы повтор в файле не считался дважды.
+        """
+        read_count = created_count = 0
+        planned = set()
+        for number, (size, rows) in enumerate(batches, start=1):
+            existing = set(
+                Ingredient.objects.filter(
+                    name__in={name for name, _ in rows}
+                ).values_list('name', 'measurement_unit')
+            )
+            new_rows = [
+                row for row in rows
+                if row not in existing and row not in planned
+            ]
+            if dry_run:
+                self.report_new_rows(new_rows, existing, created_count)
+                planned.update(new_rows)
+            elif new_rows:
+                with transaction.atomic():
+                    Ingredient.objects.bulk_create(
+                        (
+                            Ingredient(name=name, measurement_unit=unit)
+                            for name, unit in new_rows
+                        ),
+                        batch_size=len(new_rows),
+                        ignore_conflicts=True
+                    )
+            read_count += size
+            created_count += len(new_rows)
+            self.report_batch(number, read_count, created_count)
+        return read_count, created_count
+
+    def load_with_copy(self, batches, dry_run):
+        """Загружает файл через COPY во временную таблицу PostgreSQL.
+
+        Каждая пачка отправляется отдельным COPY, а разница с таблицей
+        ингредиентов вычисляется на стороне БД одним
+        INSERT ... ON CONFLICT DO NOTHING.
+        """
+        table = Ingredient._meta.db_table
+        read_count = 0
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredients_import '
+                '(name varchar(128), measurement_unit varchar(64)) '
+                'ON COMMIT DROP'
+            )
+            for number, (size, rows) in enumerate(batches, start=1):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(rows)
+                buffer.seek(0)
+                cursor.cursor.copy_expert(
+                    'COPY ingredients_import (name, measurement_unit) '
+                    'FROM STDIN WITH (FORMAT csv)',
+                    buffer
+                )
+                read_count += size
+                self.report_batch(number, read_count, 0)
+            if dry_run:
+                cursor.execute(
+                    f'SELECT DISTINCT i.name, i.measurement_unit '
+                    f'FROM ingredients_import i '
+                    f'WHERE NOT EXISTS (SELECT 1 FROM {table} t '
+                    f'WHERE t.name = i.name '
+                    f'AND t.measurement_unit = i.measurement_unit)'
+                )
+                created_count = 0
+                while rows := cursor.fetchmany(DRY_RUN_PREVIEW):
+                    self.report_new_rows(rows, set(), created_count)
+                    created_count += len(rows)
+                return read_count, created_count
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'SELECT name, measurement_unit FROM ingredients_import '
+                f'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+            return read_count, cursor.rowcount
+
+    def report_new_rows(self, new_rows, existing, shown):
+        """Печатает ингредиенты, которые будут созданы (--dry-run)."""
+        known_names = {name for name, _ in existing}
+        for name, unit in new_rows[:max(DRY_RUN_PREVIEW - shown, 0)]:
+            note = ' (новая единица измерения)' if name in known_names else ''
+            self.stdout.write(f'  + {name}, {unit}{note}')
@@ -0,0 +1,67 @@
+# Generated by Django 5.1.6 on 2026-10-17 09:12
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_references(model, owner_field, duplicate_id, keep_id, amount_field):
+    """Переносит ссылки с дубликата на оставляемый ингредиент.
+
+    Если у владельца (рецепта или пользователя) уже есть строка с
+    оставляемым ингредиентом, количества складываются.
+    """
+    for row in model.objects.filter(ingredient_id=duplicate_id):
+        target = model.objects.filter(
+            ingredient_id=keep_id,
+            **{owner_field: getattr(row, owner_field)}
+        ).first()
+        if target is None:
+            row.ingredient_id = keep_id
+            row.save(update_fields=['ingredient'])
+            continue
+        setattr(
+            target,
+            amount_field,
+            getattr(target, amount_field) + getattr(row, amount_field)
+        )
+        target.save(update_fields=[amount_field])
+        row.delete()
+
+
+def merge_duplicates(apps, schema_editor):
+    """Объединяет ингредиенты с одинаковыми названием и единицей."""
+    Ingredient = apps.get_model('ingredients', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    groups = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        keep_id=Min('id'), count=Count('id')
+    ).filter(count__gt=1).order_by()
+    for group in groups:
+        duplicate_ids = Ingredient.objects.filter(
+            name=group['name'],
+            measurement_unit=group['measurement_unit']
+        ).exclude(pk=group['keep_id']).values_list('pk', flat=True)
+        for duplicate_id in list(duplicate_ids):
+            merge_references(
+                RecipeIngredient, 'recipe_id',
+                duplicate_id, group['keep_id'], 'amount'
+            )
+            merge_references(
+                ShoppingListItem, 'user_id',
+                duplicate_id, group['keep_id'], 'total_amount'
+            )
+            Ingredient.objects.filter(pk=duplicate_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingredients', '0001_initial'),
+        ('recipes', '0006_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
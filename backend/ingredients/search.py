@@ -0,0 +1,62 @@
+"""Нечёткий поиск ингредиентов с учётом опечаток.
+
+В PostgreSQL используется pg_trgm и GIN индекс по названию, в остальных
+базах — триграммный индекс справочника в памяти процесса.
+"""
+from django.conf import settings
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connection
+from django.db.models.functions import Length
+
+from .catalog import get_catalog
+from .models import Ingredient
+
+
+def _set_trigram_threshold():
+    """Порог оператора <% один раз на соединение с БД."""
+    connection.ensure_connection()
+    state = (connection.connection, settings.INGREDIENT_FUZZY_THRESHOLD)
+    if getattr(connection, 'trigram_threshold', None) == state:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SET pg_trgm.word_similarity_threshold = %s', [state[1]]
+        )
+    connection.trigram_threshold = state
+
+
+def _search_postgresql(query, limit):
+    """Похожие по триграммам, затем — начинающиеся с query.
+
+    Оба запроса обслуживает GIN индекс по названию; объединение условий
+    через OR с поиском подстроки индекс бы не использовало.
+    """
+    _set_trigram_threshold()
+    fields = ('id', 'name', 'measurement_unit')
+    found = list(
+        Ingredient.objects.filter(
+            name__trigram_word_similar=query
+        ).annotate(
+            score=TrigramWordSimilarity(query, 'name')
+        ).order_by(
+            '-score', Length('name'), 'name'
+        ).values(*fields)[:limit]
+    )
+    if len(found) < limit:
+        found += Ingredient.objects.filter(
+            name__istartswith=query
+        ).exclude(
+            pk__in=[item['id'] for item in found]
+        ).order_by(
+            Length('name'), 'name'
+        ).values(*fields)[:limit - len(found)]
+    return found
+
+
+def fuzzy_search(query, limit):
+    """До limit ингредиентов, наиболее похожих на query."""
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(query, limit)
+    return get_catalog().trigram_index.search(
+        query, limit, settings.INGREDIENT_FUZZY_THRESHOLD
+    )
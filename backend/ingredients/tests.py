@@ -0,0 +1,381 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from foodgram.cache import bump_version
+from ingredients.caching import INGREDIENTS_NAMESPACE
+from ingredients.catalog import (
+    expire_catalog,
+    find_missing_ingredients,
+    get_catalog,
+    get_ingredient_info,
+    reload_catalog,
+)
+from ingredients.ingestion import iter_json_records
+from ingredients.models import Ingredient
+from ingredients.trigrams import trigrams
+
+
+class TrigramsTest(TestCase):
+    """Разбиение на триграммы совпадает с pg_trgm."""
+
+    def test_word_padding(self):
+        self.assertEqual(
+            trigrams('Сыр'),
+            {'  с', ' сы', 'сыр', 'ыр '}
+        )
+
+    def test_words_are_split(self):
+        self.assertEqual(trigrams('а, б'), {'  а', ' а ', '  б', ' б '})
+
+
+@override_settings(INGREDIENT_CATALOG_CHECK_INTERVAL=60)
+class IngredientCatalogTest(TestCase):
+    """Справочник в памяти: поиск без запросов и сверка версии."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.salt, cls.sugar, cls.milk = Ingredient.objects.bulk_create([
+            Ingredient(name='Соль', measurement_unit='г'),
+            Ingredient(name='сахар', measurement_unit='г'),
+            Ingredient(name='молоко', measurement_unit='мл'),
+        ])
+
+    def setUp(self):
+        cache.clear()
+        reload_catalog()
+
+    def test_lookups_do_not_query_database(self):
+        with self.assertNumQueries(0):
+            catalog = get_catalog()
+            self.assertEqual(
+                [item['name'] for item in catalog.search('С')],
+                ['сахар', 'Соль']
+            )
+            self.assertEqual(catalog.search('соль')[0], {
+                'id': self.salt.pk, 'name': 'Соль', 'measurement_unit': 'г'
+            })
+            self.assertEqual(catalog.search('х'), [])
+            self.assertEqual(len(catalog.search('')), 3)
+            self.assertEqual(
+                get_ingredient_info([self.milk.pk]),
+                {self.milk.pk: ('молоко', 'мл')}
+            )
+            self.assertEqual(find_missing_ingredients([self.salt.pk]), set())
+
+        response = self.client.get('/api/ingredients/', {'name': 'мол'})
+        self.assertEqual(
+            [item['id'] for item in response.json()], [self.milk.pk]
+        )
+
+    def test_version_change_reloads_snapshot(self):
+        catalog = get_catalog()
+        Ingredient.objects.filter(pk=self.salt.pk).update(name='Соль морская')
+        # Версию увеличил другой процесс: до проверки снимок прежний
+        bump_version(INGREDIENTS_NAMESPACE)
+        self.assertIs(get_catalog(), catalog)
+
+        expire_catalog()
+        fresh = get_catalog()
+        self.assertIsNot(fresh, catalog)
+        self.assertEqual(fresh.by_id[self.salt.pk][0], 'Соль морская')
+        # Без изменения версии снимок не перечитывается
+        expire_catalog()
+        self.assertIs(get_catalog(), fresh)
+
+    def test_signals_expire_snapshot(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            pepper = Ingredient.objects.create(
+                name='перец', measurement_unit='г'
+            )
+        self.assertIn(pepper.pk, get_catalog().ids)
+
+    def test_unknown_ids_reload_once(self):
+        # bulk_create не отправляет сигналы и не меняет версию
+        pepper, = Ingredient.objects.bulk_create([
+            Ingredient(name='перец', measurement_unit='г')
+        ])
+        self.assertEqual(
+            get_ingredient_info([pepper.pk]), {pepper.pk: ('перец', 'г')}
+        )
+        self.assertEqual(find_missing_ingredients([pepper.pk, 0]), {0})
+        with self.assertNumQueries(1):
+            self.assertEqual(find_missing_ingredients([0]), {0})
+
+
+class IngredientSearchTest(TestCase):
+    """Поиск ингредиентов: по началу названия и с учётом опечаток."""
+
+    url = '/api/ingredients/'
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit=unit)
+            for name, unit in (
+                ('молоко', 'мл'),
+                ('кокосовое молоко', 'мл'),
+                ('мука пшеничная', 'г'),
+                ('сахар', 'г'),
+                ('сахарная пудра', 'г'),
+                ('соль', 'г'),
+            )
+        )
+
+    def setUp(self):
+        # bulk_create не меняет версию справочника
+        reload_catalog()
+
+    def names(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [item['name'] for item in response.json()]
+
+    def test_prefix_search_is_case_insensitive(self):
+        self.assertEqual(self.names(name='Сах'), ['сахар', 'сахарная пудра'])
+
+    def test_prefix_search_with_limit(self):
+        self.assertEqual(self.names(name='са', limit=1), ['сахар'])
+
+    def test_fuzzy_search_tolerates_typos(self):
+        self.assertEqual(self.names(name='малоко', mode='fuzzy')[0], 'молоко')
+        self.assertEqual(self.names(name='сахр', mode='fuzzy')[0], 'сахар')
+
+    def test_fuzzy_search_matches_inside_name(self):
+        self.assertIn(
+            'кокосовое молоко',
+            self.names(name='молоко', mode='fuzzy')
+        )
+        self.assertEqual(
+            self.names(name='пшенич', mode='fuzzy'),
+            ['мука пшеничная']
+        )
+
+    def test_fuzzy_search_limit(self):
+        self.assertEqual(
+            len(self.names(name='молоко', mode='fuzzy', limit=1)), 1
+        )
+
+    def test_invalid_limit(self):
+        response = self.client.get(self.url, {'name': 'с', 'limit': 0})
+        self.assertEqual(response.status_code, 400)
+
+    def test_new_ingredient_is_found(self):
+        self.assertEqual(self.names(name='ванил', mode='fuzzy'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='ванилин', measurement_unit='г')
+        self.assertEqual(self.names(name='ванил', mode='fuzzy'), ['ванилин'])
+
+
+class MergeDuplicateIngredientsMigrationTest(TransactionTestCase):
+    """Миграция 0002 объединяет дубликаты перед уникальным ограничением."""
+
+    before = [
+        ('ingredients', '0001_initial'),
+        ('recipes', '0006_shoppinglistitem'),
+        ('users', '0005_alter_user_avatar'),
+    ]
+    after = [
+        ('ingredients', '0002_merge_duplicate_ingredients'),
+        ('recipes', '0006_shoppinglistitem'),
+        ('users', '0005_alter_user_avatar'),
+    ]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        executor.loader.build_graph()
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_references_are_merged(self):
+        apps = self.migrate(self.before)
+        Ingredient = apps.get_model('ingredients', 'Ingredient')
+        Recipe = apps.get_model('recipes', 'Recipe')
+        RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+        ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+        User = apps.get_model('users', 'User')
+
+        user = User.objects.create(username='cook', email='cook@example.com')
+        salt, salt_copy, sugar = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'соль', 'сахар')
+        )
+        soup, bread = (
+            Recipe.objects.create(
+                author=user, name=name, text='Описание', cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+            for name in ('Суп', 'Хлеб')
+        )
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=soup, ingredient=salt, amount=5),
+            RecipeIngredient(recipe=soup, ingredient=salt_copy, amount=3),
+            RecipeIngredient(recipe=bread, ingredient=salt_copy, amount=10),
+            RecipeIngredient(recipe=bread, ingredient=sugar, amount=20),
+        ])
+        ShoppingListItem.objects.bulk_create([
+            ShoppingListItem(user=user, ingredient=salt, total_amount=5),
+            ShoppingListItem(user=user, ingredient=salt_copy, total_amount=13),
+        ])
+
+        apps = self.migrate(self.after)
+        Ingredient = apps.get_model('ingredients', 'Ingredient')
+        RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+        ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list('pk', flat=True)),
+            [salt.pk, sugar.pk]
+        )
+        self.assertEqual(
+            set(RecipeIngredient.objects.values_list(
+                'recipe_id', 'ingredient_id', 'amount'
+            )),
+            {
+                (soup.pk, salt.pk, 8),
+                (bread.pk, salt.pk, 10),
+                (bread.pk, sugar.pk, 20),
+            }
+        )
+        self.assertEqual(
+            list(ShoppingListItem.objects.values_list(
+                'ingredient_id', 'total_amount'
+            )),
+            [(salt.pk, 18)]
+        )
+
+
+class LoadIngredientsTest(TestCase):
+    """Загрузка справочника: пачки, COPY и пробный запуск."""
+
+    CSV = (
+        'Соль,г\n'
+        'соль ,гр.\n'
+        'Соль,  Г \n'
+        'Молоко,мл\n'
+        'битая строка\n'
+        'Сахар,\n'
+        'Мука,кг\n'
+        'Мука,г\n'
+    )
+    ROWS = {
+        ('Соль', 'г'),
+        ('соль', 'г'),
+        ('Молоко', 'мл'),
+        ('Мука', 'кг'),
+        ('Мука', 'г'),
+    }
+
+    def write_file(self, content, suffix='.csv'):
+        file = tempfile.NamedTemporaryFile(
+            'w', suffix=suffix, encoding='utf-8', delete=False
+        )
+        self.addCleanup(os.unlink, file.name)
+        with file:
+            file.write(content)
+        return file.name
+
+    def load(self, path, **options):
+        out = io.StringIO()
+        call_command(
+            'load_ingredients', file=path, batch_size=3, stdout=out,
+            **options
+        )
+        return out.getvalue()
+
+    def stored(self):
+        return set(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
+
+    def test_bulk_mode(self):
+        path = self.write_file(self.CSV)
+        output = self.load(path)
+        self.assertEqual(self.stored(), self.ROWS)
+        self.assertIn('Записей в файле: 8', output)
+        self.assertIn('Создано: 5', output)
+        self.assertIn('Ошибок: 2', output)
+        self.assertIn('Пачка 3', output)
+
+        # Повторная загрузка того же файла ничего не пишет
+        with CaptureQueriesContext(connection) as context:
+            output = self.load(path)
+        self.assertIn('Создано: 0', output)
+        self.assertFalse([
+            query for query in context.captured_queries
+            if not query['sql'].startswith('SELECT')
+        ])
+
+    def test_json_file(self):
+        items = [
+            {'name': 'Соль', 'measurement_unit': 'г'},
+            {'name': 'Молоко', 'measurement_unit': 'миллилитров'},
+            ['не', 'объект'],
+        ]
+        output = self.load(
+            self.write_file(json.dumps(items), suffix='.json'),
+            format='json'
+        )
+        self.assertEqual(self.stored(), {('Соль', 'г'), ('Молоко', 'мл')})
+        self.assertIn('Ошибок: 1', output)
+
+    def test_json_is_read_in_chunks(self):
+        items = [
+            {'name': f'Ингредиент {number}', 'measurement_unit': 'г'}
+            for number in range(20)
+        ]
+        records = iter_json_records(io.StringIO(json.dumps(items)), 7)
+        self.assertEqual(
+            [name for _, name, _ in records],
+            [item['name'] for item in items]
+        )
+
+    def test_dry_run_writes_nothing(self):
+        Ingredient.objects.create(name='Мука', measurement_unit='кг')
+        output = self.load(self.write_file(self.CSV), dry_run=True)
+        self.assertEqual(self.stored(), {('Мука', 'кг')})
+        self.assertIn('Будет создано: 4', output)
+        self.assertIn('  + Молоко, мл\n', output)
+        self.assertIn('  + Мука, г (новая единица измерения)', output)
+        self.assertNotIn('  + Мука, кг', output)
+
+    def test_dry_run_counts_repeats_across_batches_once(self):
+        path = self.write_file(self.CSV + 'Молоко,мл\nСоль,г\n')
+        output = self.load(path, dry_run=True)
+        self.assertIn('Будет создано: 5', output)
+        self.assertEqual(output.count('  + Молоко, мл'), 1)
+        self.assertIn('Создано: 5', self.load(path))
+
+    @unittest.skipUnless(
+        connection.vendor == 'postgresql', 'COPY есть только в PostgreSQL'
+    )
+    def test_copy_mode(self):
+        Ingredient.objects.create(name='Мука', measurement_unit='кг')
+        path = self.write_file(self.CSV)
+        output = self.load(path, mode='copy', dry_run=True)
+        self.assertIn('Будет создано: 4', output)
+        self.assertEqual(self.stored(), {('Мука', 'кг')})
+
+        output = self.load(path, mode='copy')
+        self.assertIn('Создано: 4', output)
+        self.assertEqual(self.stored(), self.ROWS)
+        self.assertIn('Создано: 0', self.load(path, mode='copy'))
+
+    @unittest.skipIf(
+        connection.vendor == 'postgresql', 'проверяется отказ без PostgreSQL'
+    )
+    def test_copy_mode_requires_postgresql(self):
+        output = self.load(self.write_file(self.CSV), mode='copy')
+        self.assertIn('Режим copy доступен только для PostgreSQL', output)
+        self.assertFalse(Ingredient.objects.exists())
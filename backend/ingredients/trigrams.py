@@ -0,0 +1,56 @@
+"""Триграммы в духе pg_trgm для нечёткого поиска без PostgreSQL."""
+import re
+from collections import Counter
+
+WORD = re.compile(r'\w+')
+
+
+def trigrams(text):
+    """Множество триграмм строки, как в pg_trgm.
+
+    Каждое слово дополняется двумя пробелами слева и одним справа.
+    """
+    result = set()
+    for word in WORD.findall(text.casefold()):
+        padded = f'  {word} '
+        result.update(
+            padded[index:index + 3] for index in range(len(padded) - 2)
+        )
+    return result
+
+
+class TrigramIndex:
+    """Инвертированный индекс триграмм по названиям ингредиентов.
+
+    Оценка совпадения — доля триграмм запроса, найденных в названии;
+    это приближение word_similarity из pg_trgm.
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.names = [item['name'].casefold() for item in items]
+        self.postings = {}
+        for position, name in enumerate(self.names):
+            for trigram in trigrams(name):
+                self.postings.setdefault(trigram, []).append(position)
+
+    def search(self, query, limit, threshold):
+        query_trigrams = trigrams(query)
+        if not query_trigrams:
+            return []
+        needle = query.casefold().strip()
+        hits = Counter()
+        for trigram in query_trigrams:
+            hits.update(self.postings.get(trigram, ()))
+        scored = []
+        for position, count in hits.items():
+            score = count / len(query_trigrams)
+            if score >= threshold or needle in self.names[position]:
+                scored.append((
+                    -score,
+                    len(self.names[position]),
+                    self.names[position],
+                    position
+                ))
+        scored.sort()
+        return [self.items[position] for *_, position in scored[:limit]]
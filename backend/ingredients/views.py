@@ -1,10 +1,15 @@
-from rest_framework import viewsets
+from django.conf import settings
+from rest_framework import serializers, viewsets
 from rest_framework.permissions import AllowAny
-from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.response import Response
+from django.utils.http import urlencode
 
+from foodgram.conditional import conditional_response, make_etag
+
+from .catalog import get_catalog
 from .models import Ingredient
+from .search import fuzzy_search
 from .serializers import IngredientSerializer
-from .filters import IngredientFilter
 
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
@@ -12,6 +17,45 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [AllowAny]
-    filter_backends = [DjangoFilterBackend]
-    filterset_class = IngredientFilter
     pagination_class = None  # Список ингредиентов возвращается без пагинации
+    max_limit = 100
+
+    def get_limit(self, default):
+        limit = self.request.query_params.get('limit')
+        if limit is None:
+            return default
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= self.max_limit:
+            raise serializers.ValidationError({
+                'limit': [f'Введите число от 1 до {self.max_limit}.']
+            })
+        return limit
+
+    def search(self, catalog):
+        name = self.request.query_params.get('name', '')
+        if self.request.query_params.get('mode') == 'fuzzy' and name:
+            return fuzzy_search(
+                name, self.get_limit(settings.INGREDIENT_FUZZY_LIMIT)
+            )
+        return catalog.search(name)[:self.get_limit(None)]
+
+    def list(self, request, *args, **kwargs):
+        """Список ингредиентов из справочника в памяти.
+
+        Параметр name отбирает ингредиенты, название которых начинается
+        с указанной строки (без учёта регистра); с mode=fuzzy ищутся
+        похожие названия с учётом опечаток. limit ограничивает ответ.
+        """
+        catalog = get_catalog()
+        etag = make_etag(
+            catalog.version,
+            urlencode(sorted(request.query_params.lists()), doseq=True),
+        )
+        return conditional_response(
+            request,
+            lambda: Response(self.search(catalog)),
+            etag
+        )
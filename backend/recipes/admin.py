@@ -1,13 +1,21 @@
+from collections import defaultdict
+
 from django.contrib import admin
+
+from foodgram.counters import related_count
+from users.admin_filters import AutocompleteFilter, AutocompleteFilterMixin
 from .models import Recipe, RecipeIngredient, ShoppingCart, Favorite
+from .pantry import record_changes as record_pantry_changes
+from .shopping_list import update_recipe_in_shopping_lists
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(AutocompleteFilterMixin, admin.ModelAdmin):
     list_display = ('id', 'name', 'author', 'cooking_time', 'created', 'favorites_count', 'shopping_cart_count', 'ingredients_count')
     search_fields = ('name', 'author__username', 'author__email')
-    list_filter = ('created', 'cooking_time', 'author')
+    list_filter = ('created', 'cooking_time', ('author', AutocompleteFilter))
     readonly_fields = ('created',)
+    autocomplete_fields = ('author',)
     filter_horizontal = ()
     
     fieldsets = (
@@ -19,28 +27,102 @@ class RecipeAdmin(admin.ModelAdmin):
         }),
     )
     
-    def favorites_count(self, obj):
-        return obj.favorites.count()
-    favorites_count.short_description = 'Кол-во в избранном'
-    
-    def shopping_cart_count(self, obj):
-        return obj.shopping_cart.count()
-    shopping_cart_count.short_description = 'Кол-во в корзине'
-    
+    def get_queryset(self, request):
+        # Подзапрос считается только для строк текущей страницы
+        return super().get_queryset(request).annotate(
+            ingredients_count=related_count(RecipeIngredient, 'recipe')
+        )
+
     def ingredients_count(self, obj):
-        return obj.recipe_ingredients.count()
+        return obj.ingredients_count
     ingredients_count.short_description = 'Кол-во ингредиентов'
+    ingredients_count.admin_order_field = 'ingredients_count'
 
 
 @admin.register(RecipeIngredient)
-class RecipeIngredientAdmin(admin.ModelAdmin):
+class RecipeIngredientAdmin(AutocompleteFilterMixin, admin.ModelAdmin):
     list_display = ('id', 'recipe', 'ingredient', 'amount')
     search_fields = ('recipe__name', 'ingredient__name')
-    list_filter = ('recipe', 'ingredient')
+    list_filter = (
+        ('recipe', AutocompleteFilter),
+        ('ingredient', AutocompleteFilter),
+    )
     autocomplete_fields = ('recipe', 'ingredient')
 
+    def touch_recipes(self, recipe_ids):
+        """Сохраняет рецепты, чтобы обновить их дату изменения и кэш."""
+        for recipe in Recipe.objects.filter(pk__in=set(recipe_ids)):
+            recipe.save(update_fields=['updated'])
 
-admin.site.register(Favorite)
+    def update_shopping_lists(self, changes):
+        """Переносит изменения количеств в списки покупок.
 
+        changes — тройки (recipe_id, ingredient_id, разница количества).
+        """
+        deltas = defaultdict(lambda: defaultdict(int))
+        for recipe_id, ingredient_id, amount in changes:
+            deltas[recipe_id][ingredient_id] += amount
+        for recipe_id, recipe_deltas in deltas.items():
+            update_recipe_in_shopping_lists(recipe_id, {}, recipe_deltas)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        changes = [(obj.recipe_id, obj.ingredient_id, obj.amount)]
+        if change:
+            changes.append((
+                form.initial['recipe'],
+                form.initial['ingredient'],
+                -form.initial['amount'],
+            ))
+        self.update_shopping_lists(changes)
+        recipe_ids = [obj.recipe_id]
+        if change and 'recipe' in form.changed_data:
+            recipe_ids.append(form.initial['recipe'])
+        self.touch_recipes(recipe_ids)
+        removed = []
+        if change and {'recipe', 'ingredient'} & set(form.changed_data):
+            removed.append(
+                (form.initial['recipe'], form.initial['ingredient'])
+            )
+        record_pantry_changes([obj.recipe_id], removed)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.update_shopping_lists(
+            [(obj.recipe_id, obj.ingredient_id, -obj.amount)]
+        )
+        self.touch_recipes([obj.recipe_id])
+        record_pantry_changes(removed=[(obj.recipe_id, obj.ingredient_id)])
+
+    def delete_queryset(self, request, queryset):
+        rows = list(
+            queryset.values_list('recipe_id', 'ingredient_id', 'amount')
+        )
+        super().delete_queryset(request, queryset)
+        self.update_shopping_lists(
+            (recipe_id, ingredient_id, -amount)
+            for recipe_id, ingredient_id, amount in rows
+        )
+        removed = [
+            (recipe_id, ingredient_id) for recipe_id, ingredient_id, _ in rows
+        ]
+        self.touch_recipes(recipe_id for recipe_id, _ in removed)
+        record_pantry_changes(removed=removed)
+
+
+@admin.register(Favorite, ShoppingCart)
+class UserRecipeAdmin(AutocompleteFilterMixin, admin.ModelAdmin):
+    list_display = ('id', 'user', 'recipe', 'created')
+    search_fields = ('user__username', 'recipe__name')
+    list_filter = (
+        ('user', AutocompleteFilter),
+        ('recipe', AutocompleteFilter),
+    )
+    autocomplete_fields = ('user', 'recipe')
 
-admin.site.register(ShoppingCart)
+    def get_readonly_fields(self, request, obj=None):
+        # Счётчики и список покупок учитывают только создание и удаление
+        # записи, поэтому пару пользователь — рецепт менять нельзя
+        if obj is not None:
+            return ('user', 'recipe')
+        return ()
@@ -0,0 +1,160 @@
+"""Кэширование ответов и фрагментов API рецептов.
+
+Ключи ответов содержат версию пространства имён 'recipes', ключи
+фрагментов — версии рецепта, его автора и справочника ингредиентов.
+Версии увеличиваются сигналами после фиксации транзакции.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
+from django.utils.http import urlencode
+from rest_framework.response import Response
+
+from foodgram.cache import bump_version_on_commit, get_version, get_versions
+from foodgram.media import get_media_resolver
+from ingredients.caching import (
+    INGREDIENTS_NAMESPACE,
+    invalidate_ingredients_catalog,
+)
+
+RECIPES_NAMESPACE = 'recipes'
+STATS_KEYS = {
+    'hits': 'recipes:response:hits',
+    'misses': 'recipes:response:misses',
+}
+
+
+def _recipe_namespace(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def _author_namespace(user_id):
+    return f'author:{user_id}'
+
+
+def invalidate_recipes():
+    """Делает устаревшими все закэшированные ответы с рецептами."""
+    bump_version_on_commit(RECIPES_NAMESPACE)
+
+
+def invalidate_recipe(recipe_id):
+    """Сбрасывает фрагмент рецепта и ответы с рецептами."""
+    bump_version_on_commit(_recipe_namespace(recipe_id))
+    invalidate_recipes()
+
+
+def invalidate_author(user_id):
+    """Сбрасывает фрагменты рецептов автора и ответы с рецептами."""
+    bump_version_on_commit(_author_namespace(user_id))
+    invalidate_recipes()
+
+
+def invalidate_ingredients():
+    """Сбрасывает все фрагменты рецептов после изменения справочника."""
+    invalidate_ingredients_catalog()
+    invalidate_recipes()
+
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_cache_stats():
+    """Возвращает количество попаданий и промахов кэша ответов."""
+    values = cache.get_many(STATS_KEYS.values())
+    return {
+        name: values.get(key, 0)
+        for name, key in STATS_KEYS.items()
+    }
+
+
+def reset_cache_stats():
+    cache.delete_many(STATS_KEYS.values())
+
+
+def get_response_cache_key(request, action, pk=None):
+    """Ключ ответа: действие, объект, хост и все параметры запроса.
+
+    В ключ входит и адрес медиафайлов: от него зависят URL изображений.
+    """
+    params = urlencode(sorted(request.query_params.lists()), doseq=True)
+    origin = get_media_resolver(request).origin
+    raw = f'{action}:{pk}:{request.get_host()}:{origin}:{params}'
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    version = get_version(RECIPES_NAMESPACE)
+    return f'recipes:response:{version}:{digest}'
+
+
+def cached_anonymous_response(key, build_response):
+    """Отдаёт анонимному пользователю закэшированные данные ответа.
+
+    build_response вызывается только при промахе; кэшируются лишь
+    успешные ответы. Заголовок X-Cache сообщает HIT или MISS.
+    """
+    data = cache.get(key)
+    if data is not None:
+        _incr(STATS_KEYS['hits'])
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    _incr(STATS_KEYS['misses'])
+    response = build_response()
+    if response.status_code == 200:
+        cache.set(
+            key,
+            response.data,
+            settings.RECIPE_RESPONSE_CACHE_TIMEOUT
+        )
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+def _get_fragment_keys(recipes, request):
+    namespaces = {INGREDIENTS_NAMESPACE}
+    for recipe in recipes:
+        namespaces.add(_recipe_namespace(recipe.pk))
+        namespaces.add(_author_namespace(recipe.author_id))
+    versions = get_versions(namespaces)
+    # Ссылки на изображения абсолютные, поэтому фрагмент зависит от
+    # адреса, с которого отдаются медиафайлы
+    origin = get_media_resolver(request).origin
+    return [
+        'recipes:fragment:{base}:{id}:{recipe}:{author}:{ingredients}'.format(
+            base=origin,
+            id=recipe.pk,
+            recipe=versions[_recipe_namespace(recipe.pk)],
+            author=versions[_author_namespace(recipe.author_id)],
+            ingredients=versions[INGREDIENTS_NAMESPACE],
+        )
+        for recipe in recipes
+    ]
+
+
+def get_recipe_fragments(recipes, request, build_fragment):
+    """Возвращает независимые от пользователя части рецептов.
+
+    Фрагменты читаются из кэша одним get_many; для промахов ингредиенты
+    подгружаются одним prefetch и фрагменты строятся build_fragment.
+    """
+    keys = _get_fragment_keys(recipes, request)
+    cached = cache.get_many(keys)
+    missing = [
+        (recipe, key) for recipe, key in zip(recipes, keys)
+        if key not in cached
+    ]
+    if missing:
+        prefetch_related_objects(
+            [recipe for recipe, _ in missing],
+            'recipe_ingredients__ingredient'
+        )
+        built = {key: build_fragment(recipe) for recipe, key in missing}
+        cache.set_many(built, settings.RECIPE_FRAGMENT_CACHE_TIMEOUT)
+        cached.update(built)
+    return [cached[key] for key in keys]
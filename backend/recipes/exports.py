@@ -0,0 +1,204 @@
+"""Выгрузка списка покупок в файлы TXT, CSV и PDF.
+
+Готовые файлы сохраняются в закрытом хранилище STORAGES['exports'] под
+именем, которое зависит только от содержимого списка, поэтому повторная
+выгрузка неизменённой корзины не требует повторного построения файла.
+Файлы отдаются только через API по подписанной ссылке с ограниченным
+сроком действия, выданной владельцу корзины. Файлы старше срока
+действия ссылки удаляет delete_expired_exports по расписанию.
+"""
+import csv
+import io
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+from PIL import Image, ImageDraw, ImageFont
+
+from .shopping_list import get_shopping_list_rows, render_shopping_list
+
+EXPORT_FORMATS = {
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'pdf': 'application/pdf',
+}
+
+DOWNLOAD_TOKEN_SALT = 'shopping_list_export_download'
+
+# Параметры страницы PDF: A4 при 100 точках на дюйм
+PDF_PAGE_SIZE = (827, 1169)
+PDF_MARGIN = 60
+PDF_FONT_SIZE = 18
+PDF_LINE_HEIGHT = 28
+
+
+def render_txt(rows):
+    return ''.join(render_shopping_list(rows)).encode()
+
+
+def render_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['Ингредиент', 'Единица измерения', 'Количество'])
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def _load_pdf_font():
+    try:
+        return ImageFont.truetype(
+            settings.SHOPPING_LIST_PDF_FONT,
+            PDF_FONT_SIZE
+        )
+    except OSError:
+        return ImageFont.load_default(PDF_FONT_SIZE)
+
+
+def render_pdf(rows):
+    """Рисует список постранично через Pillow и сохраняет как PDF."""
+    font = _load_pdf_font()
+    lines = ''.join(render_shopping_list(rows)).split('\n')
+    per_page = (PDF_PAGE_SIZE[1] - 2 * PDF_MARGIN) // PDF_LINE_HEIGHT
+    pages = []
+    for start in range(0, len(lines), per_page):
+        page = Image.new('RGB', PDF_PAGE_SIZE, 'white')
+        draw = ImageDraw.Draw(page)
+        for number, line in enumerate(lines[start:start + per_page]):
+            draw.text(
+                (PDF_MARGIN, PDF_MARGIN + number * PDF_LINE_HEIGHT),
+                line,
+                fill='black',
+                font=font
+            )
+        pages.append(page)
+    buffer = io.BytesIO()
+    pages[0].save(
+        buffer,
+        'PDF',
+        save_all=True,
+        append_images=pages[1:],
+        resolution=100
+    )
+    return buffer.getvalue()
+
+
+RENDERERS = {
+    'txt': render_txt,
+    'csv': render_csv,
+    'pdf': render_pdf,
+}
+
+
+def get_export_storage():
+    return storages['exports']
+
+
+def get_export_name(rows, file_format):
+    """Имя файла выгрузки по хешу содержимого списка покупок."""
+    payload = json.dumps(rows, ensure_ascii=False)
+    digest = salted_hmac('shopping_list_export', payload).hexdigest()
+    return f'{settings.SHOPPING_LIST_EXPORT_DIR}/{digest}.{file_format}'
+
+
+def touch_export(storage, name):
+    """Обновляет время изменения файла, выдаваемого по новой ссылке.
+
+    Иначе delete_expired_exports удалит старый файл раньше, чем истечёт
+    ссылка на него.
+    """
+    os.utime(storage.path(name))
+
+
+def get_cached_export(user, file_format):
+    """Имя готового файла для текущей корзины или None."""
+    name = get_export_name(get_shopping_list_rows(user), file_format)
+    storage = get_export_storage()
+    if not storage.exists(name):
+        return None
+    touch_export(storage, name)
+    return name
+
+
+def export_shopping_list(user_id, file_format):
+    """Строит файл выгрузки, если его ещё нет, и возвращает его имя."""
+    rows = get_shopping_list_rows(user_id)
+    name = get_export_name(rows, file_format)
+    storage = get_export_storage()
+    if storage.exists(name):
+        touch_export(storage, name)
+    else:
+        content = RENDERERS[file_format](rows)
+        name = storage.save(name, ContentFile(content))
+    return name
+
+
+def delete_expired_exports():
+    """Удаляет файлы выгрузок, ссылки на которые уже истекли.
+
+    Ссылка выдаётся не раньше последнего изменения файла, поэтому файл
+    старше SHOPPING_LIST_EXPORT_LINK_MAX_AGE больше никому не нужен.
+    Возвращает число удалённых файлов.
+    """
+    storage = get_export_storage()
+    directory = settings.SHOPPING_LIST_EXPORT_DIR
+    if not storage.exists(directory):
+        return 0
+    deadline = timezone.now() - timedelta(
+        seconds=settings.SHOPPING_LIST_EXPORT_LINK_MAX_AGE
+    )
+    deleted = 0
+    for filename in storage.listdir(directory)[1]:
+        name = f'{directory}/{filename}'
+        try:
+            expired = storage.get_modified_time(name) < deadline
+        except FileNotFoundError:
+            # Файл удалил другой процесс очистки
+            continue
+        if expired:
+            storage.delete(name)
+            deleted += 1
+    return deleted
+
+
+def get_export_format(name):
+    return name.rsplit('.', 1)[-1]
+
+
+def is_export_result(data):
+    """Результат задачи export_shopping_list_task."""
+    return isinstance(data, dict) and {'user_id', 'file', 'format'} <= set(
+        data
+    )
+
+
+def make_download_token(user_id, name):
+    """Подписанный токен ссылки на файл выгрузки пользователя."""
+    return signing.dumps(
+        {'user': user_id, 'file': name}, salt=DOWNLOAD_TOKEN_SALT
+    )
+
+
+def read_download_token(token, user_id):
+    """Имя файла по токену или None, если токен чужой, неверен или истёк."""
+    try:
+        data = signing.loads(
+            token,
+            salt=DOWNLOAD_TOKEN_SALT,
+            max_age=settings.SHOPPING_LIST_EXPORT_LINK_MAX_AGE
+        )
+    except signing.BadSignature:
+        return None
+    if not isinstance(data, dict) or data.get('user') != user_id:
+        return None
+    name = data.get('file')
+    if not isinstance(name, str) or get_export_format(name) not in (
+        EXPORT_FORMATS
+    ):
+        return None
+    return name
@@ -0,0 +1,188 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Пока подписок меньше FEED_FANOUT_MIN_SUBSCRIPTIONS, лента собирается при
+чтении: выборка по индексу (author, created) для нескольких авторов
+дешёвая. Для остальных лента хранится в FeedEntry: новый рецепт
+раскладывается по лентам подписчиков задачей Celery пачками, при
+подписке лента дополняется рецептами автора, при отписке — очищается
+от них. Такая лента читается одним диапазонным сканом индекса
+(user, created, recipe) без соединения с подписками.
+
+Из FeedEntry лента читается, только когда она построена целиком: флаг
+User.feed_materialized ставит backfill_feed. Пока задача не выполнена
+(или не была поставлена), лента по-прежнему собирается при чтении.
+"""
+import logging
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+
+from users.models import Subscription
+
+from .models import FeedEntry, Recipe
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+def is_materialized(subscriptions_count):
+    """Хранится ли лента пользователя с таким числом подписок."""
+    return subscriptions_count >= settings.FEED_FANOUT_MIN_SUBSCRIPTIONS
+
+
+def get_feed_queryset(user):
+    """Лента пользователя для пагинации по (-created, -recipe_id).
+
+    Возвращает записи FeedEntry или, для небольших лент, сами рецепты;
+    get_feed_recipes приводит страницу к списку рецептов.
+    """
+    if user.feed_materialized and is_materialized(user.subscriptions_count):
+        queryset = FeedEntry.objects.filter(user=user).select_related(
+            'recipe__author'
+        ).defer('recipe__search_vector')
+    else:
+        queryset = Recipe.objects.filter(
+            author__subscribers__user=user
+        ).select_related('author').defer('search_vector').annotate(
+            recipe_id=F('id')
+        )
+    return queryset.order_by('-created', '-recipe_id')
+
+
+def get_feed_recipes(page):
+    """Рецепты страницы ленты в порядке выдачи."""
+    return [
+        entry.recipe if isinstance(entry, FeedEntry) else entry
+        for entry in page
+    ]
+
+
+def _write_entries(user_ids, recipes):
+    """Добавляет рецепты (id, author_id, created) в ленты пользователей."""
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                author_id=author_id,
+                created=created,
+            )
+            for user_id in user_ids
+            for recipe_id, author_id, created in recipes
+        ],
+        batch_size=settings.FEED_FANOUT_CHUNK_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out_recipe(recipe_id):
+    """Раскладывает рецепт по хранимым лентам подписчиков автора.
+
+    Подписчики выбираются пачками по user_id, каждая пачка записывается
+    своей транзакцией. Возвращает число лент.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).values_list(
+        'id', 'author_id', 'created'
+    ).first()
+    if recipe is None:
+        return 0
+    threshold = settings.FEED_FANOUT_MIN_SUBSCRIPTIONS
+    subscribers = Subscription.objects.filter(
+        author_id=recipe[1], user__subscriptions_count__gte=threshold
+    ).order_by('user_id').values_list('user_id', flat=True)
+
+    written = 0
+    last_user_id = 0
+    while True:
+        user_ids = list(
+            subscribers.filter(user_id__gt=last_user_id)[
+                :settings.FEED_FANOUT_CHUNK_SIZE
+            ]
+        )
+        if not user_ids:
+            return written
+        _write_entries(user_ids, [recipe])
+        written += len(user_ids)
+        last_user_id = user_ids[-1]
+
+
+@transaction.atomic
+def backfill_feed(user_id, author_id=None):
+    """Добавляет в хранимую ленту рецепты автора или всех подписок.
+
+    Без author_id, а также если лента ещё не построена, она строится
+    заново и помечается построенной. Рецепты автора добавляются, только
+    если подписка на него ещё есть: задача могла выполниться после
+    отписки. Если лента пользователя не хранится, ничего не делает.
+    """
+    # Блокировка пользователя упорядочивает задачу с подпиской и
+    # отпиской: они меняют счётчик подписок в той же строке
+    user = User.objects.select_for_update().filter(pk=user_id).values_list(
+        'subscriptions_count', 'feed_materialized'
+    ).first()
+    if user is None or not is_materialized(user[0]):
+        return 0
+    subscriptions = Subscription.objects.filter(user_id=user_id)
+    if author_id is not None and user[1]:
+        if not subscriptions.filter(author_id=author_id).exists():
+            return 0
+        author_ids = [author_id]
+    else:
+        FeedEntry.objects.filter(user_id=user_id).delete()
+        author_ids = subscriptions.values('author_id')
+    recipes = Recipe.objects.filter(author_id__in=author_ids).values_list(
+        'id', 'author_id', 'created'
+    )
+
+    chunk_size = settings.FEED_FANOUT_CHUNK_SIZE
+    written = 0
+    chunk = []
+    for recipe in recipes.iterator(chunk_size=chunk_size):
+        chunk.append(recipe)
+        if len(chunk) == chunk_size:
+            _write_entries([user_id], chunk)
+            written += len(chunk)
+            chunk = []
+    _write_entries([user_id], chunk)
+    if not user[1]:
+        User.objects.filter(pk=user_id).update(feed_materialized=True)
+    return written + len(chunk)
+
+
+def mark_feed_stale(user_id):
+    """Лента снова собирается при чтении до следующего построения."""
+    User.objects.filter(pk=user_id).update(feed_materialized=False)
+
+
+def trim_feed(user_id, author_id=None):
+    """Удаляет из ленты рецепты автора (без author_id — всю ленту)."""
+    entries = FeedEntry.objects.filter(user_id=user_id)
+    if author_id is not None:
+        entries = entries.filter(author_id=author_id)
+    else:
+        mark_feed_stale(user_id)
+    entries.delete()
+
+
+def schedule_feed_task(task, *args, on_error=None):
+    """Ставит задачу ленты после фиксации транзакции.
+
+    Недоступный брокер не должен ломать публикацию рецепта или подписку;
+    ленту можно восстановить командой rebuild_feeds. on_error
+    вызывается, если задачу поставить не удалось.
+    """
+    def enqueue():
+        try:
+            task.delay(*args)
+        except Exception:
+            logger.warning(
+                'Не удалось поставить задачу %s%r',
+                task.name, args, exc_info=True
+            )
+            if on_error is not None:
+                on_error()
+
+    transaction.on_commit(enqueue)
@@ -1,5 +1,7 @@
+from django.db.models import F
 from django_filters import rest_framework as filters
 from .models import Recipe, ShoppingCart, Favorite
+from .search import search_recipes
 
 
 class RecipeFilter(filters.FilterSet):
@@ -17,10 +19,40 @@ class RecipeFilter(filters.FilterSet):
         method='filter_is_in_shopping_cart',
         help_text='Фильтр по корзине (0 или 1)'
     )
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'Популярные'),),
+        method='filter_ordering',
+        help_text='Сортировка: popular — по рейтингу популярности'
+    )
+    search = filters.CharFilter(
+        method='filter_search',
+        help_text='Полнотекстовый поиск по названию, ингредиентам и описанию'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('author', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author', 'is_favorited', 'is_in_shopping_cart', 'ordering',
+            'search',
+        )
+
+    def filter_ordering(self, queryset, name, value):
+        """Сортировка по заранее посчитанной оценке популярности.
+
+        Поиск объявлен после и сортирует результаты по релевантности.
+        """
+        if value != 'popular':
+            return queryset
+        return queryset.filter(ranking__isnull=False).annotate(
+            popular_score=F('ranking__popular_score')
+        ).order_by('-popular_score', '-id')
+
+    def filter_search(self, queryset, name, value):
+        """Поиск рецептов; результаты упорядочены по релевантности."""
+        value = value.strip()
+        if not value:
+            return queryset
+        return search_recipes(queryset, value).order_by('-search_rank', '-id')
 
     def filter_is_favorited(self, queryset, name, value):
         """Фильтрация по избранному."""
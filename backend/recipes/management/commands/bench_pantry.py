@@ -0,0 +1,279 @@
+"""
+Management команда для замера поиска рецептов по продуктам.
+
+Создаёт синтетические рецепты внутри транзакции, которая откатывается
+в конце, поэтому данные в базе не остаются. Популярность ингредиентов
+распределена по закону Ципфа: как соль и лук, несколько ингредиентов
+встречаются в большой доле рецептов, и их списки в индексе длинные.
+"""
+import itertools
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from ingredients.models import Ingredient
+from recipes.models import Recipe, RecipeIngredient
+from recipes.pantry import (
+    apply_changes,
+    find_recipes,
+    rebuild_index,
+    record_changes,
+)
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Замеряет поиск рецептов по продуктам на синтетических данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=1_000_000,
+            help='Количество синтетических рецептов'
+        )
+        parser.add_argument(
+            '--ingredients',
+            type=int,
+            default=8,
+            help='Среднее количество ингредиентов в рецепте'
+        )
+        parser.add_argument(
+            '--pantry',
+            type=int,
+            default=10,
+            help='Количество продуктов в запросе'
+        )
+        parser.add_argument(
+            '--missing',
+            type=int,
+            default=2,
+            help='Сколько ингредиентов может не хватать'
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=200,
+            help='Количество запросов'
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=6,
+            help='Размер страницы выдачи'
+        )
+        parser.add_argument(
+            '--updates',
+            type=int,
+            default=1000,
+            help='Сколько рецептов изменить для замера обновления индекса'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10_000,
+            help='Количество рецептов в одной пачке вставки'
+        )
+        parser.add_argument(
+            '--baseline',
+            action='store_true',
+            help='Дополнительно замерить запрос с JOIN и GROUP BY'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=1,
+            help='Зерно генератора случайных чисел'
+        )
+
+    def handle(self, *args, **options):
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if len(ingredient_ids) < options['pantry'] + options['ingredients']:
+            self.stdout.write(
+                self.style.ERROR(
+                    'Недостаточно ингредиентов в базе, '
+                    'сначала выполните load_ingredients.'
+                )
+            )
+            return
+
+        rng = random.Random(options['seed'])
+        rng.shuffle(ingredient_ids)
+        cum_weights = list(itertools.accumulate(
+            1 / rank for rank in range(1, len(ingredient_ids) + 1)
+        ))
+
+        def sample(count):
+            chosen = set()
+            while len(chosen) < count:
+                chosen.update(rng.choices(
+                    ingredient_ids, cum_weights=cum_weights,
+                    k=count - len(chosen)
+                ))
+            return chosen
+
+        try:
+            with transaction.atomic():
+                self.generate(rng, sample, options)
+                self.benchmark(rng, sample, options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def generate(self, rng, sample, options):
+        author = User.objects.create(
+            username='bench_pantry',
+            email='bench_pantry@example.com',
+        )
+        total = options['recipes']
+        batch_size = options['batch_size']
+        average = options['ingredients']
+        started = time.perf_counter()
+        self.recipe_ids = []
+        for start in range(0, total, batch_size):
+            size = min(batch_size, total - start)
+            recipes = Recipe.objects.bulk_create(
+                Recipe(
+                    author=author,
+                    name=f'Рецепт {start + index}',
+                    text='Описание',
+                    cooking_time=rng.randint(5, 180),
+                    image='recipes/images/bench.png',
+                )
+                for index in range(size)
+            )
+            self.recipe_ids.extend(recipe.pk for recipe in recipes)
+            RecipeIngredient.objects.bulk_create(
+                (
+                    RecipeIngredient(
+                        recipe=recipe,
+                        ingredient_id=ingredient_id,
+                        amount=rng.randint(1, 500),
+                    )
+                    for recipe in recipes
+                    for ingredient_id in sample(
+                        rng.randint(max(1, average - 4), average + 4)
+                    )
+                ),
+                batch_size=batch_size,
+            )
+            self.stdout.write(
+                f'Создано рецептов: {start + size} '
+                f'({time.perf_counter() - started:.0f} с)'
+            )
+
+    def benchmark(self, rng, sample, options):
+        elapsed, (recipes, postings, size) = self.timed(rebuild_index)
+        pairs = RecipeIngredient.objects.count()
+        self.stdout.write(
+            f'\nИндекс собран за {elapsed / 1000:.1f} с: рецептов {recipes}, '
+            f'списков {postings}, {size / 2 ** 20:.1f} МБ '
+            f'(без сжатия {pairs * 4 / 2 ** 20:.1f} МБ)'
+        )
+
+        queries = [
+            sample(options['pantry']) for _ in range(options['queries'])
+        ]
+        page_size = options['page_size']
+        missing = options['missing']
+
+        def search(pantry):
+            ids, _, _ = find_recipes(pantry, missing)
+            page = Recipe.objects.only('id', 'name').in_bulk(
+                ids[:page_size].tolist()
+            )
+            return len(ids), page
+
+        timings, found = [], []
+        for pantry in queries:
+            elapsed, (count, _) = self.timed(lambda: search(pantry))
+            timings.append(elapsed)
+            found.append(count)
+        self.stdout.write(
+            f'\nЗапросов: {len(queries)}, продуктов в запросе: '
+            f'{options["pantry"]}, не хватает не более {missing}, '
+            f'найдено в среднем {statistics.mean(found):.0f}'
+        )
+        self.report('индекс, первая страница', timings)
+
+        # Каждый изменённый рецепт теряет один ингредиент и получает
+        # другой, как при редактировании через API
+        recipe_ids = rng.sample(
+            self.recipe_ids, min(options['updates'], len(self.recipe_ids))
+        )
+        removed = {
+            recipe_id: (pk, ingredient_id)
+            for pk, recipe_id, ingredient_id in
+            RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values_list('pk', 'recipe_id', 'ingredient_id')
+        }
+        RecipeIngredient.objects.filter(
+            pk__in=[pk for pk, _ in removed.values()]
+        ).delete()
+        RecipeIngredient.objects.bulk_create(
+            (
+                RecipeIngredient(
+                    recipe_id=recipe_id, ingredient_id=ingredient_id, amount=1
+                )
+                for recipe_id in recipe_ids
+                for ingredient_id in sample(1)
+            ),
+            ignore_conflicts=True,
+        )
+        record_changes(recipe_ids, [
+            (recipe_id, ingredient_id)
+            for recipe_id, (_, ingredient_id) in removed.items()
+        ])
+        elapsed, applied = self.timed(apply_changes)
+        self.stdout.write(
+            f'Перенос в индекс изменений {applied} рецептов: {elapsed:.0f} мс'
+        )
+
+        if options['baseline']:
+            baseline = []
+            for pantry in queries[:20]:
+                in_pantry = Q(recipe_ingredients__ingredient_id__in=pantry)
+                elapsed, _ = self.timed(
+                    lambda: list(
+                        Recipe.objects.annotate(
+                            matched=Count(
+                                'recipe_ingredients', filter=in_pantry
+                            ),
+                            total=Count('recipe_ingredients'),
+                        ).filter(
+                            matched__gt=0,
+                            total__lte=F('matched') + missing
+                        ).order_by(
+                            F('total') - F('matched'), '-matched', '-id'
+                        ).values_list('id', flat=True)[:page_size]
+                    )
+                )
+                baseline.append(elapsed)
+            self.report('JOIN + GROUP BY, первая страница', baseline)
+
+    def timed(self, func):
+        start = time.perf_counter()
+        result = func()
+        return (time.perf_counter() - start) * 1000, result
+
+    def report(self, title, timings):
+        if not timings:
+            self.stdout.write(f'{title}: нет данных')
+            return
+        timings = sorted(timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f'{title}: медиана {statistics.median(timings):.1f} мс, '
+            f'p95 {p95:.1f} мс, максимум {timings[-1]:.1f} мс'
+        )
@@ -0,0 +1,232 @@
+"""
+Management команда для замера полнотекстового поиска рецептов.
+
+Создаёт синтетические рецепты внутри транзакции, которая откатывается
+в конце, поэтому данные в базе не остаются. Полноценный замер имеет
+смысл на PostgreSQL: в других базах поиск идёт перебором строк.
+"""
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from ingredients.models import Ingredient
+from recipes.models import Recipe, RecipeIngredient
+from recipes.search import is_supported, search_recipes, update_search_vectors
+from users.pagination import KeysetPagination
+
+User = get_user_model()
+
+COOKING_WORDS = (
+    'запечь', 'обжарить', 'отварить', 'тушить', 'нарезать', 'смешать',
+    'духовка', 'сковорода', 'кастрюля', 'соус', 'суп', 'салат', 'пирог',
+    'рагу', 'каша', 'десерт', 'быстро', 'сытно', 'праздничный', 'домашний',
+    'острый', 'сладкий', 'хрустящий', 'нежный', 'ароматный', 'летний',
+)
+SEARCH_ORDERING = ('-search_rank', '-id')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Замеряет поиск рецептов по синтетическому набору данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=1_000_000,
+            help='Количество синтетических рецептов'
+        )
+        parser.add_argument(
+            '--ingredients',
+            type=int,
+            default=3,
+            help='Количество ингредиентов в каждом рецепте'
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=200,
+            help='Количество поисковых запросов'
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=6,
+            help='Размер страницы выдачи'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10_000,
+            help='Количество рецептов в одной пачке вставки'
+        )
+        parser.add_argument(
+            '--baseline',
+            action='store_true',
+            help='Дополнительно замерить поиск по вхождению подстроки'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=1,
+            help='Зерно генератора случайных чисел'
+        )
+
+    def handle(self, *args, **options):
+        ingredients = list(Ingredient.objects.values_list('id', 'name'))
+        if len(ingredients) < options['ingredients']:
+            self.stdout.write(
+                self.style.ERROR(
+                    'Недостаточно ингредиентов в базе, '
+                    'сначала выполните load_ingredients.'
+                )
+            )
+            return
+        if not is_supported():
+            self.stdout.write(
+                self.style.WARNING(
+                    'Хранимый tsvector есть только в PostgreSQL, '
+                    'замеряется запасной поиск по подстроке.'
+                )
+            )
+
+        rng = random.Random(options['seed'])
+        vocabulary = sorted({
+            word
+            for _, name in ingredients
+            for word in name.split()
+            if len(word) > 3 and word.isalpha()
+        } | set(COOKING_WORDS))
+
+        try:
+            with transaction.atomic():
+                self.generate(rng, vocabulary, ingredients, options)
+                self.benchmark(rng, vocabulary, options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def generate(self, rng, vocabulary, ingredients, options):
+        author = User.objects.create(
+            username='bench_recipe_search',
+            email='bench_recipe_search@example.com',
+        )
+        total = options['recipes']
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+        for start in range(0, total, batch_size):
+            size = min(batch_size, total - start)
+            recipes = Recipe.objects.bulk_create(
+                Recipe(
+                    author=author,
+                    name=' '.join(rng.sample(vocabulary, 3)),
+                    text=' '.join(rng.choices(vocabulary, k=40)),
+                    cooking_time=rng.randint(5, 180),
+                    image='recipes/images/bench.png',
+                )
+                for _ in range(size)
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient_id=ingredient_id,
+                    amount=rng.randint(1, 500),
+                )
+                for recipe in recipes
+                for ingredient_id, _ in rng.sample(
+                    ingredients, options['ingredients']
+                )
+            )
+            update_search_vectors([recipe.pk for recipe in recipes])
+            self.stdout.write(
+                f'Создано рецептов: {start + size} '
+                f'({time.perf_counter() - started:.0f} с)'
+            )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {Recipe._meta.db_table}')
+
+    def benchmark(self, rng, vocabulary, options):
+        queries = [
+            ' '.join(rng.sample(vocabulary, rng.choice((1, 1, 2))))
+            for _ in range(options['queries'])
+        ]
+        page_size = options['page_size']
+        queryset = Recipe.objects.defer('search_vector')
+
+        first, second = [], []
+        for query in queries:
+            elapsed, page = self.timed(
+                lambda: list(
+                    search_recipes(queryset, query).order_by(
+                        *SEARCH_ORDERING
+                    )[:page_size]
+                )
+            )
+            first.append(elapsed)
+            if len(page) < page_size:
+                continue
+            last = page[-1]
+            position = KeysetPagination(
+                SEARCH_ORDERING, page_size
+            ).get_position_filter([last.search_rank, last.pk], False)
+            elapsed, _ = self.timed(
+                lambda: list(
+                    search_recipes(queryset, query).filter(
+                        position
+                    ).order_by(*SEARCH_ORDERING)[:page_size]
+                )
+            )
+            second.append(elapsed)
+
+        self.stdout.write(f'\nРецептов: {options["recipes"]}, '
+                          f'запросов: {len(queries)}')
+        self.report('поиск, первая страница', first)
+        self.report('поиск, следующая страница', second)
+
+        if options['baseline']:
+            baseline = []
+            for query in queries[:20]:
+                elapsed, _ = self.timed(
+                    lambda: list(
+                        queryset.filter(
+                            Q(name__icontains=query)
+                            | Q(text__icontains=query)
+                        ).order_by('-id')[:page_size]
+                    )
+                )
+                baseline.append(elapsed)
+            self.report('подстрока (ILIKE), первая страница', baseline)
+
+        if connection.vendor == 'postgresql':
+            sql, params = search_recipes(queryset, queries[0]).order_by(
+                *SEARCH_ORDERING
+            )[:page_size].query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN ANALYZE {sql}', params)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+            self.stdout.write(f'\nПлан запроса «{queries[0]}»:\n{plan}')
+
+    def timed(self, func):
+        start = time.perf_counter()
+        result = func()
+        return (time.perf_counter() - start) * 1000, result
+
+    def report(self, title, timings):
+        if not timings:
+            self.stdout.write(f'{title}: нет данных')
+            return
+        timings = sorted(timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f'{title}: медиана {statistics.median(timings):.1f} мс, '
+            f'p95 {p95:.1f} мс, максимум {timings[-1]:.1f} мс'
+        )
@@ -0,0 +1,174 @@
+"""
+Management команда для сравнения способов формирования списка покупок.
+
+Создаёт синтетические рецепты и корзину внутри транзакции, которая
+откатывается в конце, поэтому данные в базе не остаются.
+"""
+import time
+import tracemalloc
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ingredients.models import Ingredient
+from recipes.models import Recipe, RecipeIngredient, ShoppingCart
+from recipes.shopping_list import (
+    aggregate_shopping_list_rows,
+    get_shopping_list_rows,
+    rebuild_shopping_lists,
+    render_shopping_list,
+)
+
+User = get_user_model()
+
+
+def legacy_shopping_list(user):
+    """Прежняя реализация: рецепты и ингредиенты загружаются в Python."""
+    shopping_cart = ShoppingCart.objects.filter(user=user).select_related(
+        'recipe'
+    ).prefetch_related(
+        'recipe__recipe_ingredients__ingredient'
+    )
+    ingredients_dict = defaultdict(int)
+    for cart_item in shopping_cart:
+        for recipe_ingredient in cart_item.recipe.recipe_ingredients.all():
+            ingredient = recipe_ingredient.ingredient
+            key = (ingredient.name, ingredient.measurement_unit)
+            ingredients_dict[key] += recipe_ingredient.amount
+
+    shopping_list = ['Список покупок:\n', '=' * 50 + '\n\n']
+    for (name, unit), amount in sorted(ingredients_dict.items()):
+        shopping_list.append(f'{name} ({unit}) - {amount}\n')
+    shopping_list.append('\n' + '=' * 50)
+    shopping_list.append(f'\nВсего ингредиентов: {len(ingredients_dict)}')
+    return ''.join(shopping_list)
+
+
+def aggregated_shopping_list(user):
+    """GROUP BY по ингредиентам рецептов корзины в БД."""
+    return ''.join(render_shopping_list(aggregate_shopping_list_rows(user)))
+
+
+def materialized_shopping_list(user):
+    """Текущая реализация: чтение просуммированного ShoppingListItem."""
+    return ''.join(render_shopping_list(get_shopping_list_rows(user)))
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает прежнее и текущее формирование списка покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[10, 100, 1000],
+            help='Количество рецептов в корзине для каждого прогона'
+        )
+        parser.add_argument(
+            '--ingredients',
+            type=int,
+            default=10,
+            help='Количество ингредиентов в каждом рецепте'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Количество повторов (берётся лучшее время)'
+        )
+
+    def handle(self, *args, **options):
+        ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True)[:500]
+        )
+        if len(ingredient_ids) < options['ingredients']:
+            self.stdout.write(
+                self.style.ERROR(
+                    'Недостаточно ингредиентов в базе, '
+                    'сначала выполните load_ingredients.'
+                )
+            )
+            return
+
+        self.stdout.write(
+            f'{"рецептов":>9} {"Python, мс":>11} {"GROUP BY, мс":>13} '
+            f'{"таблица, мс":>12} {"Python, КБ":>11} {"таблица, КБ":>12}'
+            f'  совпадает'
+        )
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    self.run_size(size, ingredient_ids, options)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def run_size(self, size, ingredient_ids, options):
+        user = User.objects.create(
+            username='bench_shopping_list',
+            email='bench_shopping_list@example.com',
+        )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=user,
+                name=f'Рецепт {number}',
+                text='Описание ' * 200,
+                cooking_time=10,
+                image='recipes/images/bench.png',
+            )
+            for number in range(size)
+        )
+        per_recipe = options['ingredients']
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient_ids[
+                    (number + offset) % len(ingredient_ids)
+                ],
+                amount=offset + 1,
+            )
+            for number, recipe in enumerate(recipes)
+            for offset in range(per_recipe)
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=user, recipe=recipe) for recipe in recipes
+        )
+
+        rebuild_shopping_lists([user.pk])
+
+        legacy_ms, legacy_kb, legacy_text = self.measure(
+            legacy_shopping_list, user, options['repeat']
+        )
+        aggregated_ms, _, aggregated_text = self.measure(
+            aggregated_shopping_list, user, options['repeat']
+        )
+        current_ms, current_kb, current_text = self.measure(
+            materialized_shopping_list, user, options['repeat']
+        )
+        same = legacy_text == aggregated_text == current_text
+        self.stdout.write(
+            f'{size:>9} {legacy_ms:>11.1f} {aggregated_ms:>13.1f} '
+            f'{current_ms:>12.1f} {legacy_kb:>11.0f} {current_kb:>12.0f}  '
+            f'{"да" if same else "НЕТ"}'
+        )
+
+    def measure(self, func, user, repeat):
+        """Лучшее время (мс) и пиковая память (КБ) построения списка."""
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            text = func(user)
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        tracemalloc.start()
+        func(user)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return best, peak / 1024, text
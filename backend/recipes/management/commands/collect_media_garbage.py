@@ -0,0 +1,110 @@
+"""
+Management команда для удаления неиспользуемых изображений.
+
+Изображения хранятся под именами по содержимому и бывают общими для
+нескольких записей, поэтому приложение их не удаляет. Команда собирает
+имена файлов, на которые ссылаются рецепты и пользователи, и обходит
+каталоги изображений, удаляя остальные. Свежие файлы не трогаются: на
+них может ссылаться ещё не зафиксированная транзакция или задача
+построения копий.
+"""
+import os
+import posixpath
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from foodgram.images import VARIANT_FORMATS
+from foodgram.storage import get_image_storage
+from recipes.models import Recipe
+
+User = get_user_model()
+
+TARGETS = (
+    (Recipe, 'image', 'image_variants'),
+    (User, 'avatar', 'avatar_variants'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Удаляет изображения, на которые не ссылается ни одна запись'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=float,
+            default=24,
+            help='Не удалять файлы моложе указанного числа часов'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что было бы удалено'
+        )
+
+    def handle(self, *args, **options):
+        storage = get_image_storage()
+        directories = sorted({
+            model._meta.get_field(field).upload_to.rstrip('/')
+            for model, field, _ in TARGETS
+        })
+        referenced = self.get_referenced_names()
+        cutoff = time.time() - options['min_age'] * 3600
+
+        deleted = kept = freed = 0
+        for directory in directories:
+            for name, entry in self.walk(storage.path(directory), directory):
+                if name in referenced:
+                    kept += 1
+                    continue
+                stat = entry.stat()
+                if stat.st_mtime > cutoff:
+                    kept += 1
+                    continue
+                if options['dry_run']:
+                    self.stdout.write(name)
+                else:
+                    storage.delete(name)
+                deleted += 1
+                freed += stat.st_size
+
+        action = 'будет удалено' if options['dry_run'] else 'удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Файлов {action}: {deleted} ({freed / 2 ** 20:.1f} МБ), '
+            f'оставлено: {kept}'
+        ))
+
+    def get_referenced_names(self):
+        """Имена оригиналов и копий, на которые ссылаются записи."""
+        referenced = set()
+        for model, field, variants_field in TARGETS:
+            rows = model.objects.exclude(**{f'{field}__isnull': True}).exclude(
+                **{field: ''}
+            ).values_list(field, variants_field)
+            for name, variants in rows.iterator(chunk_size=2000):
+                referenced.add(name)
+                for variant in (variants or {}).values():
+                    referenced.update(
+                        variant[extension]
+                        for extension in VARIANT_FORMATS
+                        if variant.get(extension)
+                    )
+        return referenced
+
+    def walk(self, path, name):
+        """Обходит каталог без построения полного списка файлов.
+
+        Возвращает пары (имя в хранилище, os.DirEntry).
+        """
+        try:
+            entries = os.scandir(path)
+        except FileNotFoundError:
+            return
+        with entries:
+            for entry in entries:
+                entry_name = posixpath.join(name, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self.walk(entry.path, entry_name)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry_name, entry
@@ -0,0 +1,66 @@
+"""
+Management команда для построения копий изображений рецептов и аватаров.
+
+Нужна для изображений, загруженных до появления копий, и для случаев,
+когда задача не попала в очередь.
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.tasks import generate_recipe_image_variants
+from users.tasks import generate_avatar_variants
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные копии изображений рецептов и аватаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Перестроить копии и там, где они уже есть'
+        )
+        parser.add_argument(
+            '--sync',
+            action='store_true',
+            help='Выполнить в текущем процессе, а не через Celery'
+        )
+        parser.add_argument(
+            '--only',
+            choices=['recipes', 'avatars'],
+            help='Обработать только рецепты или только аватары'
+        )
+
+    def handle(self, *args, **options):
+        targets = [
+            ('recipes', Recipe, 'image', 'image_variants',
+             generate_recipe_image_variants),
+            ('avatars', User, 'avatar', 'avatar_variants',
+             generate_avatar_variants),
+        ]
+        for label, model, field, variants_field, task in targets:
+            if options['only'] and options['only'] != label:
+                continue
+            queryset = model.objects.exclude(**{field: ''}).exclude(
+                **{f'{field}__isnull': True}
+            )
+            if not options['all']:
+                queryset = queryset.filter(**{variants_field: {}})
+            count = 0
+            for pk, name in queryset.values_list('pk', field).iterator():
+                if not options['sync']:
+                    task.delay(pk, name)
+                    count += 1
+                    continue
+                try:
+                    task(pk, name)
+                    count += 1
+                except OSError as e:
+                    self.stdout.write(
+                        self.style.WARNING(f'{label} {pk}: {name}: {e}')
+                    )
+            action = 'обработано' if options['sync'] else 'поставлено задач'
+            self.stdout.write(self.style.SUCCESS(f'{label}: {action} {count}'))
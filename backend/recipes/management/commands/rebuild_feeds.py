@@ -0,0 +1,58 @@
+"""
+Management команда для построения хранимых лент подписок.
+
+Нужна после первого развёртывания ленты, после изменения порога
+FEED_FANOUT_MIN_SUBSCRIPTIONS и если задачи Celery не были поставлены.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from recipes.feed import backfill_feed, trim_feed
+from recipes.models import FeedEntry
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Строит заново ленты подписок, хранимые в FeedEntry'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='users',
+            help='id пользователя (можно указать несколько раз)'
+        )
+
+    def handle(self, *args, **options):
+        threshold = settings.FEED_FANOUT_MIN_SUBSCRIPTIONS
+        users = User.objects.order_by('pk')
+        if options['users']:
+            users = users.filter(pk__in=options['users'])
+        user_ids = users.filter(
+            subscriptions_count__gte=threshold
+        ).values_list('pk', flat=True)
+
+        rebuilt = entries = 0
+        for user_id in list(user_ids):
+            entries += backfill_feed(user_id)
+            rebuilt += 1
+
+        # Ленты пользователей, опустившихся ниже порога, не читаются
+        stale = FeedEntry.objects.exclude(
+            user__subscriptions_count__gte=threshold
+        )
+        if options['users']:
+            stale = stale.filter(user_id__in=options['users'])
+        stale_users = list(
+            stale.values_list('user_id', flat=True).distinct()
+        )
+        for user_id in stale_users:
+            trim_feed(user_id)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Лент построено: {rebuilt} (записей {entries}), '
+            f'удалено лишних: {len(stale_users)}'
+        ))
@@ -0,0 +1,21 @@
+"""
+Management команда для сборки индекса поиска рецептов по продуктам.
+
+Нужна после первого развёртывания на большой базе, после массового
+импорта рецептов без сигналов (bulk_create) и если задача
+apply_pantry_changes_task долго не запускалась.
+"""
+from django.core.management.base import BaseCommand
+
+from recipes.pantry import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Строит заново инвертированный индекс ингредиент → рецепты'
+
+    def handle(self, *args, **options):
+        recipes, postings, size = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Рецептов в индексе: {recipes}, списков: {postings}, '
+            f'сжатый размер: {size / 1024:.1f} КБ'
+        ))
@@ -0,0 +1,101 @@
+"""
+Management команда для пересчёта и проверки списков покупок.
+"""
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingCart, ShoppingListItem
+from recipes.shopping_list import (
+    compute_shopping_list_totals,
+    rebuild_shopping_lists,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает ShoppingListItem по корзинам пользователей '
+        'или сверяет его с подсчётом на лету (--check)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить таблицу, ничего не изменяя'
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='users',
+            help='id пользователя (можно указать несколько раз)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Количество пользователей в одной пачке'
+        )
+
+    def get_user_ids(self, options):
+        if options['users']:
+            return sorted(set(options['users']))
+        user_ids = set(
+            ShoppingCart.objects.values_list('user_id', flat=True).distinct()
+        )
+        user_ids.update(
+            ShoppingListItem.objects.values_list(
+                'user_id', flat=True
+            ).distinct()
+        )
+        return sorted(user_ids)
+
+    def handle(self, *args, **options):
+        user_ids = self.get_user_ids(options)
+        batch_size = options['batch_size']
+        mismatched = []
+
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            if options['check']:
+                mismatched.extend(self.check_batch(batch))
+            else:
+                rebuild_shopping_lists(batch)
+
+        if not options['check']:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Списки покупок пересчитаны: {len(user_ids)} польз.'
+                )
+            )
+            return
+
+        if mismatched:
+            self.stdout.write(
+                self.style.ERROR(
+                    f'Расхождения у {len(mismatched)} из {len(user_ids)} '
+                    f'польз.: {mismatched[:20]}'
+                )
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Расхождений нет ({len(user_ids)} польз.).'
+                )
+            )
+
+    def check_batch(self, user_ids):
+        """Возвращает id пользователей, у которых суммы расходятся."""
+        expected = compute_shopping_list_totals(user_ids)
+        items = ShoppingListItem.objects.filter(user_id__in=user_ids)
+        stored = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in items.values_list(
+                'user_id', 'ingredient_id', 'total_amount'
+            )
+        }
+        return sorted({
+            user_id
+            for (user_id, ingredient_id) in set(expected) | set(stored)
+            if expected.get((user_id, ingredient_id))
+            != stored.get((user_id, ingredient_id))
+        })
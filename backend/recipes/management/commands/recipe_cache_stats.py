@@ -0,0 +1,30 @@
+"""
+Management команда для просмотра статистики кэша ответов API рецептов.
+"""
+from django.core.management.base import BaseCommand
+
+from recipes.caching import get_cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает количество попаданий и промахов кэша ответов рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Обнулить счётчики после вывода'
+        )
+
+    def handle(self, *args, **options):
+        stats = get_cache_stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total * 100 if total else 0
+        self.stdout.write(
+            f'Попаданий: {stats["hits"]}\n'
+            f'Промахов: {stats["misses"]}\n'
+            f'Доля попаданий: {ratio:.1f}%'
+        )
+        if options['reset']:
+            reset_cache_stats()
+            self.stdout.write(self.style.SUCCESS('Счётчики обнулены.'))
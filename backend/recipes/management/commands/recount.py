@@ -0,0 +1,99 @@
+"""
+Management команда для пересчёта хранимых счётчиков.
+
+Счётчики поддерживаются сигналами, но массовые операции (bulk_create,
+QuerySet.update, правки в базе вручную) их обходят.
+Команда проходит записи пачками по первичному ключу, в каждой пачке
+одним запросом находит строки, где счётчик расходится с фактическим
+числом связей, и обновляет только их.
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+
+from foodgram.counters import related_count
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription
+
+User = get_user_model()
+
+COUNTERS = (
+    (Recipe, (
+        ('favorites_count', Favorite, 'recipe'),
+        ('shopping_cart_count', ShoppingCart, 'recipe'),
+    )),
+    (User, (
+        ('recipes_count', Recipe, 'author'),
+        ('subscribers_count', Subscription, 'author'),
+        ('subscriptions_count', Subscription, 'user'),
+    )),
+)
+
+
+class Command(BaseCommand):
+    help = 'Исправляет расхождения хранимых счётчиков с данными'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество записей в одной пачке'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения'
+        )
+
+    def handle(self, *args, **options):
+        for model, counters in COUNTERS:
+            fixed = self.recount(
+                model, counters, options['batch_size'], options['dry_run']
+            )
+            action = 'расходится' if options['dry_run'] else 'исправлено'
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: {action} {fixed}'
+            ))
+
+    def recount(self, model, counters, batch_size, dry_run):
+        """Пересчитывает счётчики модели; возвращает число строк."""
+        actual = {
+            f'actual_{field}': related_count(related_model, related_field)
+            for field, related_model, related_field in counters
+        }
+        drifted = Q()
+        for field, *_ in counters:
+            drifted |= ~Q(**{f'actual_{field}': F(field)})
+
+        fixed = 0
+        last_pk = 0
+        while True:
+            pks = list(
+                model.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not pks:
+                return fixed
+            last_pk = pks[-1]
+            with transaction.atomic():
+                rows = list(
+                    model.objects.filter(pk__in=pks).annotate(**actual)
+                    .filter(drifted).values('pk', *actual)
+                )
+                fixed += len(rows)
+                if dry_run:
+                    for row in rows:
+                        self.stdout.write(f'{model.__name__} {row}')
+                    continue
+                if not rows:
+                    continue
+                # Значения вычисляются заново в UPDATE: между выборкой
+                # и обновлением могли появиться новые связи
+                model.objects.filter(
+                    pk__in=[row['pk'] for row in rows]
+                ).update(**{
+                    field: related_count(related_model, related_field)
+                    for field, related_model, related_field in counters
+                })
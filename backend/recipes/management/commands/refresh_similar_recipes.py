@@ -0,0 +1,26 @@
+"""
+Management команда для пересчёта списков похожих рецептов.
+
+То же, что задача refresh_similar_recipes_task, но без Celery; --full
+нужен после смены RECIPE_SIMILAR_METRIC или RECIPE_SIMILAR_COUNT.
+"""
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import refresh_similar_recipes
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает списки похожих рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать списки всех рецептов, а не только изменённых'
+        )
+
+    def handle(self, *args, **options):
+        count = refresh_similar_recipes(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано списков: {count}'
+        ))
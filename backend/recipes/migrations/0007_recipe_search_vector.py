@@ -0,0 +1,50 @@
+# Generated by Django 5.1.6 on 2026-10-17 06:10
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+FILL_SEARCH_VECTORS = """
+    UPDATE recipes_recipe r SET search_vector =
+        setweight(to_tsvector(%(config)s::regconfig, r.name), 'A')
+        || setweight(to_tsvector(%(config)s::regconfig, coalesce((
+            SELECT string_agg(i.name, ' ')
+            FROM recipes_recipeingredient ri
+            JOIN ingredients_ingredient i ON i.id = ri.ingredient_id
+            WHERE ri.recipe_id = r.id
+        ), '')), 'B')
+        || setweight(to_tsvector(%(config)s::regconfig, r.text), 'C')
+"""
+
+
+def fill_search_vectors(apps, schema_editor):
+    """Заполняет поисковые векторы существующих рецептов (PostgreSQL)."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        FILL_SEARCH_VECTORS,
+        {'config': settings.RECIPE_SEARCH_CONFIG}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingredients', '0004_ingredient_name_trgm_idx'),
+        ('recipes', '0006_shoppinglistitem'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, help_text='Название, ингредиенты и описание для полнотекстового поиска', null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='recipe_search_vector_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-17 06:22
+
+import foodgram.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(help_text='Изображение рецепта', storage=foodgram.storage.get_image_storage, upload_to='recipes/images/', verbose_name='Изображение'),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.1.6 on 2026-10-17 06:38
+
+import math
+from datetime import datetime, timezone
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def fill_rankings(apps, schema_editor):
+    """Даты существующих добавлений и начальные оценки рецептов.
+
+    Настоящие даты добавлений неизвестны: берётся дата рецепта, чтобы
+    первый пересчёт не счёл всю историю свежей активностью.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeRanking = apps.get_model('recipes', 'RecipeRanking')
+    for name in ('Favorite', 'ShoppingCart'):
+        model = apps.get_model('recipes', name)
+        model.objects.update(created=Subquery(
+            Recipe.objects.filter(pk=OuterRef('recipe_id')).values('created')
+        ))
+
+    weight = math.log(settings.RECIPE_RANKING_WEIGHTS['publish'])
+    half_lives = {
+        'popular_score': settings.RECIPE_POPULAR_HALF_LIFE,
+        'trending_score': settings.RECIPE_TRENDING_HALF_LIFE,
+    }
+    rankings = []
+    for recipe_id, created in Recipe.objects.values_list('pk', 'created'):
+        age = (created - EPOCH).total_seconds()
+        rankings.append(RecipeRanking(recipe_id=recipe_id, **{
+            field: weight + math.log(2) * age / half_life
+            for field, half_life in half_lives.items()
+        }))
+    RecipeRanking.objects.bulk_create(rankings, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_feed_entries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('activity_until', models.DateTimeField(blank=True, null=True, verbose_name='Учтены добавления до')),
+                ('views_bucket', models.BigIntegerField(default=0, verbose_name='Последний учтённый интервал просмотров')),
+            ],
+            options={
+                'verbose_name': 'Состояние рейтинга',
+                'verbose_name_plural': 'Состояние рейтинга',
+            },
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='RecipeRanking',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('popular_score', models.FloatField(default=0, verbose_name='Оценка популярности')),
+                ('trending_score', models.FloatField(default=0, verbose_name='Оценка тренда')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+                'indexes': [models.Index(fields=['-popular_score', '-recipe'], name='ranking_popular_idx'), models.Index(fields=['-trending_score', '-recipe'], name='ranking_trending_idx')],
+            },
+        ),
+        migrations.RunPython(fill_rankings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.6 on 2026-10-17 06:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_rankings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarityState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('computed_until', models.DateTimeField(blank=True, null=True, verbose_name='Учтены изменения до')),
+            ],
+            options={
+                'verbose_name': 'Состояние похожих рецептов',
+                'verbose_name_plural': 'Состояние похожих рецептов',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeNeighbour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Место')),
+                ('score', models.FloatField(verbose_name='Сходство')),
+                ('neighbour', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='neighbour_of', to='recipes.recipe', verbose_name='Похожий рецепт')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='recipes.recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'Похожий рецепт',
+                'verbose_name_plural': 'Похожие рецепты',
+                'constraints': [models.UniqueConstraint(fields=('recipe', 'rank'), name='unique_recipe_neighbour_rank')],
+            },
+        ),
+    ]
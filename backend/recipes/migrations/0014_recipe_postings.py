@@ -0,0 +1,57 @@
+# Generated by Django 5.1.6 on 2026-10-17 07:07
+
+from django.db import migrations, models
+
+
+def mark_recipes(apps, schema_editor):
+    """Отмечает существующие рецепты: задача соберёт по ним индекс.
+
+    На большой базе быстрее выполнить команду rebuild_pantry_index.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipePostingsChange = apps.get_model('recipes', 'RecipePostingsChange')
+    RecipePostingsChange.objects.bulk_create(
+        (
+            RecipePostingsChange(recipe_id=recipe_id)
+            for recipe_id in Recipe.objects.values_list('pk', flat=True)
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_neighbours'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipePostingsChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe_id', models.PositiveIntegerField(db_index=True, verbose_name='id рецепта')),
+                ('ingredient_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='id ингредиента')),
+            ],
+            options={
+                'verbose_name': 'Изменение индекса продуктов',
+                'verbose_name_plural': 'Изменения индекса продуктов',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipePostings',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('ingredient', 'Рецепты с ингредиентом'), ('lengths', 'Число ингредиентов рецептов')], max_length=10, verbose_name='Вид')),
+                ('key', models.PositiveIntegerField(default=0, verbose_name='id ингредиента')),
+                ('data', models.BinaryField(verbose_name='Сжатые данные')),
+                ('size', models.PositiveIntegerField(verbose_name='Количество рецептов')),
+            ],
+            options={
+                'verbose_name': 'Запись индекса продуктов',
+                'verbose_name_plural': 'Записи индекса продуктов',
+                'constraints': [models.UniqueConstraint(fields=('kind', 'key'), name='unique_recipe_postings')],
+            },
+        ),
+        migrations.RunPython(mark_recipes, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,20 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
 
+from foodgram.counters import CounterFieldsMixin
+from foodgram.storage import get_image_storage
+
 User = get_user_model()
 
 
-class Recipe(models.Model):
+class Recipe(CounterFieldsMixin, models.Model):
     """Модель рецепта."""
+    counter_fields = ('favorites_count', 'shopping_cart_count')
+    task_fields = ('image_variants',)
+
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -30,6 +38,7 @@ class Recipe(models.Model):
     image = models.ImageField(
         'Изображение',
         upload_to='recipes/images/',
+        storage=get_image_storage,
         help_text='Изображение рецепта'
     )
     ingredients = models.ManyToManyField(
@@ -42,11 +51,52 @@ class Recipe(models.Model):
         'Дата создания',
         auto_now_add=True
     )
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
+    image_variants = models.JSONField(
+        'Копии изображения',
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text='Уменьшенные копии изображения в WebP и JPEG'
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False,
+        help_text='Название, ингредиенты и описание для полнотекстового поиска'
+    )
+    favorites_count = models.PositiveIntegerField(
+        'Кол-во в избранном',
+        default=0,
+        editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        'Кол-во в корзине',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-created',)
+        indexes = [
+            models.Index(
+                fields=['-created', '-id'],
+                name='recipe_created_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-created', '-id'],
+                name='recipe_author_created_idx'
+            ),
+            GinIndex(
+                fields=['search_vector'],
+                name='recipe_search_vector_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -100,6 +150,11 @@ class ShoppingCart(models.Model):
         related_name='shopping_cart',
         verbose_name='Рецепт'
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'Корзина покупок'
@@ -129,6 +184,11 @@ class Favorite(models.Model):
         related_name='favorites',
         verbose_name='Рецепт'
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'Избранное'
@@ -141,4 +201,244 @@ class Favorite(models.Model):
         ]
 
     def __str__(self):
-        return f'{self.user.username} - {self.recipe.name}'
\ No newline at end of file
+        return f'{self.user.username} - {self.recipe.name}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в материализованной ленте подписок пользователя.
+
+    Записи раскладываются задачей Celery при создании рецепта и
+    добавляются или удаляются при подписке и отписке (см. recipes/feed.py).
+    Дата создания копируется из рецепта: лента читается одним
+    диапазонным сканом индекса (user, created, recipe).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Читатель'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    created = models.DateTimeField('Дата публикации рецепта')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_user_recipe_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-created', '-recipe'],
+                name='feed_user_created_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.recipe_id}'
+
+
+class RecipeRanking(models.Model):
+    """Оценки рецепта для сортировки по популярности.
+
+    Оценки пересчитывает периодическая задача (см. recipes/ranking.py);
+    при чтении выполняется только проход по индексу оценки.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ranking',
+        verbose_name='Рецепт'
+    )
+    popular_score = models.FloatField('Оценка популярности', default=0)
+    trending_score = models.FloatField('Оценка тренда', default=0)
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        indexes = [
+            models.Index(
+                fields=['-popular_score', '-recipe'],
+                name='ranking_popular_idx'
+            ),
+            models.Index(
+                fields=['-trending_score', '-recipe'],
+                name='ranking_trending_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.popular_score:.2f}'
+
+
+class RecipeNeighbour(models.Model):
+    """Рецепт из списка похожих (по общим ингредиентам).
+
+    Списки строит задача Celery (см. recipes/similarity.py). Удаление
+    соседа оставляет строку с пустой ссылкой: по ней задача находит
+    устаревшие списки.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='neighbours',
+        verbose_name='Рецепт'
+    )
+    neighbour = models.ForeignKey(
+        Recipe,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='neighbour_of',
+        verbose_name='Похожий рецепт'
+    )
+    rank = models.PositiveSmallIntegerField('Место')
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'rank'],
+                name='unique_recipe_neighbour_rank'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id} → {self.neighbour_id}: {self.score:.2f}'
+
+
+class SimilarityState(models.Model):
+    """Докуда изменения рецептов учтены в RecipeNeighbour (одна запись)."""
+    computed_until = models.DateTimeField(
+        'Учтены изменения до',
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        verbose_name = 'Состояние похожих рецептов'
+        verbose_name_plural = 'Состояние похожих рецептов'
+
+
+class RecipePostings(models.Model):
+    """Сжатые данные индекса поиска по продуктам (см. recipes/pantry.py).
+
+    Для ингредиента — отсортированные id рецептов с ним; запись
+    LENGTHS — число ингредиентов каждого рецепта по его id.
+    """
+    INGREDIENT = 'ingredient'
+    LENGTHS = 'lengths'
+    KIND_CHOICES = (
+        (INGREDIENT, 'Рецепты с ингредиентом'),
+        (LENGTHS, 'Число ингредиентов рецептов'),
+    )
+
+    kind = models.CharField('Вид', max_length=10, choices=KIND_CHOICES)
+    key = models.PositiveIntegerField('id ингредиента', default=0)
+    data = models.BinaryField('Сжатые данные')
+    size = models.PositiveIntegerField('Количество рецептов')
+
+    class Meta:
+        verbose_name = 'Запись индекса продуктов'
+        verbose_name_plural = 'Записи индекса продуктов'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'key'],
+                name='unique_recipe_postings'
+            )
+        ]
+
+
+class RecipePostingsChange(models.Model):
+    """Рецепт, чьи ингредиенты изменились после сборки RecipePostings.
+
+    ingredient — удалённый из рецепта ингредиент; пустое значение
+    означает «сверить с текущими ингредиентами рецепта».
+    """
+    recipe_id = models.PositiveIntegerField('id рецепта', db_index=True)
+    ingredient_id = models.PositiveIntegerField(
+        'id ингредиента',
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        verbose_name = 'Изменение индекса продуктов'
+        verbose_name_plural = 'Изменения индекса продуктов'
+
+
+class RankingState(models.Model):
+    """Докуда активность уже учтена в RecipeRanking (одна запись)."""
+    activity_until = models.DateTimeField(
+        'Учтены добавления до',
+        null=True,
+        blank=True
+    )
+    views_bucket = models.BigIntegerField(
+        'Последний учтённый интервал просмотров',
+        default=0
+    )
+
+    class Meta:
+        verbose_name = 'Состояние рейтинга'
+        verbose_name_plural = 'Состояние рейтинга'
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента в списке покупок пользователя.
+
+    Таблица поддерживается при добавлении и удалении рецептов из корзины
+    и при изменении ингредиентов рецептов, лежащих в корзинах.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        'ingredients.Ingredient',
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.PositiveIntegerField(
+        'Количество',
+        help_text='Суммарное количество ингредиента по рецептам корзины'
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_user_ingredient_shopping_list'
+            )
+        ]
+
+    def __str__(self):
+        return (
+            f'{self.user.username} - {self.ingredient.name}: '
+            f'{self.total_amount}'
+        )
@@ -0,0 +1,315 @@
+"""Поиск рецептов по продуктам, которые есть у пользователя.
+
+Инвертированный индекс RecipePostings хранит для каждого ингредиента
+отсортированный список id рецептов с ним: разности соседних id (uint32),
+сжатые zlib. Отдельная запись хранит число ингредиентов каждого рецепта
+плотным массивом uint8 по id рецепта. Распаковка и подсчёт — векторные
+операции NumPy.
+
+Совпадения считаются сложением списков указанных ингредиентов в плотном
+массиве по id рецепта, недостающие — вычитанием из длины рецепта; в
+базу уходит один запрос за нужными списками, без соединений с
+RecipeIngredient.
+
+Изменения ингредиентов записываются в RecipePostingsChange в той же
+транзакции (см. RecipeCreateSerializer, RecipeIngredientAdmin и
+recipes/signals.py), задача apply_pantry_changes_task переносит их в
+индекс. До этого поиск оценивает такие рецепты по RecipeIngredient
+напрямую, поэтому выдача соответствует текущим данным.
+"""
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import RecipeIngredient, RecipePostings, RecipePostingsChange
+
+EMPTY = np.empty(0, dtype=np.int64)
+# Наибольший id: ключи в БД — integer, разности id хранятся в uint32
+MAX_ID = 2 ** 31 - 1
+PAIR = np.dtype((np.int64, 2))
+CHUNK_SIZE = 10000
+# Списки переписываются при каждом переносе изменений: уровень 1 сжимает
+# в несколько раз быстрее уровня по умолчанию и почти так же плотно
+COMPRESS_LEVEL = 1
+# Длины хранятся в uint8: рецепт длиннее запроса с допуском в выдачу не
+# попадает, поэтому точные длины больше 255 не нужны
+MAX_LENGTH = 255
+
+
+def encode_ids(recipe_ids):
+    """Сжимает отсортированный массив уникальных id."""
+    deltas = np.diff(np.asarray(recipe_ids, dtype=np.int64), prepend=0)
+    return zlib.compress(deltas.astype('<u4').tobytes(), COMPRESS_LEVEL)
+
+
+def decode_ids(data):
+    """Восстанавливает отсортированный массив id."""
+    deltas = np.frombuffer(zlib.decompress(data), dtype='<u4')
+    return np.cumsum(deltas, dtype=np.int64)
+
+
+def encode_lengths(lengths):
+    return zlib.compress(
+        np.minimum(lengths, MAX_LENGTH).astype(np.uint8).tobytes(),
+        COMPRESS_LEVEL
+    )
+
+
+def decode_lengths(data):
+    return np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+
+
+def record_changes(recipe_ids=(), removed=()):
+    """Отмечает рецепты для переноса в индекс (один INSERT).
+
+    recipe_ids — рецепты, чьи текущие ингредиенты нужно сверить с
+    индексом; removed — пары (recipe_id, ingredient_id), которых у
+    рецепта больше может не быть.
+    """
+    RecipePostingsChange.objects.bulk_create(
+        [RecipePostingsChange(recipe_id=recipe_id) for recipe_id in recipe_ids]
+        + [
+            RecipePostingsChange(
+                recipe_id=recipe_id, ingredient_id=ingredient_id
+            )
+            for recipe_id, ingredient_id in removed
+        ],
+        batch_size=CHUNK_SIZE,
+    )
+
+
+def _load_pairs(queryset, *fields):
+    return np.fromiter(
+        queryset.values_list(*fields).iterator(chunk_size=CHUNK_SIZE),
+        dtype=PAIR
+    ).reshape(-1, 2)
+
+
+def _contains(sorted_values, items):
+    """Маска: какие из items есть в отсортированном sorted_values."""
+    if not len(sorted_values):
+        return np.zeros(len(items), dtype=bool)
+    positions = np.minimum(
+        np.searchsorted(sorted_values, items), len(sorted_values) - 1
+    )
+    return sorted_values[positions] == items
+
+
+def _score_pending(pantry):
+    """(id, совпало, длина) для рецептов, ещё не перенесённых в индекс."""
+    pairs = _load_pairs(
+        RecipeIngredient.objects.filter(
+            recipe_id__in=RecipePostingsChange.objects.values('recipe_id')
+        ),
+        'recipe_id', 'ingredient_id'
+    )
+    ids, inverse, lengths = np.unique(
+        pairs[:, 0], return_inverse=True, return_counts=True
+    )
+    matched = np.bincount(
+        inverse, weights=_contains(pantry, pairs[:, 1]), minlength=len(ids)
+    ).astype(np.int64)
+    return ids, matched, lengths
+
+
+def _count_matches(postings, lengths):
+    """(id, совпало, длина) рецептов хотя бы с одним из ингредиентов.
+
+    Счётчики — плотный массив по id рецепта: прибавить единицу по
+    каждому списку быстрее, чем сливать списки.
+    """
+    size = max((ids[-1] for ids in postings), default=-1) + 1
+    matched = np.zeros(size, dtype=np.int16)
+    for ids in postings:
+        matched[ids] += 1
+    ids = np.flatnonzero(matched[:len(lengths)])
+    # Длина 0 — рецепта уже нет, а список ещё не обновлён
+    ids = ids[lengths[ids] > 0]
+    return (
+        ids,
+        matched[ids].astype(np.int64),
+        lengths[ids].astype(np.int64),
+    )
+
+
+def find_recipes(ingredient_ids, max_missing):
+    """Рецепты, для которых не хватает не более max_missing продуктов.
+
+    Возвращает массивы (id, совпало, не хватает), упорядоченные по числу
+    недостающих, затем по числу совпавших (больше — выше) и по id (новые
+    выше). Рецепты без единого совпадения не попадают в выдачу.
+    """
+    pantry = np.unique(np.fromiter(ingredient_ids, dtype=np.int64))
+    postings, lengths = [], np.zeros(0, dtype=np.uint8)
+    for kind, data in RecipePostings.objects.filter(
+        Q(kind=RecipePostings.INGREDIENT, key__in=pantry.tolist())
+        | Q(kind=RecipePostings.LENGTHS)
+    ).values_list('kind', 'data'):
+        if kind == RecipePostings.LENGTHS:
+            lengths = decode_lengths(data)
+        else:
+            postings.append(decode_ids(data))
+    ids, matched, lengths = _count_matches(postings, lengths)
+
+    pending = np.unique(np.fromiter(
+        RecipePostingsChange.objects.values_list('recipe_id', flat=True),
+        dtype=np.int64
+    ))
+    keep = ~_contains(pending, ids)
+    ids, matched, lengths = ids[keep], matched[keep], lengths[keep]
+    if len(pending):
+        fresh = _score_pending(pantry)
+        ids, matched, lengths = (
+            np.concatenate(pair) for pair in zip(
+                (ids, matched, lengths), fresh
+            )
+        )
+
+    missing = lengths - matched
+    keep = (matched > 0) & (missing <= max_missing)
+    ids, matched, missing = ids[keep], matched[keep], missing[keep]
+    order = np.lexsort((-ids, -matched, missing))
+    return ids[order], matched[order], missing[order]
+
+
+def _group(keys, recipe_ids):
+    """{ключ: отсортированные id рецептов} для пар (ключ, id)."""
+    order = np.lexsort((recipe_ids, keys))
+    keys, recipe_ids = keys[order], recipe_ids[order]
+    unique, starts = np.unique(keys, return_index=True)
+    return dict(zip(unique.tolist(), np.split(recipe_ids, starts[1:])))
+
+
+def _write_postings(additions, removed, keys):
+    """Убирает removed из списков ингредиентов keys и добавляет additions.
+
+    additions — {id ингредиента: отсортированные id рецептов}; рецепты
+    из additions входят в removed, поэтому повторов не бывает.
+    """
+    existing = {
+        item.key: item
+        for item in RecipePostings.objects.select_for_update().filter(
+            kind=RecipePostings.INGREDIENT, key__in=keys
+        )
+    }
+    to_create, to_update, to_delete = [], [], []
+    for key in keys:
+        item = existing.get(key)
+        old = EMPTY if item is None else decode_ids(item.data)
+        kept = old[~_contains(removed, old)]
+        # Два отсортированных отрезка: stable-сортировка просто сливает их
+        new = np.sort(
+            np.concatenate([kept, additions.get(key, EMPTY)]), kind='stable'
+        )
+        if item is None:
+            if len(new):
+                to_create.append(RecipePostings(
+                    kind=RecipePostings.INGREDIENT,
+                    key=key,
+                    data=encode_ids(new),
+                    size=len(new),
+                ))
+        elif not len(new):
+            to_delete.append(item.pk)
+        elif not np.array_equal(old, new):
+            item.data = encode_ids(new)
+            item.size = len(new)
+            to_update.append(item)
+    RecipePostings.objects.bulk_create(to_create)
+    RecipePostings.objects.bulk_update(to_update, ['data', 'size'])
+    RecipePostings.objects.filter(pk__in=to_delete).delete()
+
+
+def _write_lengths(recipe_ids, pairs):
+    """Обнуляет длины recipe_ids и записывает длины рецептов из pairs."""
+    item = RecipePostings.objects.select_for_update().filter(
+        kind=RecipePostings.LENGTHS
+    ).first()
+    if item is None:
+        item = RecipePostings(kind=RecipePostings.LENGTHS)
+        old = np.zeros(0, dtype=np.uint8)
+    else:
+        old = decode_lengths(item.data)
+    changed, counts = np.unique(pairs[:, 0], return_counts=True)
+    size = max(
+        len(old),
+        recipe_ids.max(initial=-1) + 1,
+        changed.max(initial=-1) + 1,
+    )
+    lengths = np.zeros(size, dtype=np.int64)
+    lengths[:len(old)] = old
+    lengths[recipe_ids] = 0
+    lengths[changed] = counts
+    item.data = encode_lengths(lengths)
+    item.size = int(np.count_nonzero(lengths))
+    item.save()
+    return item
+
+
+@transaction.atomic
+def apply_changes():
+    """Переносит в индекс накопленные изменения; возвращает число рецептов.
+
+    За один запуск обрабатывается не больше PANTRY_CHANGES_BATCH записей.
+    """
+    changes = list(
+        RecipePostingsChange.objects.select_for_update().order_by(
+            'pk'
+        ).values_list('pk', 'recipe_id', 'ingredient_id')[
+            :settings.PANTRY_CHANGES_BATCH
+        ]
+    )
+    if not changes:
+        return 0
+    recipe_ids = np.unique([recipe_id for _, recipe_id, _ in changes])
+    current = _load_pairs(
+        RecipeIngredient.objects.filter(recipe_id__in=recipe_ids.tolist()),
+        'recipe_id', 'ingredient_id'
+    )
+    keys = {
+        ingredient_id for _, _, ingredient_id in changes
+        if ingredient_id is not None
+    } | set(current[:, 1].tolist())
+    _write_postings(
+        _group(current[:, 1], current[:, 0]), recipe_ids, sorted(keys)
+    )
+    _write_lengths(recipe_ids, current)
+    RecipePostingsChange.objects.filter(
+        pk__in=[pk for pk, _, _ in changes]
+    ).delete()
+    return len(recipe_ids)
+
+
+@transaction.atomic
+def rebuild_index():
+    """Собирает индекс заново по RecipeIngredient.
+
+    Возвращает (число рецептов, число списков, байт в сжатых данных).
+    """
+    change_ids = list(
+        RecipePostingsChange.objects.values_list('pk', flat=True)
+    )
+    RecipePostings.objects.all().delete()
+    pairs = _load_pairs(
+        RecipeIngredient.objects.all(), 'recipe_id', 'ingredient_id'
+    )
+    postings = [
+        RecipePostings(
+            kind=RecipePostings.INGREDIENT,
+            key=key,
+            data=encode_ids(ids),
+            size=len(ids),
+        )
+        for key, ids in _group(pairs[:, 1], pairs[:, 0]).items()
+    ]
+    RecipePostings.objects.bulk_create(postings, batch_size=100)
+    lengths = _write_lengths(EMPTY, pairs)
+    RecipePostingsChange.objects.filter(pk__in=change_ids).delete()
+    return (
+        lengths.size,
+        len(postings),
+        sum(len(item.data) for item in postings) + len(lengths.data),
+    )
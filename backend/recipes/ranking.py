@@ -0,0 +1,201 @@
+"""Рейтинги рецептов: популярные и набирающие популярность.
+
+Публикация рецепта, добавления в избранное и корзину и просмотры дают
+вклад weight * 2 ** (-возраст / период полураспада). Оценка хранится
+как логарифм суммы вкладов, отсчитанный от фиксированной эпохи: общий
+для всех рецептов множитель затухания при этом сокращается, и порядок
+рецептов не меняется со временем. Поэтому задача не пересчитывает все
+строки, а только добавляет к оценкам вклад активности с прошлого
+запуска, а чтение — проход по индексу оценки без агрегации.
+
+Удаления из избранного и корзины оценку не уменьшают: учитывается
+активность, а не текущее число добавлений.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .caching import invalidate_recipes
+from .models import (
+    Favorite,
+    RankingState,
+    Recipe,
+    RecipeRanking,
+    ShoppingCart,
+)
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+LN2 = math.log(2)
+
+# Поле оценки и настройка с её периодом полураспада
+RANKINGS = {
+    'popular_score': 'RECIPE_POPULAR_HALF_LIFE',
+    'trending_score': 'RECIPE_TRENDING_HALF_LIFE',
+}
+ACTIVITY_MODELS = ((Favorite, 'favorite'), (ShoppingCart, 'shopping_cart'))
+
+# Сколько интервалов просмотров хранится в кэше до учёта
+VIEWS_KEEP_BUCKETS = 24
+CHUNK_SIZE = 1000
+
+
+def get_half_lives():
+    return {
+        field: getattr(settings, name) for field, name in RANKINGS.items()
+    }
+
+
+def get_epoch_offsets(moment):
+    """Логарифм множителя, приводящего вклад к эпохе, для каждой оценки."""
+    age = (moment - EPOCH).total_seconds()
+    return {
+        field: LN2 * age / half_life
+        for field, half_life in get_half_lives().items()
+    }
+
+
+def get_publish_scores(created):
+    """Начальные оценки рецепта: вклад самой публикации."""
+    weight = math.log(settings.RECIPE_RANKING_WEIGHTS['publish'])
+    return {
+        field: weight + offset
+        for field, offset in get_epoch_offsets(created).items()
+    }
+
+
+def add_log_scores(first, second):
+    """log(e ** first + e ** second) без переполнения."""
+    high, low = max(first, second), min(first, second)
+    return high + math.log1p(math.exp(low - high))
+
+
+def get_views_bucket(moment=None):
+    """Номер интервала, в который попадает просмотр."""
+    moment = moment or timezone.now()
+    return int(moment.timestamp() // settings.RECIPE_VIEWS_BUCKET)
+
+
+def _views_key(bucket, suffix):
+    return f'recipes:views:{bucket}:{suffix}'
+
+
+def record_view(recipe_id):
+    """Учитывает просмотр рецепта в счётчике текущего интервала.
+
+    Первый просмотр рецепта в интервале дописывает его id в журнал
+    интервала: задача читает только просмотренные рецепты.
+    """
+    bucket = get_views_bucket()
+    timeout = settings.RECIPE_VIEWS_BUCKET * VIEWS_KEEP_BUCKETS
+    count_key = _views_key(bucket, recipe_id)
+    if not cache.add(count_key, 1, timeout):
+        try:
+            cache.incr(count_key)
+        except ValueError:
+            pass
+        return
+    sequence_key = _views_key(bucket, 'seq')
+    cache.add(sequence_key, 0, timeout)
+    index = cache.incr(sequence_key)
+    cache.set(_views_key(bucket, f'log:{index}'), recipe_id, timeout)
+
+
+def read_views(bucket):
+    """Просмотры за закончившийся интервал: {recipe_id: количество}."""
+    size = cache.get(_views_key(bucket, 'seq')) or 0
+    views = {}
+    for start in range(1, size + 1, CHUNK_SIZE):
+        log_keys = [
+            _views_key(bucket, f'log:{index}')
+            for index in range(start, min(start + CHUNK_SIZE, size + 1))
+        ]
+        recipe_ids = cache.get_many(log_keys).values()
+        counts = cache.get_many(
+            [_views_key(bucket, recipe_id) for recipe_id in recipe_ids]
+        )
+        for recipe_id in recipe_ids:
+            count = counts.get(_views_key(bucket, recipe_id))
+            if count:
+                views[recipe_id] = count
+    return views
+
+
+def _apply_totals(totals, offsets):
+    """Прибавляет к оценкам суммы вкладов, приведённые к одному моменту."""
+    recipe_ids = sorted(totals)
+    for start in range(0, len(recipe_ids), CHUNK_SIZE):
+        chunk = recipe_ids[start:start + CHUNK_SIZE]
+        rankings = RecipeRanking.objects.in_bulk(chunk)
+        # Рецепты, созданные без сигналов (bulk_create)
+        created = [
+            RecipeRanking(recipe_id=recipe_id, **get_publish_scores(moment))
+            for recipe_id, moment in Recipe.objects.filter(
+                pk__in=set(chunk) - set(rankings)
+            ).values_list('pk', 'created')
+        ]
+        RecipeRanking.objects.bulk_create(created, ignore_conflicts=True)
+        rankings.update((ranking.recipe_id, ranking) for ranking in created)
+
+        for recipe_id, ranking in rankings.items():
+            for field, total in totals[recipe_id].items():
+                # Очень старая активность при первом запуске даёт 0
+                if total > 0:
+                    setattr(ranking, field, add_log_scores(
+                        getattr(ranking, field),
+                        math.log(total) + offsets[field]
+                    ))
+        RecipeRanking.objects.bulk_update(rankings.values(), list(RANKINGS))
+
+
+@transaction.atomic
+def update_rankings(now=None):
+    """Учитывает активность с прошлого запуска; возвращает число рецептов.
+
+    Первый запуск учитывает все добавления в избранное и корзину.
+    """
+    now = now or timezone.now()
+    until = now - timedelta(seconds=settings.RECIPE_RANKING_LAG)
+    state, _ = RankingState.objects.select_for_update().get_or_create(pk=1)
+    weights = settings.RECIPE_RANKING_WEIGHTS
+    half_lives = get_half_lives()
+    # Вклады приводятся к моменту until, поэтому суммы не переполняются
+    totals = defaultdict(lambda: dict.fromkeys(half_lives, 0.0))
+
+    def add(recipe_id, moment, weight):
+        age = max((until - moment).total_seconds(), 0)
+        for field, half_life in half_lives.items():
+            totals[recipe_id][field] += weight * 2 ** (-age / half_life)
+
+    for model, kind in ACTIVITY_MODELS:
+        events = model.objects.filter(created__lte=until)
+        if state.activity_until is not None:
+            events = events.filter(created__gt=state.activity_until)
+        for recipe_id, created in events.values_list(
+            'recipe_id', 'created'
+        ).iterator(chunk_size=CHUNK_SIZE):
+            add(recipe_id, created, weights[kind])
+
+    last_bucket = get_views_bucket(until) - 1
+    first_bucket = max(
+        state.views_bucket + 1, last_bucket - VIEWS_KEEP_BUCKETS + 1
+    )
+    for bucket in range(first_bucket, last_bucket + 1):
+        middle = datetime.fromtimestamp(
+            (bucket + 0.5) * settings.RECIPE_VIEWS_BUCKET, tz=dt_timezone.utc
+        )
+        for recipe_id, views in read_views(bucket).items():
+            add(recipe_id, middle, weights['view'] * views)
+
+    _apply_totals(totals, get_epoch_offsets(until))
+    state.activity_until = until
+    state.views_bucket = last_bucket
+    state.save()
+    if totals:
+        invalidate_recipes()
+    return len(totals)
@@ -0,0 +1,100 @@
+"""Полнотекстовый поиск рецептов.
+
+В PostgreSQL у каждого рецепта хранится tsvector из названия (вес A),
+названий ингредиентов (B) и описания (C) с GIN индексом; запрос
+ранжируется через ts_rank. В других базах используется поиск по
+вхождению подстроки с грубым ранжированием по месту совпадения.
+"""
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connection
+from django.db.models import (
+    Case,
+    F,
+    FloatField,
+    OuterRef,
+    Q,
+    Subquery,
+    TextField,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast, Coalesce
+
+from .models import Recipe, RecipeIngredient
+
+
+def is_supported():
+    """Хранимый tsvector есть только в PostgreSQL."""
+    return connection.vendor == 'postgresql'
+
+
+def build_search_vector():
+    """Выражение tsvector рецепта для UPDATE."""
+    config = settings.RECIPE_SEARCH_CONFIG
+    ingredient_names = RecipeIngredient.objects.filter(
+        recipe=OuterRef('pk')
+    ).values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')
+    ).values('names')
+    return (
+        SearchVector('name', weight='A', config=config)
+        + SearchVector(
+            Coalesce(
+                Subquery(ingredient_names),
+                Value(''),
+                output_field=TextField()
+            ),
+            weight='B',
+            config=config
+        )
+        + SearchVector('text', weight='C', config=config)
+    )
+
+
+def update_search_vectors(recipe_ids):
+    """Пересчитывает tsvector рецептов одним UPDATE."""
+    if not is_supported():
+        return
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        search_vector=build_search_vector()
+    )
+
+
+def search_recipes(queryset, text):
+    """Рецепты, подходящие под запрос, с аннотацией search_rank."""
+    if is_supported():
+        query = SearchQuery(
+            text,
+            config=settings.RECIPE_SEARCH_CONFIG,
+            search_type='websearch'
+        )
+        # ts_rank возвращает real; приведение к double precision нужно,
+        # чтобы значение в курсоре точно совпадало со значением в БД
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=Cast(
+                SearchRank(F('search_vector'), query),
+                FloatField()
+            )
+        )
+
+    in_ingredients = Q(
+        pk__in=RecipeIngredient.objects.filter(
+            ingredient__name__icontains=text
+        ).values('recipe_id')
+    )
+    return queryset.filter(
+        Q(name__icontains=text) | Q(text__icontains=text) | in_ingredients
+    ).annotate(
+        search_rank=Case(
+            When(name__icontains=text, then=Value(1.0)),
+            When(in_ingredients, then=Value(0.4)),
+            default=Value(0.1),
+            output_field=FloatField()
+        )
+    )
@@ -1,12 +1,31 @@
-from drf_extra_fields.fields import Base64ImageField
+import json
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Manager
+from django.http import QueryDict
 from rest_framework import serializers
 
-from .models import Recipe, RecipeIngredient, ShoppingCart, Favorite
+from foodgram.media import get_media_resolver
+from ingredients.catalog import expire_catalog
+from foodgram.uploads import ImageUploadField
+from foodgram.images import (
+    get_variant_url,
+    get_variant_urls,
+    reset_image_variants,
+    schedule_image_variants,
+)
+
+from .caching import get_recipe_fragments
+from .models import Recipe, RecipeIngredient
+from .pantry import record_changes as record_pantry_changes
+from .shopping_list import update_recipe_in_shopping_lists
+from .tasks import generate_recipe_image_variants
 from .validators import (
     validate_recipe_image,
     validate_recipe_ingredients_present,
     validate_ingredients,
 )
+from .viewer_state import get_viewer_state
 
 
 
@@ -30,8 +49,23 @@ class RecipeIngredientCreateSerializer(serializers.Serializer):
     amount = serializers.IntegerField(min_value=1)
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    """Собирает список рецептов из закэшированных фрагментов."""
+
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        return self.child.represent_many(recipes, image_size='card')
+
+
 class RecipeSerializer(serializers.ModelSerializer):
-    """Сериализатор для отображения рецепта."""
+    """Сериализатор для отображения рецепта.
+
+    Независимая от пользователя часть рецепта (ингредиенты, изображение,
+    текст, профиль автора) кэшируется, а флаги is_favorited,
+    is_in_shopping_cart и is_subscribed накладываются при выдаче.
+    В image отдаётся копия изображения под размер карточки в списке или
+    страницы рецепта, все копии перечислены в image_variants.
+    """
     author = serializers.SerializerMethodField()
     ingredients = IngredientInRecipeSerializer(
         source='recipe_ingredients',
@@ -41,6 +75,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -52,10 +87,45 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
         )
         read_only_fields = ('id', 'author')
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        return self.represent_many([instance], image_size='detail')[0]
+
+    def represent_many(self, recipes, image_size):
+        """Представление рецептов: фрагменты из кэша и флаги пользователя."""
+        request = self.context.get('request')
+        fragments = get_recipe_fragments(
+            recipes,
+            request,
+            self.build_fragment
+        )
+        state = get_viewer_state(request)
+        for recipe, fragment in zip(recipes, fragments):
+            fragment['is_favorited'] = state.is_favorited(recipe)
+            fragment['is_in_shopping_cart'] = state.is_in_shopping_cart(
+                recipe
+            )
+            fragment['author']['is_subscribed'] = state.is_subscribed(
+                recipe.author
+            )
+            variant = (fragment['image_variants'] or {}).get(image_size)
+            if variant:
+                fragment['image'] = variant['jpeg']
+        return fragments
+
+    def build_fragment(self, recipe):
+        """Полное представление рецепта без флагов пользователя."""
+        data = super().to_representation(recipe)
+        data['is_favorited'] = None
+        data['is_in_shopping_cart'] = None
+        data['author']['is_subscribed'] = None
+        return data
 
     def get_author(self, obj):
         """Возвращает информацию об авторе."""
@@ -65,33 +135,28 @@ class RecipeSerializer(serializers.ModelSerializer):
     def get_is_favorited(self, obj):
         """Проверка избранного."""
         request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Favorite.objects.filter(
-                user=request.user,
-                recipe=obj
-            ).exists()
-        return False
+        return get_viewer_state(request).is_favorited(obj)
 
     def get_is_in_shopping_cart(self, obj):
         """Проверка корзины."""
         request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return ShoppingCart.objects.filter(
-                user=request.user,
-                recipe=obj
-            ).exists()
-        return False
+        return get_viewer_state(request).is_in_shopping_cart(obj)
 
     def get_image(self, obj):
-        if obj.image:
-            return obj.image.url  # Например: "/media/recipes/abc123.png"
-        return None
+        return get_media_resolver(
+            self.context.get('request')
+        ).file_url(obj.image.name)
+
+    def get_image_variants(self, obj):
+        return get_variant_urls(
+            obj.image_variants, self.context.get('request')
+        )
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для создания рецепта."""
     ingredients = RecipeIngredientCreateSerializer(many=True, required=True)
-    image = Base64ImageField(required=True, allow_null=False)
+    image = ImageUploadField(required=True, allow_null=False)
 
     class Meta:
         model = Recipe
@@ -103,6 +168,19 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             'cooking_time',
         )
 
+    def to_internal_value(self, data):
+        """В multipart/form-data ингредиенты приходят JSON строкой."""
+        if isinstance(data, QueryDict):
+            data = data.dict()
+            if isinstance(data.get('ingredients'), str):
+                try:
+                    data['ingredients'] = json.loads(data['ingredients'])
+                except ValueError:
+                    raise serializers.ValidationError({
+                        'ingredients': ['Ожидается JSON список ингредиентов.']
+                    })
+        return super().to_internal_value(data)
+
     def validate(self, attrs):
         """Валидация всех полей."""
         validate_recipe_image(self, self.initial_data)
@@ -115,19 +193,45 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         """Валидация ингредиентов."""
         return validate_ingredients(value)
 
+    def check_written_ingredients(self):
+        """Проверяет ссылки на ингредиенты сразу после записи.
+
+        Снимок справочника, по которому шла валидация, может ещё не знать
+        об ингредиенте, удалённом другим процессом. Внешние ключи
+        проверяются отложенно, и без этой проверки ошибка всплыла бы при
+        фиксации транзакции как 500.
+        """
+        try:
+            connection.check_constraints(
+                table_names=[RecipeIngredient._meta.db_table]
+            )
+        except IntegrityError:
+            expire_catalog()
+            raise serializers.ValidationError({
+                'ingredients': ['Некоторые ингредиенты были удалены.']
+            })
+
+    @transaction.atomic
     def create(self, validated_data):
-        """Создание рецепта с ингредиентами."""
+        """Создание рецепта с ингредиентами одним INSERT."""
         ingredients_data = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(
             author=self.context['request'].user,
             **validated_data
         )
-        for ingredient_data in ingredients_data:
-            RecipeIngredient.objects.create(
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
                 recipe=recipe,
                 ingredient_id=ingredient_data['id'],
                 amount=ingredient_data['amount']
             )
+            for ingredient_data in ingredients_data
+        )
+        self.check_written_ingredients()
+        record_pantry_changes([recipe.pk])
+        schedule_image_variants(
+            generate_recipe_image_variants, recipe.pk, recipe.image.name
+        )
         return recipe
 
     def to_representation(self, instance):
@@ -137,8 +241,9 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 
 class RecipeUpdateSerializer(RecipeCreateSerializer):
     """Сериализатор для обновления рецепта."""
-    image = Base64ImageField(required=False)
+    image = ImageUploadField(required=False)
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Обновление рецепта с ингредиентами."""
         ingredients_data = validated_data.pop('ingredients', None)
@@ -146,18 +251,76 @@ class RecipeUpdateSerializer(RecipeCreateSerializer):
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
+        if 'image' in validated_data:
+            reset_image_variants(instance, 'image_variants')
+            schedule_image_variants(
+                generate_recipe_image_variants,
+                instance.pk,
+                instance.image.name
+            )
 
         if ingredients_data is not None:
-            instance.recipe_ingredients.all().delete()
-            for ingredient_data in ingredients_data:
-                RecipeIngredient.objects.create(
-                    recipe=instance,
-                    ingredient_id=ingredient_data['id'],
-                    amount=ingredient_data['amount']
-                )
+            self.update_ingredients(instance, ingredients_data)
 
         return instance
 
+    def update_ingredients(self, instance, ingredients_data):
+        """Применяет к ингредиентам рецепта только разницу.
+
+        Новые строки вставляются, изменённые количества обновляются,
+        лишние строки удаляются — каждое действие одним запросом.
+        """
+        existing = {
+            item.ingredient_id: item
+            for item in RecipeIngredient.objects.filter(recipe=instance)
+        }
+        old_amounts = {
+            ingredient_id: item.amount
+            for ingredient_id, item in existing.items()
+        }
+        new_amounts = {
+            item['id']: item['amount'] for item in ingredients_data
+        }
+
+        to_create = [
+            RecipeIngredient(
+                recipe=instance,
+                ingredient_id=ingredient_id,
+                amount=amount
+            )
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in existing
+        ]
+        to_update = []
+        for ingredient_id, item in existing.items():
+            amount = new_amounts.get(ingredient_id)
+            if amount is not None and amount != item.amount:
+                item.amount = amount
+                to_update.append(item)
+        to_delete = [
+            item.pk for ingredient_id, item in existing.items()
+            if ingredient_id not in new_amounts
+        ]
+
+        if to_delete:
+            RecipeIngredient.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+            self.check_written_ingredients()
+        if to_create or to_delete:
+            record_pantry_changes(
+                [instance.pk],
+                [
+                    (instance.pk, ingredient_id)
+                    for ingredient_id in existing
+                    if ingredient_id not in new_amounts
+                ]
+            )
+
+        update_recipe_in_shopping_lists(instance, old_amounts, new_amounts)
+
 
 class RecipeMinifiedSerializer(serializers.ModelSerializer):
     """Сериализатор для краткого отображения рецепта (для корзины и избранного)."""
@@ -173,7 +336,20 @@ class RecipeMinifiedSerializer(serializers.ModelSerializer):
         )
 
     def get_image(self, obj):
-        if obj.image:
-            return obj.image.url
-        return None
+        request = self.context.get('request')
+        return get_variant_url(
+            obj.image_variants, 'card', request=request
+        ) or get_media_resolver(request).file_url(obj.image.name)
+
+
+class PantryRecipeSerializer(RecipeMinifiedSerializer):
+    """Рецепт в поиске по продуктам: сколько совпало и чего не хватает."""
+    matched_count = serializers.IntegerField(read_only=True)
+    missing_count = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeMinifiedSerializer.Meta):
+        fields = RecipeMinifiedSerializer.Meta.fields + (
+            'matched_count',
+            'missing_count',
+        )
 
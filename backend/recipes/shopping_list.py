@@ -0,0 +1,209 @@
+"""Формирование и поддержка списка покупок.
+
+Суммы ингредиентов по корзине хранятся в ShoppingListItem и меняются
+на разницу при каждом изменении корзины или ингредиентов рецепта, поэтому
+выгрузка читает короткий, уже просуммированный список. Корзина
+учитывается сигналами ShoppingCart (recipes/signals.py), ингредиенты —
+сериализаторами рецепта и RecipeIngredientAdmin.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Sum
+
+from ingredients.catalog import get_ingredient_info
+
+from .models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+User = get_user_model()
+
+SEPARATOR = '=' * 50
+
+
+def lock_users(user_ids):
+    """Блокирует строки пользователей в порядке id."""
+    list(
+        User.objects.select_for_update().filter(
+            pk__in=user_ids
+        ).order_by('pk').values_list('pk', flat=True)
+    )
+
+
+def get_recipe_amounts(recipe):
+    """Количества ингредиентов рецепта: {ingredient_id: amount}."""
+    return dict(
+        RecipeIngredient.objects.filter(recipe=recipe).values_list(
+            'ingredient_id', 'amount'
+        )
+    )
+
+
+def apply_shopping_list_deltas(user_ids, deltas):
+    """Прибавляет deltas {ingredient_id: amount} к спискам пользователей.
+
+    Строки пользователей блокируются, чтобы параллельные изменения
+    одного списка не потеряли слагаемые; позиции с нулевой суммой
+    удаляются.
+    """
+    deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in deltas.items() if delta
+    }
+    user_ids = sorted(set(user_ids))
+    if not user_ids or not deltas:
+        return
+
+    with transaction.atomic():
+        lock_users(user_ids)
+        existing = {
+            (item.user_id, item.ingredient_id): item
+            for item in ShoppingListItem.objects.filter(
+                user_id__in=user_ids,
+                ingredient_id__in=deltas
+            )
+        }
+        to_create, to_update, to_delete = [], [], []
+        for user_id in user_ids:
+            for ingredient_id, delta in deltas.items():
+                item = existing.get((user_id, ingredient_id))
+                if item is None:
+                    if delta > 0:
+                        to_create.append(ShoppingListItem(
+                            user_id=user_id,
+                            ingredient_id=ingredient_id,
+                            total_amount=delta
+                        ))
+                    continue
+                item.total_amount += delta
+                if item.total_amount > 0:
+                    to_update.append(item)
+                else:
+                    to_delete.append(item.pk)
+
+        ShoppingListItem.objects.bulk_create(to_create, batch_size=1000)
+        ShoppingListItem.objects.bulk_update(
+            to_update,
+            ['total_amount'],
+            batch_size=1000
+        )
+        if to_delete:
+            ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+
+
+def add_recipe_to_shopping_list(user_id, recipe):
+    """Учитывает добавление рецепта в корзину пользователя.
+
+    Количества читаются под блокировкой строки пользователя, как и при
+    любом другом изменении его списка.
+    """
+    with transaction.atomic():
+        lock_users([user_id])
+        apply_shopping_list_deltas([user_id], get_recipe_amounts(recipe))
+
+
+def remove_recipe_from_shopping_list(user_id, recipe):
+    """Учитывает удаление рецепта из корзины пользователя."""
+    with transaction.atomic():
+        lock_users([user_id])
+        apply_shopping_list_deltas([user_id], {
+            ingredient_id: -amount
+            for ingredient_id, amount in get_recipe_amounts(recipe).items()
+        })
+
+
+def update_recipe_in_shopping_lists(recipe, old_amounts, new_amounts):
+    """Переносит изменение ингредиентов рецепта во все списки покупок."""
+    deltas = {
+        ingredient_id: new_amounts.get(ingredient_id, 0)
+        - old_amounts.get(ingredient_id, 0)
+        for ingredient_id in set(old_amounts) | set(new_amounts)
+    }
+    if not any(deltas.values()):
+        return
+    user_ids = ShoppingCart.objects.filter(recipe=recipe).values_list(
+        'user_id', flat=True
+    )
+    apply_shopping_list_deltas(user_ids, deltas)
+
+
+def compute_shopping_list_totals(user_ids):
+    """Суммы по корзинам, посчитанные заново.
+
+    Возвращает {(user_id, ingredient_id): total}.
+    """
+    totals = ShoppingCart.objects.filter(user_id__in=user_ids).values_list(
+        'user_id',
+        'recipe__recipe_ingredients__ingredient_id'
+    ).annotate(
+        total=Sum('recipe__recipe_ingredients__amount')
+    ).order_by()
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in totals
+        if ingredient_id is not None
+    }
+
+
+def rebuild_shopping_lists(user_ids):
+    """Пересчитывает списки покупок пользователей по их корзинам."""
+    totals = compute_shopping_list_totals(user_ids)
+    with transaction.atomic():
+        ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+        ShoppingListItem.objects.bulk_create(
+            (
+                ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=total
+                )
+                for (user_id, ingredient_id), total in totals.items()
+            ),
+            batch_size=1000
+        )
+
+
+def aggregate_shopping_list_rows(user):
+    """Суммы ингредиентов корзины одним GROUP BY по рецептам.
+
+    Считается на лету без ShoppingListItem; используется для проверки
+    материализованного списка.
+    """
+    rows = RecipeIngredient.objects.filter(
+        recipe__shopping_cart__user=user
+    ).values_list(
+        'ingredient__name',
+        'ingredient__measurement_unit'
+    ).annotate(
+        total=Sum('amount')
+    ).order_by()
+    return sorted(rows)
+
+
+def get_shopping_list_rows(user):
+    """Список покупок пользователя из ShoppingListItem.
+
+    Названия и единицы берутся из справочника ингредиентов в памяти.
+    Возвращает список (название, единица, количество), отсортированный
+    так же, как раньше сортировался словарь в Python.
+    """
+    totals = dict(
+        ShoppingListItem.objects.filter(user=user).values_list(
+            'ingredient_id', 'total_amount'
+        )
+    )
+    info = get_ingredient_info(totals)
+    return sorted(
+        (*info[ingredient_id], total)
+        for ingredient_id, total in totals.items()
+    )
+
+
+def render_shopping_list(rows):
+    """Построчно выдаёт текст списка покупок."""
+    yield 'Список покупок:\n'
+    yield SEPARATOR + '\n\n'
+    count = 0
+    for name, unit, amount in rows:
+        count += 1
+        yield f'{name} ({unit}) - {amount}\n'
+    yield '\n' + SEPARATOR
+    yield f'\nВсего ингредиентов: {count}'
@@ -0,0 +1,252 @@
+"""Сигналы приложения рецептов."""
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from foodgram.counters import change_counter
+from ingredients.models import Ingredient
+from users.models import Subscription
+
+from .caching import (
+    invalidate_author,
+    invalidate_ingredients,
+    invalidate_recipe,
+)
+from .feed import (
+    is_materialized,
+    mark_feed_stale,
+    schedule_feed_task,
+    trim_feed,
+)
+from .pantry import record_changes as record_pantry_changes
+from .models import (
+    Favorite,
+    Recipe,
+    RecipeIngredient,
+    RecipeRanking,
+    ShoppingCart,
+)
+from .ranking import get_publish_scores
+from .search import is_supported as search_is_supported
+from .search import update_search_vectors
+from .shopping_list import (
+    add_recipe_to_shopping_list,
+    get_recipe_amounts,
+    remove_recipe_from_shopping_list,
+    update_recipe_in_shopping_lists,
+)
+from .tasks import backfill_feed_task, fan_out_recipe_task
+from .viewer_state import invalidate_viewer_state
+
+User = get_user_model()
+
+# Поля пользователя, которые не попадают в ответы API рецептов
+USER_PRIVATE_FIELDS = {'last_login', 'password'}
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def reset_viewer_state(sender, instance, **kwargs):
+    """Сбрасывает кэш флагов пользователя при изменении его связей."""
+    invalidate_viewer_state(instance.user_id)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def update_recipe_counters(sender, instance, signal, created=False,
+                           **kwargs):
+    """Обновляет счётчики избранного и корзины у рецепта."""
+    if signal is post_save and not created:
+        return
+    field = (
+        'favorites_count' if sender is Favorite else 'shopping_cart_count'
+    )
+    delta = 1 if created else -1
+    change_counter(Recipe, instance.recipe_id, field, delta)
+
+
+def is_deleted_with(origin, *models):
+    """Удаление начато с объекта или выборки одной из моделей models."""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, models)
+
+
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def update_shopping_list(sender, instance, signal, created=False,
+                         origin=None, **kwargs):
+    """Прибавляет рецепт к списку покупок или вычитает из него.
+
+    При удалении рецепта списки уже поправил
+    remove_recipe_from_shopping_lists, а при удалении пользователя его
+    список удаляется целиком.
+    """
+    if signal is post_save:
+        if created:
+            add_recipe_to_shopping_list(instance.user_id, instance.recipe_id)
+        return
+    if not is_deleted_with(origin, Recipe, User):
+        remove_recipe_from_shopping_list(
+            instance.user_id, instance.recipe_id
+        )
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def update_subscription_counters(sender, instance, signal, created=False,
+                                 **kwargs):
+    """Обновляет счётчики подписчиков автора и подписок пользователя."""
+    if signal is post_save and not created:
+        return
+    delta = 1 if created else -1
+    change_counter(User, instance.author_id, 'subscribers_count', delta)
+    change_counter(User, instance.user_id, 'subscriptions_count', delta)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def update_author_recipes_count(sender, instance, signal, created=False,
+                                **kwargs):
+    """Обновляет счётчик рецептов автора."""
+    if signal is post_save and not created:
+        return
+    delta = 1 if created else -1
+    change_counter(User, instance.author_id, 'recipes_count', delta)
+
+
+@receiver(post_save, sender=Recipe)
+def create_recipe_ranking(sender, instance, created, **kwargs):
+    """Заводит оценки нового рецепта с вкладом самой публикации."""
+    if created:
+        RecipeRanking.objects.create(
+            recipe=instance, **get_publish_scores(instance.created)
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_new_recipe(sender, instance, created, **kwargs):
+    """Раскладывает новый рецепт по лентам подписчиков в фоне."""
+    if created:
+        schedule_feed_task(fan_out_recipe_task, instance.pk)
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def update_subscriber_feed(sender, instance, signal, created=False,
+                           **kwargs):
+    """Дополняет или очищает хранимую ленту подписчика.
+
+    Выполняется после update_subscription_counters, поэтому счётчик
+    подписок уже учитывает изменение. Если лента только что стала
+    хранимой, она строится целиком; если перестала — удаляется. Если
+    задачу не удалось поставить, лента собирается при чтении, пока её
+    не построит следующая задача или rebuild_feeds.
+    """
+    if signal is post_save and not created:
+        return
+    count = User.objects.filter(pk=instance.user_id).values_list(
+        'subscriptions_count', flat=True
+    ).first()
+    if count is None:
+        return
+    if signal is post_delete:
+        if is_materialized(count):
+            trim_feed(instance.user_id, instance.author_id)
+        elif is_materialized(count + 1):
+            trim_feed(instance.user_id)
+        return
+    if is_materialized(count):
+        author_id = instance.author_id if is_materialized(count - 1) else None
+        schedule_feed_task(
+            backfill_feed_task, instance.user_id, author_id,
+            on_error=partial(mark_feed_stale, instance.user_id)
+        )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def reset_recipe_cache(sender, instance, **kwargs):
+    """Сбрасывает кэш рецепта при его изменении.
+
+    Ингредиенты рецепта меняются пачками без сигналов, поэтому код,
+    изменяющий их, сохраняет и сам рецепт (см. RecipeUpdateSerializer
+    и RecipeIngredientAdmin).
+    """
+    invalidate_recipe(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def refresh_search_vector(sender, instance, **kwargs):
+    """Пересчитывает поисковый вектор рецепта после фиксации транзакции.
+
+    К этому моменту ингредиенты рецепта уже записаны.
+    """
+    if not search_is_supported():
+        return
+    transaction.on_commit(lambda: update_search_vectors([instance.pk]))
+
+
+@receiver(post_save, sender=Ingredient)
+def refresh_search_vectors_for_ingredient(sender, instance, created,
+                                          **kwargs):
+    """Переименование ингредиента меняет векторы рецептов с ним."""
+    if created or not search_is_supported():
+        return
+    recipe_ids = list(
+        RecipeIngredient.objects.filter(
+            ingredient=instance
+        ).values_list('recipe_id', flat=True)
+    )
+    if recipe_ids:
+        transaction.on_commit(lambda: update_search_vectors(recipe_ids))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def reset_ingredients_cache(sender, instance, **kwargs):
+    """Сбрасывает кэш рецептов при изменении справочника ингредиентов."""
+    invalidate_ingredients()
+
+
+@receiver(post_save, sender=User)
+def reset_author_cache(sender, instance, created, update_fields=None,
+                       **kwargs):
+    """Сбрасывает кэш рецептов при изменении профиля их автора."""
+    if created:
+        return
+    if update_fields and set(update_fields) <= USER_PRIVATE_FIELDS:
+        return
+    if Recipe.objects.filter(author_id=instance.pk).exists():
+        invalidate_author(instance.pk)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(sender, instance, **kwargs):
+    """Вычитает удаляемый рецепт из списков покупок пользователей.
+
+    Выполняется до каскадного удаления корзин и ингредиентов рецепта.
+    """
+    update_recipe_in_shopping_lists(instance, get_recipe_amounts(instance), {})
+
+
+@receiver(pre_delete, sender=Recipe)
+@receiver(pre_delete, sender=Ingredient)
+def remove_from_pantry_index(sender, instance, **kwargs):
+    """Отмечает для индекса продуктов рецепты, теряющие ингредиенты.
+
+    Выполняется до каскадного удаления строк RecipeIngredient.
+    """
+    field = 'recipe' if sender is Recipe else 'ingredient'
+    record_pantry_changes(removed=RecipeIngredient.objects.filter(
+        **{field: instance}
+    ).values_list('recipe_id', 'ingredient_id'))
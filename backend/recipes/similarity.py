@@ -0,0 +1,191 @@
+"""Похожие рецепты по общим ингредиентам.
+
+Рецепты — строки разреженной матрицы рецепт×ингредиент из нулей и
+единиц. Число общих ингредиентов блока рецептов со всеми остальными
+считается одним произведением X[блок] · Xᵀ, по нему векторно
+вычисляется косинусная мера или коэффициент Жаккара, и для каждой
+строки выбираются RECIPE_SIMILAR_COUNT лучших соседей.
+
+Задача пересчитывает только изменившиеся рецепты и те, на чьи списки
+изменения могли повлиять: список содержал изменённый или удалённый
+рецепт, или изменённый рецепт теперь похож сильнее последнего соседа.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from scipy import sparse
+
+from .models import Recipe, RecipeIngredient, RecipeNeighbour, SimilarityState
+
+METRICS = ('cosine', 'jaccard')
+
+
+def load_matrix():
+    """id рецептов (по возрастанию) и матрица рецепт×ингредиент (CSR)."""
+    recipe_ids = np.fromiter(
+        Recipe.objects.order_by('pk').values_list('pk', flat=True),
+        dtype=np.int64
+    )
+    pairs = np.array(
+        list(RecipeIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ).iterator(chunk_size=10000)),
+        dtype=np.int64
+    ).reshape(-1, 2)
+    rows, known = find_rows(recipe_ids, pairs[:, 0])
+    # Ингредиенты рецептов, созданных после выборки id, не учитываются
+    rows, ingredients = rows[known], pairs[known, 1]
+    _, columns = np.unique(ingredients, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+        shape=(len(recipe_ids), columns.max(initial=-1) + 1)
+    )
+    return recipe_ids, matrix
+
+
+def find_rows(recipe_ids, ids):
+    """Номера строк для id и маска id, которые есть в матрице."""
+    ids = np.asarray(ids, dtype=np.int64)
+    rows = np.searchsorted(recipe_ids, ids)
+    known = rows < len(recipe_ids)
+    known[known] = recipe_ids[rows[known]] == ids[known]
+    return rows, known
+
+
+def get_similarities(matrix, sizes, rows, metric):
+    """Сходство рецептов rows со всеми рецептами (len(rows)×N, CSR).
+
+    Пары без общих ингредиентов и сам рецепт в результат не попадают.
+    """
+    common = (matrix[rows] @ matrix.T).tocsr()
+    row_index = np.repeat(np.arange(len(rows)), np.diff(common.indptr))
+    first = sizes[rows][row_index]
+    second = sizes[common.indices]
+    if metric == 'jaccard':
+        common.data = common.data / (first + second - common.data)
+    else:
+        common.data = common.data / np.sqrt(first * second)
+    common.data[common.indices == rows[row_index]] = 0
+    common.eliminate_zeros()
+    return common
+
+
+def get_top_neighbours(similarities, recipe_ids, count):
+    """Для каждой строки — [(id соседа, сходство)] по убыванию сходства.
+
+    При равном сходстве выше рецепт с большим id (более новый).
+    """
+    result = []
+    for index in range(similarities.shape[0]):
+        start, end = similarities.indptr[index:index + 2]
+        scores = similarities.data[start:end]
+        ids = recipe_ids[similarities.indices[start:end]]
+        if len(scores) > count:
+            # Кандидаты — не хуже count-го, включая равные ему
+            threshold = np.partition(scores, len(scores) - count)[
+                len(scores) - count
+            ]
+            candidates = scores >= threshold
+            scores, ids = scores[candidates], ids[candidates]
+        order = np.lexsort((-ids, -scores))[:count]
+        result.append(list(zip(ids[order].tolist(), scores[order].tolist())))
+    return result
+
+
+def _get_last_scores(recipe_ids, count):
+    """Сходство последнего соседа для каждой строки (0 — список неполон)."""
+    last = np.zeros(len(recipe_ids), dtype=np.float32)
+    pairs = np.array(
+        RecipeNeighbour.objects.filter(
+            rank=count - 1, neighbour__isnull=False
+        ).values_list('recipe_id', 'score'),
+        dtype=np.float64
+    ).reshape(-1, 2)
+    rows, known = find_rows(recipe_ids, pairs[:, 0])
+    last[rows[known]] = pairs[known, 1]
+    return last
+
+
+def get_stale_rows(recipe_ids, matrix, sizes, changed_ids, metric, count):
+    """Строки рецептов, чьи списки нужно пересчитать."""
+    rows, known = find_rows(recipe_ids, changed_ids)
+    changed_rows = rows[known]
+    stale = set(changed_rows.tolist())
+    listed = RecipeNeighbour.objects.filter(
+        Q(neighbour__isnull=True) | Q(neighbour_id__in=changed_ids)
+    ).values_list('recipe_id', flat=True).distinct()
+    rows, known = find_rows(recipe_ids, list(listed))
+    stale.update(rows[known].tolist())
+    if not len(changed_rows):
+        return sorted(stale)
+
+    last = _get_last_scores(recipe_ids, count)
+    chunk_size = settings.RECIPE_SIMILAR_CHUNK_SIZE
+    for start in range(0, len(changed_rows), chunk_size):
+        similarities = get_similarities(
+            matrix, sizes, changed_rows[start:start + chunk_size], metric
+        )
+        best = similarities.max(axis=0).toarray().ravel()
+        stale.update(np.flatnonzero(best > last).tolist())
+    return sorted(stale)
+
+
+def _write_neighbours(recipe_ids, neighbours):
+    RecipeNeighbour.objects.filter(recipe_id__in=recipe_ids).delete()
+    RecipeNeighbour.objects.bulk_create(
+        [
+            RecipeNeighbour(
+                recipe_id=recipe_id,
+                neighbour_id=neighbour_id,
+                rank=rank,
+                score=score,
+            )
+            for recipe_id, items in zip(recipe_ids, neighbours)
+            for rank, (neighbour_id, score) in enumerate(items)
+        ],
+        batch_size=1000,
+    )
+
+
+@transaction.atomic
+def refresh_similar_recipes(full=False):
+    """Пересчитывает списки похожих рецептов; возвращает их число.
+
+    Первый запуск и full=True пересчитывают все рецепты.
+    """
+    metric = settings.RECIPE_SIMILAR_METRIC
+    if metric not in METRICS:
+        raise ValueError(f'Неизвестная мера сходства: {metric}')
+    count = settings.RECIPE_SIMILAR_COUNT
+    until = timezone.now()
+    state, _ = SimilarityState.objects.select_for_update().get_or_create(
+        pk=1
+    )
+    recipe_ids, matrix = load_matrix()
+    sizes = np.asarray(matrix.sum(axis=1)).ravel()
+
+    if full or state.computed_until is None:
+        stale_rows = np.arange(len(recipe_ids))
+        RecipeNeighbour.objects.all().delete()
+    else:
+        changed_ids = list(Recipe.objects.filter(
+            updated__gt=state.computed_until
+        ).values_list('pk', flat=True))
+        stale_rows = np.asarray(get_stale_rows(
+            recipe_ids, matrix, sizes, changed_ids, metric, count
+        ), dtype=np.int64)
+
+    chunk_size = settings.RECIPE_SIMILAR_CHUNK_SIZE
+    for start in range(0, len(stale_rows), chunk_size):
+        rows = stale_rows[start:start + chunk_size]
+        similarities = get_similarities(matrix, sizes, rows, metric)
+        _write_neighbours(
+            recipe_ids[rows].tolist(),
+            get_top_neighbours(similarities, recipe_ids, count)
+        )
+
+    state.computed_until = until
+    state.save()
+    return len(stale_rows)
@@ -1,8 +1,18 @@
 import os
 
 from celery import shared_task
+from django.conf import settings
 import requests
 
+from foodgram.images import get_variant_urls, process_image_variants
+
+from .caching import invalidate_recipe
+from .exports import delete_expired_exports, export_shopping_list
+from .feed import backfill_feed, fan_out_recipe
+from .models import Recipe
+from .pantry import apply_changes as apply_pantry_changes
+from .ranking import update_rankings
+
 
 @shared_task(bind=True)
 def hello_task(self, name: str = "world") -> dict:
@@ -59,4 +69,181 @@ def fetch_random_cocktail(self):
             "task_id": self.request.id,
         }
     except Exception as e:
-        raise self.retry(exc=e)
\ No newline at end of file
+        raise self.retry(exc=e)
+
+
+@shared_task(bind=True)
+def export_shopping_list_task(self, user_id: int, file_format: str) -> dict:
+    """
+    Строит файл списка покупок пользователя в фоне.
+
+    Если файл для такого же содержимого корзины уже есть в хранилище,
+    он используется повторно.
+
+    Returns:
+        dict с владельцем и именем файла; ссылку на скачивание выдаёт
+        только владельцу view задачи.
+    """
+    name = export_shopping_list(user_id, file_format)
+    return {
+        "user_id": user_id,
+        "format": file_format,
+        "file": name,
+        "task_id": self.request.id,
+    }
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(OSError,),
+    retry_kwargs={'max_retries': 3, 'countdown': 5}
+)
+def generate_recipe_image_variants(
+    self, recipe_id: int, image_name: str
+) -> dict:
+    """
+    Строит уменьшенные копии изображения рецепта в WebP и JPEG.
+
+    Args:
+        recipe_id: id рецепта.
+        image_name: Имя файла, для которого поставлена задача.
+
+    Returns:
+        dict с URL копий (None, если изображение уже сменилось).
+    """
+    variants = process_image_variants(
+        Recipe, recipe_id, 'image', 'image_variants', image_name,
+        settings.RECIPE_IMAGE_VARIANTS, settings.IMAGE_VARIANT_QUALITY
+    )
+    if variants is not None:
+        invalidate_recipe(recipe_id)
+    return {
+        "recipe_id": recipe_id,
+        "variants": get_variant_urls(variants),
+        "task_id": self.request.id,
+    }
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_kwargs={'max_retries': 3, 'countdown': 5}
+)
+def fan_out_recipe_task(self, recipe_id: int) -> dict:
+    """
+    Раскладывает новый рецепт по хранимым лентам подписчиков автора.
+
+    Повтор после сбоя безопасен: уже записанные строки пропускаются.
+
+    Args:
+        recipe_id: id рецепта.
+
+    Returns:
+        dict с числом лент.
+    """
+    return {
+        "recipe_id": recipe_id,
+        "feeds": fan_out_recipe(recipe_id),
+        "task_id": self.request.id,
+    }
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_kwargs={'max_retries': 3, 'countdown': 5}
+)
+def backfill_feed_task(self, user_id: int, author_id: int = None) -> dict:
+    """
+    Дополняет хранимую ленту рецептами автора после подписки.
+
+    Args:
+        user_id: id подписчика.
+        author_id: id автора; None — построить ленту заново.
+
+    Returns:
+        dict с числом добавленных записей.
+    """
+    return {
+        "user_id": user_id,
+        "author_id": author_id,
+        "entries": backfill_feed(user_id, author_id),
+        "task_id": self.request.id,
+    }
+
+
+@shared_task(bind=True)
+def update_recipe_rankings_task(self) -> dict:
+    """
+    Добавляет к рейтингам рецептов активность с прошлого запуска.
+
+    Запускается по расписанию Celery beat (beat_schedule в celeryconfig).
+
+    Returns:
+        dict с числом рецептов, чьи оценки изменились.
+    """
+    return {
+        "recipes": update_rankings(),
+        "task_id": self.request.id,
+    }
+
+
+@shared_task(bind=True)
+def refresh_similar_recipes_task(self, full: bool = False) -> dict:
+    """
+    Пересчитывает списки похожих рецептов для изменившихся рецептов.
+
+    Запускается по расписанию Celery beat (beat_schedule в celeryconfig).
+
+    Args:
+        full: Пересчитать списки всех рецептов.
+
+    Returns:
+        dict с числом пересчитанных списков.
+    """
+    # SciPy нужен только воркеру, веб-процессы его не загружают
+    from .similarity import refresh_similar_recipes
+
+    return {
+        "recipes": refresh_similar_recipes(full),
+        "task_id": self.request.id,
+    }
+
+
+@shared_task(bind=True)
+def apply_pantry_changes_task(self) -> dict:
+    """
+    Переносит изменения ингредиентов рецептов в индекс поиска по продуктам.
+
+    Запускается по расписанию Celery beat (beat_schedule в celeryconfig).
+    Изменения обрабатываются пачками, каждая в своей транзакции.
+
+    Returns:
+        dict с числом перенесённых рецептов.
+    """
+    recipes = 0
+    while True:
+        applied = apply_pantry_changes()
+        if not applied:
+            break
+        recipes += applied
+    return {
+        "recipes": recipes,
+        "task_id": self.request.id,
+    }
+
+
+@shared_task(bind=True)
+def delete_expired_exports_task(self) -> dict:
+    """
+    Удаляет файлы выгрузок списка покупок с истёкшими ссылками.
+
+    Запускается по расписанию Celery beat (beat_schedule в celeryconfig).
+
+    Returns:
+        dict с числом удалённых файлов.
+    """
+    return {
+        "files": delete_expired_exports(),
+        "task_id": self.request.id,
+    }
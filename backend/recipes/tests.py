@@ -0,0 +1,1975 @@
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from foodgram import celery_app
+from foodgram.media import get_media_resolver
+from foodgram.storage import get_image_storage
+from ingredients.catalog import get_catalog, reload_catalog
+from ingredients.models import Ingredient
+from recipes.caching import get_cache_stats
+from recipes.exports import get_export_storage
+from recipes.feed import backfill_feed
+from recipes.models import (
+    FeedEntry,
+    Favorite,
+    Recipe,
+    RecipeIngredient,
+    RecipePostings,
+    RecipePostingsChange,
+    RecipeRanking,
+    ShoppingCart,
+    ShoppingListItem,
+)
+from recipes.pantry import (
+    apply_changes,
+    decode_ids,
+    decode_lengths,
+    rebuild_index,
+)
+from recipes.ranking import update_rankings
+from recipes.search import update_search_vectors
+from recipes.shopping_list import (
+    aggregate_shopping_list_rows,
+    get_shopping_list_rows,
+    rebuild_shopping_lists,
+)
+from recipes.similarity import refresh_similar_recipes
+from recipes.tasks import (
+    delete_expired_exports_task,
+    export_shopping_list_task,
+    generate_recipe_image_variants,
+)
+from users.models import Subscription
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (2, 2), 'white').save(buffer, 'PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+class RecipeListQueryTest(APITestCase):
+    """Список рецептов: число запросов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user(
+            username='viewer',
+            email='viewer@example.com',
+            password='password',
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.viewer)
+
+    def add_recipes(self, count):
+        start = Recipe.objects.count()
+        for number in range(start, start + count):
+            author = User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+                password='password',
+            )
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=self.ingredient, amount=1
+            )
+            if number % 2:
+                Favorite.objects.create(user=self.viewer, recipe=recipe)
+                ShoppingCart.objects.create(user=self.viewer, recipe=recipe)
+                Subscription.objects.create(user=self.viewer, author=author)
+
+    def get_list(self):
+        # Без кэша: фрагменты рецептов и множества id читаются из БД
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/recipes/?limit=100')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data['results'], len(context.captured_queries)
+
+    def test_query_count_is_constant(self):
+        self.add_recipes(3)
+        few, few_queries = self.get_list()
+        self.add_recipes(12)
+        many, many_queries = self.get_list()
+        self.assertEqual(len(few), 3)
+        self.assertEqual(len(many), 15)
+        self.assertEqual(few_queries, many_queries)
+
+        for recipe in many:
+            odd = int(recipe['name'].split()[-1]) % 2 == 1
+            self.assertEqual(recipe['is_favorited'], odd)
+            self.assertEqual(recipe['is_in_shopping_cart'], odd)
+            self.assertEqual(recipe['author']['is_subscribed'], odd)
+            self.assertEqual(len(recipe['ingredients']), 1)
+
+
+class KeysetPaginationTest(APITestCase):
+    """Курсорная пагинация: ссылки вперёд и назад, границы, ошибки."""
+
+    URL = '/api/recipes/?pagination=cursor&limit=2'
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+        )
+        recipes = [
+            Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+            for number in range(5)
+        ]
+        # Три рецепта с одной датой: порядок между ними задаёт id
+        moment = timezone.now()
+        for offset, recipe in zip((0, 1, 1, 1, 2), recipes):
+            Recipe.objects.filter(pk=recipe.pk).update(
+                created=moment - timedelta(hours=offset)
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def get_page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        names = [recipe['name'] for recipe in response.data['results']]
+        return names, response.data['previous'], response.data['next']
+
+    def cursor(self, position, reverse=False):
+        recipe = Recipe.objects.order_by('-created', '-id')[position]
+        return self.encode([str(recipe.created), recipe.id], reverse)
+
+    def encode(self, values, reverse=False):
+        payload = json.dumps({'v': values, 'r': int(reverse)})
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def test_walk_forward_and_back(self):
+        pages, url = [], self.URL
+        while url:
+            names, previous, url = self.get_page(url)
+            self.assertEqual(previous is None, not pages)
+            pages.append(names)
+        self.assertEqual(pages, [
+            ['Рецепт 0', 'Рецепт 3'],
+            ['Рецепт 2', 'Рецепт 1'],
+            ['Рецепт 4'],
+        ])
+
+        # Назад от последней страницы — те же страницы в обратном порядке
+        backward, url = [], previous
+        while url:
+            names, url, following = self.get_page(url)
+            self.assertIsNotNone(following)
+            backward.append(names)
+        self.assertEqual(backward, pages[-2::-1])
+
+    def test_boundary_pages(self):
+        # Страница ровно до последнего рецепта: следующей нет
+        names, previous, following = self.get_page(
+            '/api/recipes/?pagination=cursor&limit=5'
+        )
+        self.assertEqual(len(names), 5)
+        self.assertIsNone(previous)
+        self.assertIsNone(following)
+
+        names, previous, following = self.get_page(
+            f'{self.URL}&cursor={self.cursor(3)}'
+        )
+        self.assertEqual(names, ['Рецепт 4'])
+        self.assertIsNotNone(previous)
+        self.assertIsNone(following)
+
+        # Назад от первого рецепта — пустая страница без ссылки назад
+        names, previous, following = self.get_page(
+            f'{self.URL}&cursor={self.cursor(0, reverse=True)}'
+        )
+        self.assertEqual(names, [])
+        self.assertIsNone(previous)
+
+    def test_invalid_cursors(self):
+        created = str(timezone.now())
+        for cursor in (
+            'garbage',
+            base64.urlsafe_b64encode(b'[1, 2]').decode(),
+            self.encode([created]),
+            self.encode([{'a': 1}, 1]),
+            self.encode([created, [1]]),
+            self.encode([created, None]),
+            self.encode([created, True]),
+            self.encode(['вчера', 1]),
+            self.encode([created, 'один']),
+            self.encode([created, 10 ** 30]),
+        ):
+            response = self.client.get(f'{self.URL}&cursor={cursor}')
+            self.assertEqual(response.status_code, 404, cursor)
+
+
+class RecipeSearchTest(APITestCase):
+    """Поиск рецептов: ранжирование и курсорная пагинация по рангу."""
+
+    URL = '/api/recipes/'
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+        )
+        tomato, = Ingredient.objects.bulk_create([
+            Ingredient(name='томат', measurement_unit='г'),
+        ])
+
+        def create(name, text='Описание'):
+            return Recipe.objects.create(
+                author=author,
+                name=name,
+                text=text,
+                cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+
+        cls.in_name = create('Суп томат')
+        cls.in_ingredients = create('Паста')
+        RecipeIngredient.objects.create(
+            recipe=cls.in_ingredients, ingredient=tomato, amount=100
+        )
+        # Одинаковый ранг: порядок между ними задаёт id
+        cls.in_text = [
+            create(f'Салат {number}', 'Нарезать томат кубиками')
+            for number in range(4)
+        ]
+        create('Хлеб')
+        update_search_vectors(
+            Recipe.objects.values_list('pk', flat=True)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def expected_ids(self):
+        """Название, затем ингредиенты, затем описание (новые выше)."""
+        return [self.in_name.id, self.in_ingredients.id] + [
+            recipe.id for recipe in reversed(self.in_text)
+        ]
+
+    def search(self, params):
+        response = self.client.get(self.URL, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_results_are_ranked(self):
+        data = self.search({'search': 'томат'})
+        self.assertEqual(data['count'], 6)
+        self.assertEqual(
+            [recipe['id'] for recipe in data['results']],
+            self.expected_ids()
+        )
+        self.assertEqual(self.search({'search': 'шоколад'})['count'], 0)
+
+    def test_cursor_pagination_follows_rank(self):
+        data = self.search({
+            'search': 'томат', 'pagination': 'cursor', 'limit': 3
+        })
+        pages = []
+        while True:
+            pages.append([recipe['id'] for recipe in data['results']])
+            if data['next'] is None:
+                break
+            data = self.client.get(data['next']).data
+        self.assertEqual(sum(pages, []), self.expected_ids())
+        self.assertEqual([len(page) for page in pages], [3, 3])
+
+        # Назад с последней страницы: та же первая страница
+        previous = self.client.get(data['previous']).data
+        self.assertEqual(
+            [recipe['id'] for recipe in previous['results']], pages[0]
+        )
+        self.assertIsNone(previous['previous'])
+
+
+class RecipeResponseCacheTest(APITestCase):
+    """Кэш ответов анонимам: попадания, промахи и сброс по версии."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author,
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/images/recipe.png',
+        )
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.ingredient, amount=1
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def assert_cache(self, url, expected):
+        self.assertEqual(self.get(url)['X-Cache'], expected, url)
+
+    def test_hits_and_misses(self):
+        detail = f'/api/recipes/{self.recipe.id}/'
+        for url in ('/api/recipes/', detail):
+            self.assert_cache(url, 'MISS')
+            self.assert_cache(url, 'HIT')
+        # Параметры запроса входят в ключ
+        self.assert_cache('/api/recipes/?limit=1', 'MISS')
+        self.assertEqual(get_cache_stats(), {'hits': 2, 'misses': 3})
+
+        output = io.StringIO()
+        call_command('recipe_cache_stats', reset=True, stdout=output)
+        self.assertIn('Доля попаданий: 40.0%', output.getvalue())
+        self.assertEqual(get_cache_stats(), {'hits': 0, 'misses': 0})
+
+        # Ответы пользователям с флагами не кэшируются
+        self.client.force_authenticate(self.author)
+        self.assertNotIn('X-Cache', self.get('/api/recipes/'))
+
+    def test_changes_invalidate_responses(self):
+        url = '/api/recipes/'
+        self.assert_cache(url, 'MISS')
+        changes = (
+            lambda: Recipe.objects.filter(pk=self.recipe.pk).first().save(),
+            lambda: Ingredient.objects.create(
+                name='Перец', measurement_unit='г'
+            ),
+            lambda: User.objects.filter(pk=self.author.pk).first().save(),
+        )
+        for change in changes:
+            self.assert_cache(url, 'HIT')
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.assert_cache(url, 'MISS')
+
+        # Новое имя видно сразу после сохранения
+        self.recipe.name = 'Новое имя'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.save()
+        response = self.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['name'], 'Новое имя')
+
+        # Вход в систему не меняет данные рецептов
+        self.assert_cache(url, 'MISS')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.save(update_fields=['last_login'])
+        self.assert_cache(url, 'HIT')
+
+
+class RecipeFragmentCacheTest(APITestCase):
+    """Кэш фрагментов рецептов и наложение флагов пользователя."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+            first_name='Автор',
+        )
+        cls.readers = [
+            User.objects.create_user(
+                username=f'reader{number}',
+                email=f'reader{number}@example.com',
+                password='password',
+            )
+            for number in range(2)
+        ]
+        cls.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author,
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/images/recipe.png',
+        )
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.ingredient, amount=1
+        )
+        Favorite.objects.create(user=cls.readers[0], recipe=cls.recipe)
+        Subscription.objects.create(user=cls.readers[1], author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_recipe(self, reader):
+        self.client.force_authenticate(reader)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200, response.content)
+        sql = ' '.join(query['sql'] for query in context.captured_queries)
+        return response.data['results'][0], sql
+
+    def test_fragment_is_shared_between_viewers(self):
+        first, sql = self.get_recipe(self.readers[0])
+        self.assertIn('recipes_recipeingredient', sql)
+        second, sql = self.get_recipe(self.readers[1])
+        self.assertNotIn('recipes_recipeingredient', sql)
+
+        self.assertEqual(
+            (first['is_favorited'], first['author']['is_subscribed']),
+            (True, False)
+        )
+        self.assertEqual(
+            (second['is_favorited'], second['author']['is_subscribed']),
+            (False, True)
+        )
+        for data in (first, second):
+            data.pop('is_favorited')
+            data['author'].pop('is_subscribed')
+        self.assertEqual(first, second)
+
+    def test_changes_rebuild_fragments(self):
+        self.get_recipe(self.readers[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = 'Повар'
+            self.author.save()
+            self.ingredient.name = 'Морская соль'
+            self.ingredient.save()
+        data, sql = self.get_recipe(self.readers[0])
+        self.assertIn('recipes_recipeingredient', sql)
+        self.assertEqual(data['author']['first_name'], 'Повар')
+        self.assertEqual(data['ingredients'][0]['name'], 'Морская соль')
+
+        # Флаги не хранятся во фрагменте и меняются без его сборки
+        with self.captureOnCommitCallbacks(execute=True):
+            ShoppingCart.objects.create(
+                user=self.readers[0], recipe=self.recipe
+            )
+        data, sql = self.get_recipe(self.readers[0])
+        self.assertNotIn('recipes_recipeingredient', sql)
+        self.assertTrue(data['is_in_shopping_cart'])
+
+
+class ConditionalRequestTest(APITestCase):
+    """ETag рецепта и профиля учитывает всё, что есть в ответе."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+        )
+        cls.reader = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='password',
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author,
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/images/recipe.png',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.recipe_url = f'/api/recipes/{self.recipe.id}/'
+        self.author_url = f'/api/users/{self.author.id}/'
+
+    def get(self, url, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(url, **headers)
+
+    def assert_not_modified(self, url, etag):
+        self.assertEqual(self.get(url, etag).status_code, 304)
+
+    def post(self, url, method='post'):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(url)
+        self.assertIn(response.status_code, (201, 204), response.content)
+
+    def test_anonymous_validators(self):
+        response = self.get(self.recipe_url)
+        self.assertIn('Last-Modified', response)
+        self.assert_not_modified(self.recipe_url, response['ETag'])
+        response = self.client.get(
+            self.recipe_url,
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.save()
+        self.assertEqual(
+            self.get(self.recipe_url, response['ETag']).status_code, 200
+        )
+
+    def test_viewer_changes_modify_etag(self):
+        self.client.force_authenticate(self.reader)
+        response = self.get(self.recipe_url)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        self.assert_not_modified(self.recipe_url, etag)
+
+        for url, field in (
+            (f'/api/users/{self.author.id}/subscribe/', 'is_subscribed'),
+            (f'{self.recipe_url}favorite/', 'is_favorited'),
+            (f'{self.recipe_url}shopping_cart/', 'is_in_shopping_cart'),
+        ):
+            self.post(url)
+            response = self.get(self.recipe_url, etag)
+            self.assertEqual(response.status_code, 200, url)
+            data = response.data
+            if field == 'is_subscribed':
+                data = data['author']
+            self.assertIs(data[field], True)
+            self.assertNotEqual(response['ETag'], etag)
+            etag = response['ETag']
+            self.assert_not_modified(self.recipe_url, etag)
+
+    def test_profile_etag_follows_subscription(self):
+        self.client.force_authenticate(self.reader)
+        etag = self.get(self.author_url)['ETag']
+        self.assert_not_modified(self.author_url, etag)
+        self.post(f'/api/users/{self.author.id}/subscribe/')
+        response = self.get(self.author_url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIs(response.data['is_subscribed'], True)
+
+
+class ShoppingListDownloadTest(APITestCase):
+    """Текстовый список покупок: суммы по корзине и потоковая выдача."""
+
+    URL = '/api/recipes/download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='buyer',
+            email='buyer@example.com',
+            password='password',
+        )
+        salt, flour, milk = Ingredient.objects.bulk_create([
+            Ingredient(name='Соль', measurement_unit='г'),
+            Ingredient(name='Мука', measurement_unit='г'),
+            Ingredient(name='Молоко', measurement_unit='мл'),
+        ])
+        for name, amounts in (
+            ('Блины', ((salt, 5), (flour, 200), (milk, 500))),
+            ('Хлеб', ((salt, 10), (flour, 500))),
+            ('Не в корзине', ((milk, 1000),)),
+        ):
+            recipe = Recipe.objects.create(
+                author=cls.user,
+                name=name,
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=amount
+                )
+                for ingredient, amount in amounts
+            )
+            if name != 'Не в корзине':
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        rebuild_shopping_lists([cls.user.id])
+
+    def setUp(self):
+        reload_catalog()
+        self.client.force_authenticate(self.user)
+
+    def test_download_sums_cart(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment', response['Content-Disposition'])
+        text = b''.join(response.streaming_content).decode()
+        self.assertIn(
+            'Молоко (мл) - 500\nМука (г) - 700\nСоль (г) - 15\n', text
+        )
+        self.assertTrue(text.endswith('Всего ингредиентов: 3'))
+        self.assertEqual(
+            get_shopping_list_rows(self.user),
+            aggregate_shopping_list_rows(self.user)
+        )
+
+    def test_empty_cart_and_anonymous(self):
+        ShoppingCart.objects.filter(user=self.user).delete()
+        rebuild_shopping_lists([self.user.id])
+        text = b''.join(
+            self.client.get(self.URL).streaming_content
+        ).decode()
+        self.assertTrue(text.endswith('Всего ингредиентов: 0'))
+
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.URL).status_code, 401)
+
+
+class ShoppingListItemTest(APITestCase):
+    """Суммы списка покупок меняются вместе с корзиной и рецептами."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='buyer',
+            email='buyer@example.com',
+            password='password',
+        )
+        cls.salt, cls.flour = Ingredient.objects.bulk_create([
+            Ingredient(name='Соль', measurement_unit='г'),
+            Ingredient(name='Мука', measurement_unit='г'),
+        ])
+        cls.recipes = []
+        for amounts in (((cls.salt, 5), (cls.flour, 200)), ((cls.salt, 10),)):
+            recipe = Recipe.objects.create(
+                author=cls.user,
+                name='Рецепт',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=amount
+                )
+                for ingredient, amount in amounts
+            )
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def totals(self):
+        return dict(
+            ShoppingListItem.objects.filter(user=self.user).values_list(
+                'ingredient_id', 'total_amount'
+            )
+        )
+
+    def cart(self, recipe, method='post'):
+        response = getattr(self.client, method)(
+            f'/api/recipes/{recipe.id}/shopping_cart/'
+        )
+        self.assertIn(response.status_code, (201, 204), response.content)
+
+    def test_cart_changes_apply_deltas(self):
+        first, second = self.recipes
+        self.cart(first)
+        self.cart(second)
+        self.assertEqual(
+            self.totals(), {self.salt.id: 15, self.flour.id: 200}
+        )
+        self.cart(first, method='delete')
+        self.assertEqual(self.totals(), {self.salt.id: 10})
+        second.delete()
+        self.assertEqual(self.totals(), {})
+
+    def test_admin_changes_apply_deltas(self):
+        first, second = self.recipes
+        admin_user = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password'
+        )
+        self.client.force_login(admin_user)
+
+        def post(url, data):
+            response = self.client.post(f'/admin/recipes/{url}', data)
+            self.assertEqual(response.status_code, 302, response.content)
+
+        post('shoppingcart/add/', {'user': self.user.id, 'recipe': first.id})
+        self.assertEqual(
+            self.totals(), {self.salt.id: 5, self.flour.id: 200}
+        )
+        salt_row = RecipeIngredient.objects.get(
+            recipe=first, ingredient=self.salt
+        )
+        post(f'recipeingredient/{salt_row.id}/change/', {
+            'recipe': first.id, 'ingredient': self.salt.id, 'amount': 7
+        })
+        self.assertEqual(
+            self.totals(), {self.salt.id: 7, self.flour.id: 200}
+        )
+        # Перенос строки в рецепт не из корзины убирает её из списка
+        post(f'recipeingredient/{salt_row.id}/change/', {
+            'recipe': second.id, 'ingredient': self.flour.id, 'amount': 1
+        })
+        self.assertEqual(self.totals(), {self.flour.id: 200})
+        post('recipeingredient/add/', {
+            'recipe': first.id, 'ingredient': self.salt.id, 'amount': 2
+        })
+        self.assertEqual(
+            self.totals(), {self.salt.id: 2, self.flour.id: 200}
+        )
+        flour_row = RecipeIngredient.objects.get(
+            recipe=first, ingredient=self.flour
+        )
+        post(f'recipeingredient/{flour_row.id}/delete/', {'post': 'yes'})
+        self.assertEqual(self.totals(), {self.salt.id: 2})
+        post('recipeingredient/', {
+            'action': 'delete_selected',
+            '_selected_action': list(
+                RecipeIngredient.objects.filter(
+                    recipe=first
+                ).values_list('pk', flat=True)
+            ),
+            'post': 'yes',
+        })
+        self.assertEqual(self.totals(), {})
+
+        post('shoppingcart/add/', {'user': self.user.id, 'recipe': second.id})
+        self.assertEqual(self.totals(), {self.salt.id: 10, self.flour.id: 1})
+        cart = ShoppingCart.objects.get(user=self.user, recipe=second)
+        post(f'shoppingcart/{cart.id}/delete/', {'post': 'yes'})
+        self.assertEqual(self.totals(), {})
+        rebuild_shopping_lists([self.user.id])
+        self.assertEqual(self.totals(), {})
+
+    def test_rebuild_command_repairs_drift(self):
+        for recipe in self.recipes:
+            self.cart(recipe)
+        ShoppingListItem.objects.filter(ingredient=self.salt).update(
+            total_amount=1
+        )
+        output = io.StringIO()
+        call_command('rebuild_shopping_lists', check=True, stdout=output)
+        self.assertIn(f'[{self.user.id}]', output.getvalue())
+        self.assertEqual(self.totals()[self.salt.id], 1)
+
+        call_command('rebuild_shopping_lists', stdout=io.StringIO())
+        self.assertEqual(
+            self.totals(), {self.salt.id: 15, self.flour.id: 200}
+        )
+        output = io.StringIO()
+        call_command('rebuild_shopping_lists', check=True, stdout=output)
+        self.assertIn('Расхождений нет', output.getvalue())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeIngredientWritesTest(APITestCase):
+    """Запись ингредиентов рецепта: число запросов и корректность diff."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+            first_name='Автор',
+            last_name='Рецептов',
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(20)
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Версии кэша меняются после фиксации транзакции, а в тестах её
+        # нет: без очистки id рецепта из прошлого теста попадёт в кэш
+        cache.clear()
+        # bulk_create не меняет версию справочника ингредиентов
+        reload_catalog()
+        self.client.force_authenticate(self.author)
+
+    def recipe_payload(self, amounts):
+        return {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': make_image(),
+            'ingredients': [
+                {'id': self.ingredients[index].id, 'amount': amount}
+                for index, amount in amounts.items()
+            ],
+        }
+
+    def create_recipe(self, amounts):
+        response = self.client.post(
+            '/api/recipes/',
+            self.recipe_payload(amounts),
+            format='json'
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return Recipe.objects.get(pk=response.data['id'])
+
+    def count_queries(self, method, url, payload):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(
+                url, payload, format='json'
+            )
+        self.assertIn(response.status_code, (200, 201), response.content)
+        return len(context.captured_queries)
+
+    def stored_amounts(self, recipe):
+        return {
+            ingredient_id: amount
+            for ingredient_id, amount in RecipeIngredient.objects.filter(
+                recipe=recipe
+            ).values_list('ingredient_id', 'amount')
+        }
+
+    def test_create_query_count_does_not_depend_on_ingredients(self):
+        # Первый запрос заполняет кеш состояния пользователя
+        self.create_recipe({0: 10})
+        few = self.count_queries(
+            'post', '/api/recipes/', self.recipe_payload({0: 10})
+        )
+        many = self.count_queries(
+            'post',
+            '/api/recipes/',
+            self.recipe_payload({index: 10 for index in range(20)})
+        )
+        self.assertEqual(few, many)
+
+    def test_update_query_count_does_not_depend_on_ingredients(self):
+        small = self.create_recipe({0: 10, 1: 10})
+        large = self.create_recipe({index: 10 for index in range(10)})
+
+        # Изменение, добавление и удаление строк в обоих рецептах
+        few = self.count_queries(
+            'patch',
+            f'/api/recipes/{small.id}/',
+            self.recipe_payload({0: 20, 2: 10})
+        )
+        many = self.count_queries(
+            'patch',
+            f'/api/recipes/{large.id}/',
+            self.recipe_payload(
+                {**{index: 20 for index in range(5)},
+                 **{index: 10 for index in range(10, 20)}}
+            )
+        )
+        self.assertEqual(few, many)
+
+    def test_create_from_multipart(self):
+        payload = self.recipe_payload({0: 10, 1: 20})
+        payload['image'] = SimpleUploadedFile(
+            'recipe.png',
+            base64.b64decode(payload['image'].split(';base64,')[1])
+        )
+        payload['ingredients'] = json.dumps(payload['ingredients'])
+
+        response = self.client.post(
+            '/api/recipes/', payload, format='multipart'
+        )
+
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(
+            self.stored_amounts(Recipe.objects.get(pk=response.data['id'])),
+            {self.ingredients[0].id: 10, self.ingredients[1].id: 20}
+        )
+
+    def test_update_applies_diff(self):
+        recipe = self.create_recipe({0: 10, 1: 10, 2: 10})
+        unchanged = RecipeIngredient.objects.get(
+            recipe=recipe, ingredient=self.ingredients[0]
+        )
+
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/',
+            self.recipe_payload({0: 10, 1: 50, 3: 5}),
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.stored_amounts(recipe), {
+            self.ingredients[0].id: 10,
+            self.ingredients[1].id: 50,
+            self.ingredients[3].id: 5,
+        })
+        self.assertTrue(
+            RecipeIngredient.objects.filter(pk=unchanged.pk).exists()
+        )
+
+    def test_update_keeps_shopping_lists_in_sync(self):
+        recipe = self.create_recipe({0: 10, 1: 10})
+        buyer = User.objects.create_user(
+            username='buyer',
+            email='buyer@example.com',
+            password='password',
+        )
+        self.client.force_authenticate(buyer)
+        self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.client.force_authenticate(self.author)
+
+        self.client.patch(
+            f'/api/recipes/{recipe.id}/',
+            self.recipe_payload({1: 30, 2: 5}),
+            format='json'
+        )
+
+        self.assertTrue(ShoppingCart.objects.filter(user=buyer).exists())
+        self.assertEqual(
+            get_shopping_list_rows(buyer),
+            aggregate_shopping_list_rows(buyer)
+        )
+
+    @override_settings(INGREDIENT_CATALOG_CHECK_INTERVAL=60)
+    def test_ingredient_deleted_after_snapshot(self):
+        recipe = self.create_recipe({0: 10})
+        deleted = self.ingredients[5]
+        get_catalog()
+        # Ингредиент удалил другой процесс: снимок о нём ещё не знает
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {Ingredient._meta.db_table} WHERE id = %s',
+                [deleted.pk]
+            )
+        self.assertIn(deleted.pk, get_catalog().ids)
+
+        response = self.client.post(
+            '/api/recipes/', self.recipe_payload({0: 10, 5: 10}),
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ingredients', response.data)
+        self.assertEqual(Recipe.objects.count(), 1)
+
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/',
+            self.recipe_payload({0: 10, 5: 10}),
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            self.stored_amounts(recipe), {self.ingredients[0].id: 10}
+        )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ContentAddressedImagesTest(APITestCase):
+    """Изображения с именами по содержимому и сборка мусора."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+
+    def setUp(self):
+        cache.clear()
+        reload_catalog()
+        self.client.force_authenticate(self.author)
+        self.storage = get_image_storage()
+
+    def create_recipe(self, image):
+        response = self.client.post('/api/recipes/', {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': image,
+            'ingredients': [{'id': self.ingredient.id, 'amount': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return Recipe.objects.get(pk=response.data['id'])
+
+    def test_identical_uploads_share_file(self):
+        image = make_image()
+        first = self.create_recipe(image)
+        second = self.create_recipe(image)
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(len(first.image.name.split('/')[-1]), 64 + 4)
+
+    def test_garbage_collection_keeps_referenced_files(self):
+        recipe = self.create_recipe(make_image())
+        orphan = self.storage.save(
+            'recipes/images/orphan.png', io.BytesIO(b'orphan')
+        )
+        fresh = self.storage.save(
+            'recipes/images/fresh.png', io.BytesIO(b'fresh')
+        )
+        old = time.time() - 2 * 3600
+        for name in (recipe.image.name, orphan):
+            os.utime(self.storage.path(name), (old, old))
+
+        call_command('collect_media_garbage', min_age=1, stdout=io.StringIO())
+
+        self.assertTrue(self.storage.exists(recipe.image.name))
+        self.assertFalse(self.storage.exists(orphan))
+        self.assertTrue(self.storage.exists(fresh))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ImageMetadataTest(APITestCase):
+    """EXIF удаляется при загрузке, копии строятся задачей."""
+
+    URL = '/api/recipes/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+
+    def setUp(self):
+        cache.clear()
+        reload_catalog()
+        for name, value in (
+            ('task_always_eager', True), ('broker_url', 'memory://')
+        ):
+            self.addCleanup(
+                setattr, celery_app.conf, name, getattr(celery_app.conf, name)
+            )
+            setattr(celery_app.conf, name, value)
+        self.client.force_authenticate(self.author)
+
+    def make_jpeg(self):
+        """JPEG 40x20 с координатами съёмки и поворотом на 90°."""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Camera'
+        exif.get_ifd(0x8825)[2] = (55.0, 45.0, 0.0)
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 20), 'red').save(buffer, 'JPEG', exif=exif)
+        return buffer.getvalue()
+
+    def create_recipe(self, image, format='json'):
+        data = {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': image,
+            'ingredients': [{'id': self.ingredient.id, 'amount': 1}],
+        }
+        if format == 'multipart':
+            data['ingredients'] = json.dumps(data['ingredients'])
+        # Задача копий не должна затронуть проверку оригинала
+        with mock.patch('recipes.serializers.schedule_image_variants'):
+            response = self.client.post(self.URL, data, format=format)
+        self.assertEqual(response.status_code, 201, response.content)
+        return Recipe.objects.get(pk=response.data['id'])
+
+    def open_image(self, name):
+        with get_image_storage().open(name, 'rb') as file:
+            image = Image.open(file)
+            image.load()
+        return image
+
+    def assert_clean(self, name):
+        image = self.open_image(name)
+        self.assertFalse(image.getexif())
+        self.assertNotIn('exif', image.info)
+        # Поворот применён к пикселям
+        self.assertEqual(image.size, (20, 40))
+
+    def test_base64_upload_is_stripped(self):
+        encoded = base64.b64encode(self.make_jpeg()).decode()
+        recipe = self.create_recipe(f'data:image/jpeg;base64,{encoded}')
+        self.assert_clean(recipe.image.name)
+
+    def test_multipart_upload_is_stripped(self):
+        upload = SimpleUploadedFile(
+            'photo.jpg', self.make_jpeg(), content_type='image/jpeg'
+        )
+        recipe = self.create_recipe(upload, format='multipart')
+        self.assert_clean(recipe.image.name)
+
+    def test_image_without_metadata_is_kept(self):
+        recipe = self.create_recipe(make_image())
+        self.assertEqual(self.open_image(recipe.image.name).size, (2, 2))
+
+    def test_variants(self):
+        recipe = self.create_recipe(make_image())
+        with self.captureOnCommitCallbacks(execute=True):
+            generate_recipe_image_variants.delay(
+                recipe.pk, recipe.image.name
+            )
+        recipe.refresh_from_db()
+        self.assertEqual(
+            set(recipe.image_variants), set(settings.RECIPE_IMAGE_VARIANTS)
+        )
+        for variant in recipe.image_variants.values():
+            self.assertEqual((variant['width'], variant['height']), (2, 2))
+            for extension, image_format in (
+                ('webp', 'WEBP'), ('jpeg', 'JPEG')
+            ):
+                image = self.open_image(variant[extension])
+                self.assertEqual(image.format, image_format)
+                self.assertFalse(image.getexif())
+
+        response = self.client.get(f'{self.URL}{recipe.pk}/')
+        self.assertTrue(
+            response.data['image_variants']['card']['webp'].endswith('.webp')
+        )
+
+
+class MediaUrlTest(APITestCase):
+    """URL медиафайлов: префикс по запросу, порт разработки и CDN."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+            avatar='users/avatars/face.png',
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author,
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/images/с пробелом.png',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def get_urls(self, **headers):
+        response = self.client.get(
+            f'/api/recipes/{self.recipe.pk}/', **headers
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data['image'], response.data['author']['avatar']
+
+    def test_urls_follow_request_host(self):
+        self.assertEqual(self.get_urls(), (
+            'http://testserver/media/recipes/images/'
+            '%D1%81%20%D0%BF%D1%80%D0%BE%D0%B1%D0%B5%D0%BB%D0%BE%D0%BC.png',
+            'http://testserver/media/users/avatars/face.png',
+        ))
+        # Ответ другому хосту не берётся из кэша первого
+        image, avatar = self.get_urls(HTTP_HOST='localhost:8000')
+        self.assertTrue(image.startswith('http://localhost:8080/media/'))
+        self.assertEqual(
+            avatar, 'http://localhost:8080/media/users/avatars/face.png'
+        )
+
+    @override_settings(MEDIA_PUBLIC_URL='https://cdn.example.com/')
+    def test_public_url(self):
+        image, avatar = self.get_urls()
+        self.assertTrue(image.startswith('https://cdn.example.com/media/'))
+        self.assertEqual(
+            avatar, 'https://cdn.example.com/media/users/avatars/face.png'
+        )
+
+    def test_resolver(self):
+        request = RequestFactory().get('/', secure=True)
+        resolver = get_media_resolver(request)
+        self.assertIs(get_media_resolver(request), resolver)
+        self.assertEqual(
+            resolver.file_url('a/b.png'), 'https://testserver/media/a/b.png'
+        )
+        self.assertIsNone(resolver.file_url(''))
+        self.assertEqual(
+            get_media_resolver().file_url('b.png'), '/media/b.png'
+        )
+
+
+class AdminChangelistQueryTest(APITestCase):
+    """Страницы списков админки: число запросов не зависит от таблиц."""
+
+    URLS = (
+        '/admin/recipes/recipe/',
+        '/admin/recipes/recipeingredient/',
+        '/admin/recipes/favorite/',
+        '/admin/recipes/shoppingcart/',
+        '/admin/users/user/',
+        '/admin/users/subscription/',
+        '/admin/ingredients/ingredient/',
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='password',
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        start = User.objects.count()
+        for number in range(start, start + count):
+            author = User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+                password='password',
+            )
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=self.ingredient, amount=1
+            )
+            Favorite.objects.create(user=self.admin, recipe=recipe)
+            ShoppingCart.objects.create(user=self.admin, recipe=recipe)
+            Subscription.objects.create(user=self.admin, author=author)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_query_count_is_constant(self):
+        self.add_rows(2)
+        few = [self.count_queries(url) for url in self.URLS]
+        self.add_rows(8)
+        self.assertEqual([self.count_queries(url) for url in self.URLS], few)
+
+    def test_annotated_counts_and_ordering(self):
+        self.add_rows(2)
+        response = self.client.get(
+            '/admin/ingredients/ingredient/?o=-4'
+        )
+        self.assertEqual(
+            response.context['cl'].result_list[0].recipes_count, 2
+        )
+        response = self.client.get('/admin/recipes/recipe/?o=8')
+        self.assertEqual(
+            [recipe.ingredients_count
+             for recipe in response.context['cl'].result_list],
+            [1, 1]
+        )
+
+    def test_autocomplete_filter(self):
+        self.add_rows(3)
+        author = User.objects.get(username='author2')
+        response = self.client.get(
+            f'/admin/recipes/recipe/?author__id__exact={author.id}'
+        )
+        self.assertEqual(
+            [recipe.author for recipe in response.context['cl'].result_list],
+            [author]
+        )
+        # В поле выбора только выбранный автор, а не все пользователи
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertContains(response, 'autocomplete_filter.js')
+        self.assertContains(response, '>author2</option>')
+        self.assertNotContains(response, '>author1</option>')
+
+
+class ShoppingListExportTest(APITestCase):
+    """Фоновая выгрузка списка покупок: форматы, статус задачи и доступ."""
+
+    URL = '/api/recipes/download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other = (
+            User.objects.create_user(
+                username=username,
+                email=f'{username}@example.com',
+                password='password',
+            )
+            for username in ('buyer', 'stranger')
+        )
+        salt, flour = Ingredient.objects.bulk_create([
+            Ingredient(name='Соль', measurement_unit='г'),
+            Ingredient(name='Мука', measurement_unit='г'),
+        ])
+        recipe = Recipe.objects.create(
+            author=cls.user,
+            name='Хлеб',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/images/recipe.png',
+        )
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=salt, amount=10),
+            RecipeIngredient(recipe=recipe, ingredient=flour, amount=500),
+        ])
+        ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        rebuild_shopping_lists([cls.user.id])
+
+    def setUp(self):
+        reload_catalog()
+        exports_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, exports_root, ignore_errors=True)
+        storages_setting = {
+            **settings.STORAGES,
+            'exports': {
+                'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                'OPTIONS': {'location': exports_root},
+            },
+        }
+        overrides = override_settings(STORAGES=storages_setting)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        for name, value in (
+            ('task_always_eager', True), ('broker_url', 'memory://')
+        ):
+            self.addCleanup(
+                setattr, celery_app.conf, name, getattr(celery_app.conf, name)
+            )
+            setattr(celery_app.conf, name, value)
+        # Результаты задач хранятся в базе Celery; в тестах их отдаёт
+        # словарь выполненных сразу задач
+        self.results = {}
+        delay = export_shopping_list_task.delay
+
+        def remember(*args):
+            result = delay(*args)
+            self.results[result.id] = result
+            return result
+
+        for target, replacement in (
+            ('recipes.views.export_shopping_list_task.delay', remember),
+            ('recipes.views.AsyncResult', self.results.__getitem__),
+        ):
+            patcher = mock.patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client.force_authenticate(self.user)
+
+    def start_export(self, file_format):
+        return self.client.post(
+            self.URL, {'format': file_format}, format='json'
+        )
+
+    def poll(self, task_id):
+        return self.client.get(f'/api/recipes/task/{task_id}/')
+
+    def export(self, file_format):
+        """Запускает выгрузку и возвращает ссылку из статуса задачи."""
+        response = self.start_export(file_format)
+        self.assertEqual(response.status_code, 202)
+        status = self.poll(response.data['task_id'])
+        self.assertEqual(status.status_code, 200)
+        self.assertEqual(status.data['status'], 'completed')
+        self.assertEqual(
+            set(status.data['result']), {'format', 'url'}
+        )
+        self.assertEqual(status.data['result']['format'], file_format)
+        return status.data['result']['url']
+
+    def download(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_formats(self):
+        text = self.download(self.export('txt')).decode()
+        self.assertIn('Мука (г) - 500\nСоль (г) - 10\n', text)
+
+        rows = self.download(self.export('csv')).decode().splitlines()
+        self.assertEqual(rows[0], 'Ингредиент,Единица измерения,Количество')
+        self.assertEqual(rows[1:], ['Мука,г,500', 'Соль,г,10'])
+
+        self.assertTrue(self.download(self.export('pdf')).startswith(b'%PDF'))
+
+        response = self.start_export('docx')
+        self.assertEqual(response.status_code, 400)
+
+    def test_unchanged_cart_reuses_file(self):
+        url = self.export('csv')
+        response = self.start_export('csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'completed')
+        self.assertEqual(set(response.data['result']), {'format', 'url'})
+        self.assertEqual(
+            self.download(response.data['result']['url']), self.download(url)
+        )
+
+    def test_pending_and_failed_tasks(self):
+        pending = mock.Mock(**{'ready.return_value': False})
+        failed = mock.Mock(**{
+            'ready.return_value': True, 'successful.return_value': False
+        })
+        self.results.update(pending=pending, failed=failed)
+        response = self.poll('pending')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data, {'status': 'pending'})
+        self.assertEqual(self.poll('failed').data, {'status': 'failed'})
+
+    def test_other_users_get_nothing(self):
+        url = self.export('txt')
+        task_id, = self.results
+
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.poll(task_id).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.client.force_authenticate(None)
+        self.assertEqual(self.poll(task_id).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+    def test_invalid_and_expired_links(self):
+        url = self.export('txt')
+        self.assertEqual(
+            self.client.get(self.URL, {'export': 'broken'}).status_code, 404
+        )
+        with override_settings(SHOPPING_LIST_EXPORT_LINK_MAX_AGE=-1):
+            self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_expired_files_are_deleted(self):
+        url = self.export('txt')
+        self.export('csv')
+        storage = get_export_storage()
+        directory = settings.SHOPPING_LIST_EXPORT_DIR
+        stale = time.time() - settings.SHOPPING_LIST_EXPORT_LINK_MAX_AGE - 60
+        for filename in storage.listdir(directory)[1]:
+            if filename.endswith('.csv'):
+                os.utime(storage.path(f'{directory}/{filename}'),
+                         (stale, stale))
+
+        self.assertEqual(delete_expired_exports_task.delay().get(), {
+            'files': 1, 'task_id': mock.ANY
+        })
+        files = storage.listdir(directory)[1]
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].endswith('.txt'))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_reused_file_outlives_new_link(self):
+        self.export('txt')
+        storage = get_export_storage()
+        directory = settings.SHOPPING_LIST_EXPORT_DIR
+        name = f'{directory}/{storage.listdir(directory)[1][0]}'
+        stale = time.time() - settings.SHOPPING_LIST_EXPORT_LINK_MAX_AGE - 60
+        os.utime(storage.path(name), (stale, stale))
+
+        response = self.start_export('txt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(delete_expired_exports_task.delay().get()['files'], 0)
+        self.download(response.data['result']['url'])
+
+
+@override_settings(FEED_FANOUT_MIN_SUBSCRIPTIONS=2)
+class SubscriptionFeedTest(APITestCase):
+    """Лента подписок: сборка при чтении и хранимая лента совпадают."""
+
+    FEED_URL = '/api/recipes/feed/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='password',
+        )
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+                password='password',
+            )
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        # Задачи ленты выполняются сразу при постановке; Celery 5.4
+        # и в этом режиме открывает соединение с брокером
+        for name, value in (
+            ('task_always_eager', True), ('broker_url', 'memory://')
+        ):
+            self.addCleanup(
+                setattr, celery_app.conf, name, getattr(celery_app.conf, name)
+            )
+            setattr(celery_app.conf, name, value)
+        self.client.force_authenticate(self.reader)
+
+    def publish(self, author, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Recipe.objects.create(
+                author=author,
+                name=name,
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+
+    def subscribe(self, author, method='post'):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(
+                f'/api/users/{author.id}/subscribe/'
+            )
+        self.assertIn(response.status_code, (201, 204), response.content)
+
+    def get_feed(self, query=''):
+        # Счётчик подписок читается из пользователя запроса
+        self.reader.refresh_from_db()
+        self.client.force_authenticate(self.reader)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'{self.FEED_URL}?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        sql = ' '.join(query['sql'] for query in context.captured_queries)
+        names = [recipe['name'] for recipe in response.data['results']]
+        return names, sql
+
+    def test_feed_switches_to_fan_out_on_write(self):
+        first, second, stranger = self.authors
+        self.publish(first, 'Первый 1')
+        self.publish(second, 'Второй 1')
+        self.publish(stranger, 'Чужой')
+        self.subscribe(first)
+        self.publish(first, 'Первый 2')
+
+        names, sql = self.get_feed()
+        self.assertEqual(names, ['Первый 2', 'Первый 1'])
+        self.assertNotIn('recipes_feedentry', sql)
+        self.assertFalse(FeedEntry.objects.exists())
+
+        # Вторая подписка достигает порога: лента строится целиком
+        self.subscribe(second)
+        self.publish(second, 'Второй 2')
+        names, sql = self.get_feed()
+        self.assertEqual(
+            names, ['Второй 2', 'Первый 2', 'Второй 1', 'Первый 1']
+        )
+        self.assertIn('recipes_feedentry', sql)
+        self.assertNotIn('JOIN "users_subscription"', sql)
+
+        names, _ = self.get_feed('pagination=cursor&limit=3')
+        self.assertEqual(names, ['Второй 2', 'Первый 2', 'Второй 1'])
+
+        # Отписка опускает ниже порога: хранимая лента удаляется
+        self.subscribe(first, method='delete')
+        self.assertFalse(FeedEntry.objects.exists())
+        names, _ = self.get_feed()
+        self.assertEqual(names, ['Второй 2', 'Второй 1'])
+
+    def test_trim_and_backfill_above_threshold(self):
+        for author in self.authors:
+            self.publish(author, author.username)
+            self.subscribe(author)
+        self.assertEqual(FeedEntry.objects.filter(user=self.reader).count(), 3)
+
+        self.subscribe(self.authors[0], method='delete')
+        names, _ = self.get_feed()
+        self.assertEqual(names, ['author2', 'author1'])
+
+        self.subscribe(self.authors[0])
+        names, _ = self.get_feed()
+        self.assertEqual(names, ['author2', 'author1', 'author0'])
+
+    def test_stored_feed_is_read_only_when_built(self):
+        first, second, _ = self.authors
+        self.publish(first, 'Первый')
+        self.publish(second, 'Второй')
+        self.subscribe(first)
+        # Брокер недоступен: задача построения ленты не поставлена
+        with mock.patch(
+            'recipes.signals.backfill_feed_task.delay',
+            side_effect=ConnectionError
+        ), self.assertLogs('recipes.feed', 'WARNING'):
+            self.subscribe(second)
+        names, sql = self.get_feed()
+        self.assertEqual(names, ['Второй', 'Первый'])
+        self.assertNotIn('recipes_feedentry', sql)
+        self.assertFalse(self.reader.feed_materialized)
+
+        call_command('rebuild_feeds', stdout=io.StringIO())
+        names, sql = self.get_feed()
+        self.assertEqual(names, ['Второй', 'Первый'])
+        self.assertIn('recipes_feedentry', sql)
+
+    def test_author_backfill_after_unsubscribe(self):
+        first, second, third = self.authors
+        for author in self.authors:
+            self.publish(author, author.username)
+        self.subscribe(first)
+        self.subscribe(second)
+        # Задача дополнения ленты выполняется уже после отписки
+        with mock.patch('recipes.signals.backfill_feed_task.delay'):
+            self.subscribe(third)
+        self.subscribe(third, method='delete')
+        self.assertEqual(backfill_feed(self.reader.id, third.id), 0)
+        self.assertEqual(
+            set(FeedEntry.objects.values_list('author_id', flat=True)),
+            {first.id, second.id}
+        )
+
+    def test_author_backfill_rebuilds_unbuilt_feed(self):
+        for author in self.authors:
+            self.publish(author, author.username)
+        with mock.patch('recipes.signals.backfill_feed_task.delay'):
+            for author in self.authors:
+                self.subscribe(author)
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(backfill_feed(self.reader.id, self.authors[2].id), 3)
+        names, sql = self.get_feed()
+        self.assertEqual(names, ['author2', 'author1', 'author0'])
+        self.assertIn('recipes_feedentry', sql)
+
+    def test_feed_requires_authentication(self):
+        self.client.force_authenticate(None)
+        response = self.client.get(self.FEED_URL)
+        self.assertEqual(response.status_code, 401)
+
+
+class RecipeRankingTest(APITestCase):
+    """Популярные и набирающие популярность рецепты из таблицы оценок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+        )
+        cls.readers = [
+            User.objects.create_user(
+                username=f'reader{number}',
+                email=f'reader{number}@example.com',
+                password='password',
+            )
+            for number in range(3)
+        ]
+        cls.recipes = {
+            name: Recipe.objects.create(
+                author=cls.author,
+                name=name,
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+            for name in ('viewed', 'favorited', 'in_cart')
+        }
+
+    def setUp(self):
+        cache.clear()
+
+    def run_update(self, hours=0):
+        # Учитываются только закончившиеся интервалы просмотров
+        later = timezone.now() + timedelta(
+            hours=hours,
+            seconds=2 * settings.RECIPE_VIEWS_BUCKET
+            + settings.RECIPE_RANKING_LAG
+        )
+        return update_rankings(now=later)
+
+    def get_names(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        sql = ' '.join(query['sql'] for query in context.captured_queries)
+        self.assertNotIn('recipes_favorite', sql)
+        self.assertNotIn('recipes_shoppingcart', sql)
+        return [recipe['name'] for recipe in response.data['results']]
+
+    def test_rankings_combine_activity_and_views(self):
+        for _ in range(5):
+            self.client.get(f'/api/recipes/{self.recipes["viewed"].id}/')
+        for reader in self.readers[:2]:
+            Favorite.objects.create(
+                user=reader, recipe=self.recipes['favorited']
+            )
+        Favorite.objects.create(
+            user=self.readers[0], recipe=self.recipes['in_cart']
+        )
+        ShoppingCart.objects.create(
+            user=self.readers[0], recipe=self.recipes['in_cart']
+        )
+        self.assertEqual(self.run_update(), 3)
+
+        expected = ['favorited', 'in_cart', 'viewed']
+        self.assertEqual(
+            self.get_names('/api/recipes/?ordering=popular'), expected
+        )
+        self.assertEqual(self.get_names('/api/recipes/trending/'), expected)
+        self.assertEqual(
+            self.get_names('/api/recipes/trending/?pagination=cursor&limit=2'),
+            expected[:2]
+        )
+
+        # Следующий запуск учитывает только новую активность
+        scores = dict(RecipeRanking.objects.values_list(
+            'recipe_id', 'popular_score'
+        ))
+        self.assertEqual(self.run_update(), 0)
+        for reader in self.readers:
+            Favorite.objects.create(user=reader, recipe=self.recipes['viewed'])
+        # Добавления «через час», после момента прошлого запуска
+        Favorite.objects.filter(recipe=self.recipes['viewed']).update(
+            created=timezone.now() + timedelta(hours=1)
+        )
+        self.assertEqual(self.run_update(hours=2), 1)
+        updated = dict(RecipeRanking.objects.values_list(
+            'recipe_id', 'popular_score'
+        ))
+        viewed_id = self.recipes['viewed'].id
+        self.assertGreater(updated.pop(viewed_id), scores.pop(viewed_id))
+        self.assertEqual(updated, scores)
+        # Версия кэша ответов меняется только после фиксации транзакции
+        cache.clear()
+        self.assertEqual(
+            self.get_names('/api/recipes/?ordering=popular')[0], 'viewed'
+        )
+
+
+@override_settings(RECIPE_SIMILAR_COUNT=2)
+class SimilarRecipesTest(APITestCase):
+    """Похожие рецепты из заранее посчитанных списков соседей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(6)
+        )
+        cls.recipes = {}
+        for name, numbers in (
+            ('base', (0, 1, 2, 3)),
+            ('close', (0, 1, 2)),
+            ('far', (0, 4)),
+            ('other', (5,)),
+        ):
+            cls.recipes[name] = Recipe.objects.create(
+                author=cls.author,
+                name=name,
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+            cls.add_ingredients(cls.recipes[name], numbers)
+
+    @classmethod
+    def add_ingredients(cls, recipe, numbers):
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient=cls.ingredients[number], amount=1
+            )
+            for number in numbers
+        )
+
+    def get_similar(self, name):
+        url = f'/api/recipes/{self.recipes[name].id}/similar/'
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(len(context.captured_queries), 1)
+        return [recipe['name'] for recipe in response.data]
+
+    def test_neighbours_follow_changes(self):
+        self.assertEqual(refresh_similar_recipes(), 4)
+        self.assertEqual(self.get_similar('base'), ['close', 'far'])
+        self.assertEqual(self.get_similar('far'), ['close', 'base'])
+        self.assertEqual(self.client.get(
+            f'/api/recipes/{self.recipes["other"].id}/similar/'
+        ).data, [])
+        self.assertEqual(refresh_similar_recipes(), 0)
+
+        # Пересчитываются изменённый рецепт и списки, где он был;
+        # список рецепта без общих ингредиентов не трогается
+        far = self.recipes['far']
+        self.add_ingredients(far, (1, 2, 3))
+        far.save()
+        self.assertEqual(refresh_similar_recipes(), 3)
+        self.assertEqual(self.get_similar('base'), ['far', 'close'])
+
+        # Удалённый рецепт пропадает из списков после пересчёта
+        self.recipes['close'].delete()
+        self.assertEqual(refresh_similar_recipes(), 2)
+        self.assertEqual(self.get_similar('base'), ['far'])
+
+        self.assertEqual(
+            self.client.get('/api/recipes/0/similar/').status_code, 404
+        )
+        self.assertEqual(refresh_similar_recipes(full=True), 3)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class PantryIndexTest(APITestCase):
+    """Поиск по продуктам: инвертированный индекс и его обновление."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(6)
+        )
+        cls.recipes = {}
+        for name, numbers in (
+            ('salad', (0, 1, 2)),
+            ('soup', (0, 1, 3, 4)),
+            ('toast', (5,)),
+        ):
+            cls.recipes[name] = Recipe.objects.create(
+                author=cls.author,
+                name=name,
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=cls.recipes[name],
+                    ingredient=cls.ingredients[number],
+                    amount=1
+                )
+                for number in numbers
+            )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        rebuild_index()
+
+    def search(self, numbers, missing=0):
+        ids = ','.join(str(self.ingredients[number].id) for number in numbers)
+        response = self.client.get(
+            f'/api/recipes/pantry/?ingredients={ids}&missing={missing}'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return [
+            (recipe['name'], recipe['matched_count'], recipe['missing_count'])
+            for recipe in response.data['results']
+        ]
+
+    def postings(self):
+        postings = {}
+        for kind, key, data in RecipePostings.objects.values_list(
+            'kind', 'key', 'data'
+        ):
+            if kind == RecipePostings.LENGTHS:
+                lengths = decode_lengths(data)
+                postings[kind, key] = {
+                    recipe_id: int(lengths[recipe_id])
+                    for recipe_id in lengths.nonzero()[0].tolist()
+                }
+            else:
+                postings[kind, key] = decode_ids(data).tolist()
+        return postings
+
+    def test_ranks_by_missing_ingredients(self):
+        self.assertEqual(self.search((0, 1, 2)), [('salad', 3, 0)])
+        self.assertEqual(
+            self.search((0, 1, 2), missing=2),
+            [('salad', 3, 0), ('soup', 2, 2)]
+        )
+        self.assertEqual(self.search((5, 3), missing=1), [('toast', 1, 0)])
+        self.assertEqual(
+            self.client.get('/api/recipes/pantry/').status_code, 400
+        )
+
+    def test_rejects_invalid_parameters(self):
+        for query in (
+            'ingredients=a',
+            'ingredients=1&missing=x',
+            'ingredients=0',
+            'ingredients=-5',
+            f'ingredients=1,{2 ** 31}',
+            f'ingredients={10 ** 30}',
+            'ingredients=1&missing=-1',
+        ):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/recipes/pantry/?{query}')
+                self.assertEqual(response.status_code, 400)
+
+    def test_writes_are_visible_before_and_after_apply(self):
+        self.client.force_authenticate(self.author)
+        soup = self.recipes['soup']
+        response = self.client.patch(
+            f'/api/recipes/{soup.id}/',
+            {
+                'image': make_image(),
+                'ingredients': [
+                    {'id': self.ingredients[number].id, 'amount': 1}
+                    for number in (0, 1, 2)
+                ],
+            },
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.recipes['toast'].delete()
+
+        # Изменения ещё не перенесены в индекс, но уже видны в выдаче
+        expected = [('soup', 3, 0), ('salad', 3, 0)]
+        self.assertEqual(self.search((0, 1, 2)), expected)
+        self.assertEqual(self.search((5,)), [])
+
+        self.assertEqual(apply_changes(), 2)
+        self.assertFalse(RecipePostingsChange.objects.exists())
+        self.assertEqual(self.search((0, 1, 2)), expected)
+        self.assertEqual(self.search((5,)), [])
+
+        # Обновлённый индекс совпадает с собранным заново
+        postings = self.postings()
+        self.assertNotIn(
+            (RecipePostings.INGREDIENT, self.ingredients[3].id), postings
+        )
+        rebuild_index()
+        self.assertEqual(self.postings(), postings)
@@ -1,6 +1,6 @@
 """Валидаторы для рецептов."""
 from rest_framework import serializers
-from ingredients.models import Ingredient
+from ingredients.catalog import find_missing_ingredients
 
 
 def validate_recipe_image(serializer, initial_data):
@@ -15,7 +15,8 @@ def validate_recipe_image(serializer, initial_data):
         ValidationError: Если изображение отсутствует или пустое
     """
     image_data = initial_data.get('image', '')
-    if not image_data or image_data.strip() == '':
+    if not image_data or (isinstance(image_data, str)
+                          and image_data.strip() == ''):
         raise serializers.ValidationError({
             'image': ['Изображение обязательно для заполнения.']
         })
@@ -63,10 +64,7 @@ def validate_ingredients(value):
             'Ингредиенты не должны повторяться.'
         )
 
-    existing_ids = set(
-        Ingredient.objects.filter(id__in=ingredient_ids).values_list('id', flat=True)
-    )
-    missing_ids = set(ingredient_ids) - existing_ids
+    missing_ids = find_missing_ingredients(ingredient_ids)
     if missing_ids:
         raise serializers.ValidationError(
             f'Ингредиенты с id {list(missing_ids)} не найдены в базе данных.'
@@ -0,0 +1,81 @@
+"""Состояние текущего пользователя для флагов в сериализаторах.
+
+Флаги is_favorited, is_in_shopping_cart и is_subscribed вычисляются по
+множествам id, которые загружаются один раз за запрос (и кэшируются между
+запросами до следующего изменения избранного, корзины или подписок).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+
+from foodgram.cache import bump_version_on_commit, get_version
+
+
+def _namespace(user_id):
+    return f'viewer_state:{user_id}'
+
+
+def invalidate_viewer_state(user_id):
+    """Сбрасывает закэшированные множества пользователя."""
+    bump_version_on_commit(_namespace(user_id))
+
+
+class ViewerState:
+    """Множества id избранного, корзины и подписок пользователя."""
+
+    def __init__(self, user):
+        self.user = user
+        self.is_authenticated = bool(user and user.is_authenticated)
+
+    def _load_ids(self, kind, queryset):
+        """Загружает множество id из кэша или одним запросом к БД."""
+        if not self.is_authenticated:
+            return frozenset()
+        version = get_version(_namespace(self.user.pk))
+        key = f'viewer_state:{self.user.pk}:{kind}:{version}'
+        ids = cache.get(key)
+        if ids is None:
+            ids = list(queryset)
+            cache.set(key, ids, settings.VIEWER_STATE_CACHE_TIMEOUT)
+        return frozenset(ids)
+
+    @cached_property
+    def favorite_ids(self):
+        from .models import Favorite
+        return self._load_ids('favorites', Favorite.objects.filter(
+            user_id=self.user.pk
+        ).values_list('recipe_id', flat=True))
+
+    @cached_property
+    def cart_ids(self):
+        from .models import ShoppingCart
+        return self._load_ids('cart', ShoppingCart.objects.filter(
+            user_id=self.user.pk
+        ).values_list('recipe_id', flat=True))
+
+    @cached_property
+    def subscribed_ids(self):
+        from users.models import Subscription
+        return self._load_ids('subscriptions', Subscription.objects.filter(
+            user_id=self.user.pk
+        ).values_list('author_id', flat=True))
+
+    def is_favorited(self, recipe):
+        return self.is_authenticated and recipe.pk in self.favorite_ids
+
+    def is_in_shopping_cart(self, recipe):
+        return self.is_authenticated and recipe.pk in self.cart_ids
+
+    def is_subscribed(self, author):
+        return self.is_authenticated and author.pk in self.subscribed_ids
+
+
+def get_viewer_state(request):
+    """Возвращает состояние пользователя, общее для всего запроса."""
+    if request is None:
+        return ViewerState(None)
+    state = getattr(request, '_viewer_state', None)
+    if state is None:
+        state = ViewerState(request.user)
+        request._viewer_state = state
+    return state
@@ -1,25 +1,66 @@
 """Views для работы с рецептами."""
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.http import HttpResponse
-from collections import defaultdict
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.http import FileResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import urlencode
 from celery.result import AsyncResult
 
-from .tasks import hello_task, fetch_random_meal, fetch_random_cocktail
+from .tasks import (
+    hello_task,
+    fetch_random_meal,
+    fetch_random_cocktail,
+    export_shopping_list_task,
+)
 
 from .models import Recipe, ShoppingCart, Favorite
 from .serializers import (
     RecipeSerializer,
     RecipeCreateSerializer,
     RecipeUpdateSerializer,
+    PantryRecipeSerializer,
     RecipeMinifiedSerializer,
 )
+from .caching import cached_anonymous_response, get_response_cache_key
+from .exports import (
+    EXPORT_FORMATS,
+    get_cached_export,
+    get_export_format,
+    get_export_storage,
+    is_export_result,
+    make_download_token,
+    read_download_token,
+)
+from .feed import get_feed_queryset, get_feed_recipes
+from .pantry import MAX_ID as PANTRY_MAX_ID
+from .pantry import find_recipes
 from .filters import RecipeFilter
 from .permissions import IsAuthorOrReadOnly
-from users.pagination import CustomPageNumberPagination
+from .ranking import record_view
+from .shopping_list import (
+    get_shopping_list_rows,
+    render_shopping_list,
+)
+from .viewer_state import get_viewer_state
+from foodgram.conditional import conditional_response, make_etag
+from foodgram.uploads import UPLOAD_PARSER_CLASSES
+from ingredients.caching import get_ingredients_version
+from users.pagination import (
+    CustomPageNumberPagination,
+    FeedPagination,
+    RecipePagination,
+    TrendingPagination,
+)
+
+User = get_user_model()
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
@@ -29,7 +70,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
     permission_classes = [AllowAny]
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
-    pagination_class = CustomPageNumberPagination
+    pagination_class = RecipePagination
+    parser_classes = UPLOAD_PARSER_CLASSES
 
     def get_serializer_class(self):
         """Выбор сериализатора в зависимости от действия."""
@@ -43,16 +85,75 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Настройка прав доступа."""
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [IsAuthenticated(), IsAuthorOrReadOnly()]
-        elif self.action in ['shopping_cart', 'download_shopping_cart', 'favorite']:
+        elif self.action in [
+            'shopping_cart', 'download_shopping_cart', 'favorite', 'feed'
+        ]:
             return [IsAuthenticated()]
         return [AllowAny()]
 
     def get_queryset(self):
-        """Оптимизация запросов с prefetch_related."""
-        return Recipe.objects.select_related('author').prefetch_related(
-            'recipe_ingredients__ingredient'
+        """Рецепты с авторами; ингредиенты подгружаются при промахе кэша."""
+        return Recipe.objects.select_related('author').defer('search_vector')
+
+    def list(self, request, *args, **kwargs):
+        """Список рецептов; ответы анонимам берутся из кэша."""
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        return cached_anonymous_response(
+            get_response_cache_key(request, 'list'),
+            lambda: super(RecipeViewSet, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """Рецепт по id с поддержкой ETag; ответы анонимам из кэша."""
+        validators = self.get_recipe_validators(request, kwargs.get('pk'))
+        if validators is None:
+            return super().retrieve(request, *args, **kwargs)
+        record_view(int(kwargs['pk']))
+        return conditional_response(
+            request,
+            lambda: self.build_retrieve_response(request, *args, **kwargs),
+            *validators
+        )
+
+    def build_retrieve_response(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().retrieve(request, *args, **kwargs)
+        return cached_anonymous_response(
+            get_response_cache_key(request, 'retrieve', kwargs.get('pk')),
+            lambda: super(RecipeViewSet, self).retrieve(
+                request, *args, **kwargs
+            )
         )
 
+    def get_recipe_validators(self, request, pk):
+        """ETag и Last-Modified рецепта без загрузки его данных."""
+        try:
+            row = Recipe.objects.filter(pk=pk).values_list(
+                'updated', 'author_id', 'author__updated'
+            ).first()
+        except (TypeError, ValueError):
+            return None
+        if row is None:
+            return None
+        updated, author_id, author_updated = row
+        recipe = Recipe(pk=int(pk))
+        state = get_viewer_state(request)
+        etag = make_etag(
+            recipe.pk,
+            updated.isoformat(),
+            author_updated.isoformat(),
+            get_ingredients_version(),
+            request.get_host(),
+            state.is_favorited(recipe),
+            state.is_in_shopping_cart(recipe),
+            state.is_subscribed(User(pk=author_id)),
+        )
+        # Флаги пользователя меняются без изменения дат: ему только ETag
+        if state.is_authenticated:
+            return etag, None
+        return etag, max(updated, author_updated)
+
     @action(
         detail=False,
         methods=['get'],
@@ -97,18 +198,32 @@ class RecipeViewSet(viewsets.ModelViewSet):
             status=status.HTTP_202_ACCEPTED
         )
 
-    @action(detail=False, methods=['get'], url_path='task/(?P<task_id>[^/.]+)')
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path='task/(?P<task_id>[^/.]+)'
+    )
     def get_task_result(self, request, task_id):
+        """Статус задачи; выгрузку списка покупок видит только владелец."""
         result = AsyncResult(task_id)
-        if result.ready():
-            return Response({
-                'status': 'completed',
-                'result': result.result
-            })
-        else:
+        if not result.ready():
             return Response({
                 'status': 'pending'
             }, status=status.HTTP_202_ACCEPTED)
+        if not result.successful():
+            return Response({'status': 'failed'})
+        data = result.result
+        if is_export_result(data):
+            if data['user_id'] != request.user.id:
+                return Response(
+                    {'errors': 'Задача не найдена.'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            data = self.get_export_result(request, data['file'])
+        return Response({
+            'status': 'completed',
+            'result': data
+        })
 
     @action(
         detail=True,
@@ -124,6 +239,136 @@ class RecipeViewSet(viewsets.ModelViewSet):
             'short-link': short_link
         })
 
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path='trending',
+        pagination_class=TrendingPagination
+    )
+    def trending(self, request):
+        """Рецепты, набирающие популярность; ответы анонимам из кэша."""
+        if request.user.is_authenticated:
+            return self.build_trending_response(request)
+        return cached_anonymous_response(
+            get_response_cache_key(request, 'trending'),
+            lambda: self.build_trending_response(request)
+        )
+
+    def build_trending_response(self, request):
+        queryset = self.get_queryset().filter(
+            ranking__isnull=False
+        ).annotate(
+            trending_score=F('ranking__trending_score')
+        ).order_by('-trending_score', '-id')
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path='feed',
+        pagination_class=FeedPagination
+    )
+    def feed(self, request):
+        """Новые рецепты авторов, на которых подписан пользователь."""
+        page = self.paginate_queryset(get_feed_queryset(request.user))
+        serializer = self.get_serializer(get_feed_recipes(page), many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path='pantry',
+        pagination_class=CustomPageNumberPagination
+    )
+    def pantry(self, request):
+        """Рецепты из продуктов пользователя.
+
+        ingredients — id ингредиентов (через запятую или несколькими
+        параметрами), missing — сколько ингредиентов может не хватать.
+        Выдача упорядочена по числу недостающих, затем совпавших.
+        """
+        try:
+            ingredient_ids = {
+                int(value)
+                for param in request.query_params.getlist('ingredients')
+                for value in param.split(',')
+                if value.strip()
+            }
+            max_missing = int(request.query_params.get('missing', 0))
+        except ValueError:
+            return Response(
+                {'errors': 'ingredients и missing должны быть числами.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 0 < len(ingredient_ids) <= settings.PANTRY_MAX_INGREDIENTS:
+            return Response(
+                {'errors': 'Укажите от 1 до '
+                           f'{settings.PANTRY_MAX_INGREDIENTS} ингредиентов.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not all(0 < pk <= PANTRY_MAX_ID for pk in ingredient_ids):
+            return Response(
+                {'errors': 'id ингредиентов должны быть от 1 до '
+                           f'{PANTRY_MAX_ID}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 0 <= max_missing <= settings.PANTRY_MAX_MISSING:
+            return Response(
+                {'errors': 'missing должен быть от 0 до '
+                           f'{settings.PANTRY_MAX_MISSING}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        ids, matched, missing = find_recipes(ingredient_ids, max_missing)
+        # Пагинируются номера позиций, рецепты читаются только для страницы
+        positions = self.paginate_queryset(range(len(ids)))
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'image_variants', 'cooking_time'
+        ).in_bulk([int(ids[position]) for position in positions])
+        page = []
+        for position in positions:
+            recipe = recipes.get(int(ids[position]))
+            if recipe is not None:
+                recipe.matched_count = int(matched[position])
+                recipe.missing_count = int(missing[position])
+                page.append(recipe)
+        serializer = PantryRecipeSerializer(
+            page, many=True, context={'request': request}
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=True,
+        methods=['get'],
+        url_path='similar'
+    )
+    def similar(self, request, pk=None):
+        """Рецепты с похожим набором ингредиентов.
+
+        Списки заранее считает задача refresh_similar_recipes_task;
+        запрос читает готовый список одним соединением по индексу.
+        """
+        try:
+            recipe_id = int(pk)
+        except ValueError:
+            raise NotFound()
+        recipes = list(
+            Recipe.objects.filter(
+                neighbour_of__recipe_id=recipe_id
+            ).order_by('neighbour_of__rank').only(
+                'id', 'name', 'image', 'image_variants', 'cooking_time'
+            )
+        )
+        # Пустой список — проверяем, существует ли сам рецепт
+        if not recipes and not Recipe.objects.filter(pk=recipe_id).exists():
+            raise NotFound()
+        serializer = RecipeMinifiedSerializer(
+            recipes, many=True, context={'request': request}
+        )
+        return Response(serializer.data)
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -140,7 +385,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
                     {'errors': 'Рецепт уже добавлен в избранное.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            Favorite.objects.create(user=user, recipe=recipe)
+            with transaction.atomic():
+                Favorite.objects.create(user=user, recipe=recipe)
             serializer = RecipeMinifiedSerializer(
                 recipe,
                 context={'request': request}
@@ -173,7 +419,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
                     {'errors': 'Рецепт уже добавлен в корзину.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            ShoppingCart.objects.create(user=user, recipe=recipe)
+            # Список покупок обновляет сигнал корзины в той же транзакции
+            with transaction.atomic():
+                ShoppingCart.objects.create(user=user, recipe=recipe)
             serializer = RecipeMinifiedSerializer(
                 recipe,
                 context={'request': request}
@@ -187,47 +435,85 @@ class RecipeViewSet(viewsets.ModelViewSet):
                     {'errors': 'Рецепт не найден в корзине.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            cart_item.delete()
+            with transaction.atomic():
+                cart_item.delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         detail=False,
-        methods=['get'],
+        methods=['get', 'post'],
         url_path='download_shopping_cart'
     )
     def download_shopping_cart(self, request):
-        """Скачивание списка покупок."""
-        user = request.user
-        shopping_cart = ShoppingCart.objects.filter(user=user).select_related(
-            'recipe'
-        ).prefetch_related(
-            'recipe__recipe_ingredients__ingredient'
-        )
+        """Скачивание списка покупок.
 
+        GET без параметров отдаёт текстовый список сразу. POST с полем
+        format (txt, csv, pdf) запускает фоновую выгрузку; её статус и
+        ссылку на файл (GET с подписанным параметром export) отдаёт
+        task/<task_id>/.
+        """
+        if request.method == 'POST':
+            return self.start_shopping_cart_export(request)
 
-        ingredients_dict = defaultdict(int)
-        for cart_item in shopping_cart:
-            recipe = cart_item.recipe
-            for recipe_ingredient in recipe.recipe_ingredients.all():
-                ingredient = recipe_ingredient.ingredient
-                key = (ingredient.name, ingredient.measurement_unit)
-                ingredients_dict[key] += recipe_ingredient.amount
+        token = request.query_params.get('export')
+        if token:
+            return self.download_shopping_cart_export(request, token)
 
+        rows = get_shopping_list_rows(request.user)
+        response = StreamingHttpResponse(
+            render_shopping_list(rows),
+            content_type='text/plain; charset=utf-8'
+        )
+        response['Content-Disposition'] = 'attachment; filename="shopping_list.txt"'
+        return response
 
-        shopping_list = []
-        shopping_list.append('Список покупок:\n')
-        shopping_list.append('=' * 50 + '\n\n')
+    def get_export_result(self, request, name):
+        """Формат и ссылка на скачивание файла выгрузки пользователя."""
+        url = '{}?{}'.format(
+            reverse('recipes-download-shopping-cart'),
+            urlencode({'export': make_download_token(request.user.id, name)})
+        )
+        return {
+            'format': get_export_format(name),
+            'url': request.build_absolute_uri(url),
+        }
 
-        for (name, unit), amount in sorted(ingredients_dict.items()):
-            shopping_list.append(f'{name} ({unit}) - {amount}\n')
+    def start_shopping_cart_export(self, request):
+        """Запуск выгрузки; неизменённая корзина отдаётся из готового файла."""
+        file_format = request.data.get('format', 'txt')
+        if file_format not in EXPORT_FORMATS:
+            formats = ', '.join(EXPORT_FORMATS)
+            return Response(
+                {'errors': f'Формат должен быть одним из: {formats}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        shopping_list.append('\n' + '=' * 50)
-        shopping_list.append(f'\nВсего ингредиентов: {len(ingredients_dict)}')
+        name = get_cached_export(request.user, file_format)
+        if name:
+            return Response({
+                'status': 'completed',
+                'result': self.get_export_result(request, name),
+            })
 
+        result = export_shopping_list_task.delay(request.user.id, file_format)
+        return Response(
+            {'status': 'task sent', 'task_id': result.id},
+            status=status.HTTP_202_ACCEPTED
+        )
 
-        response = HttpResponse(
-            ''.join(shopping_list),
-            content_type='text/plain; charset=utf-8'
+    def download_shopping_cart_export(self, request, token):
+        """Отдаёт файл выгрузки по подписанной ссылке её владельцу."""
+        name = read_download_token(token, request.user.id)
+        storage = get_export_storage()
+        if name is None or not storage.exists(name):
+            return Response(
+                {'errors': 'Выгрузка не найдена или ссылка устарела.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        file_format = get_export_format(name)
+        return FileResponse(
+            storage.open(name, 'rb'),
+            as_attachment=True,
+            filename=f'shopping_list.{file_format}',
+            content_type=EXPORT_FORMATS[file_format]
         )
-        response['Content-Disposition'] = 'attachment; filename="shopping_list.txt"'
-        return response
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth import get_user_model
+from .admin_filters import AutocompleteFilter, AutocompleteFilterMixin
 from .models import Subscription
 
 User = get_user_model()
@@ -27,21 +28,13 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
     
-    def recipes_count(self, obj):
-        return obj.recipes.count()
-    recipes_count.short_description = 'Кол-во рецептов'
-    
-    def subscribers_count(self, obj):
-        return obj.subscribers.count()
-    subscribers_count.short_description = 'Кол-во подписчиков'
-    
-    def subscriptions_count(self, obj):
-        return obj.subscriptions.count()
-    subscriptions_count.short_description = 'Кол-во подписок'
-
 
 @admin.register(Subscription)
-class SubscriptionAdmin(admin.ModelAdmin):
+class SubscriptionAdmin(AutocompleteFilterMixin, admin.ModelAdmin):
     list_display = ('id', 'user', 'author')
     search_fields = ('user__username', 'user__email', 'author__username', 'author__email')
-    list_filter = ('user', 'author')
+    list_filter = (
+        ('user', AutocompleteFilter),
+        ('author', AutocompleteFilter),
+    )
+    autocomplete_fields = ('user', 'author')
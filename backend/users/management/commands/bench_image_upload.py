@@ -0,0 +1,189 @@
+"""
+Management команда для замера памяти при загрузке аватара.
+
+Каждый замер выполняется в отдельном процессе: тело запроса заранее
+записывается в файл и подаётся обработчику WSGI как поток, поэтому пик
+RSS процесса отражает только работу сервера. Из пика вычитается пик
+процесса, выполнившего запрос без изображения. Данные в базе не
+остаются: запрос выполняется внутри откатываемой транзакции.
+"""
+import base64
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, transaction
+from django.test import override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+AVATAR_URL = '/api/users/me/avatar/'
+MODES = ('baseline', 'json', 'multipart')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Замеряет пик памяти при загрузке аватара в base64 и multipart'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size',
+            type=float,
+            default=8,
+            help='Примерный размер изображения в МБ'
+        )
+        parser.add_argument(
+            '--child',
+            choices=MODES,
+            help='Служебный: выполнить один запрос в текущем процессе'
+        )
+        parser.add_argument(
+            '--body',
+            help='Служебный: файл с телом запроса'
+        )
+
+    def handle(self, *args, **options):
+        if options['child']:
+            self.run_child(options['child'], options['body'])
+            return
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = self.write_bodies(Path(directory), options['size'])
+            results = {
+                mode: self.measure(mode, path) for mode, path in paths.items()
+            }
+
+        baseline = results['baseline'][1]
+        for mode in MODES[1:]:
+            status, peak = results[mode]
+            self.stdout.write(
+                f'{mode}: статус {status}, пик RSS {peak / 2 ** 10:.1f} МБ, '
+                f'прирост к базовому {(peak - baseline) / 2 ** 10:.1f} МБ'
+            )
+
+    def write_bodies(self, directory, size_mb):
+        """Записывает тела запросов в файлы и возвращает их пути."""
+        image = self.make_image(size_mb)
+        self.stdout.write(
+            f'Изображение: {len(image) / 2 ** 20:.1f} МБ, '
+            f'лимит загрузки {settings.IMAGE_UPLOAD_MAX_SIZE / 2 ** 20:.0f} МБ'
+        )
+        bodies = {
+            'baseline': lambda: b'',
+            'json': lambda: json.dumps({
+                'avatar': 'data:image/png;base64,'
+                + base64.b64encode(image).decode()
+            }).encode(),
+            'multipart': lambda: encode_multipart(BOUNDARY, {
+                'avatar': SimpleUploadedFile('avatar.png', image)
+            }),
+        }
+        paths = {}
+        for mode in MODES:
+            paths[mode] = directory / f'{mode}.body'
+            paths[mode].write_bytes(bodies[mode]())
+        return paths
+
+    def make_image(self, size_mb):
+        """PNG из шума: почти не сжимается, размер близок к заданному."""
+        side = int((size_mb * 2 ** 20 / 3) ** 0.5)
+        image = Image.frombytes(
+            'RGB', (side, side), os.urandom(side * side * 3)
+        )
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG', compress_level=1)
+        return buffer.getvalue()
+
+    def measure(self, mode, path):
+        """Запускает замер в дочернем процессе: (статус, пик RSS в КБ).
+
+        Пик берётся из VmHWM самого процесса, а не из ru_maxrss: в Linux
+        ru_maxrss дочернего процесса включает пик родителя до exec.
+        """
+        process = subprocess.Popen(
+            [
+                sys.executable, str(settings.BASE_DIR / 'manage.py'),
+                'bench_image_upload', '--child', mode, '--body', str(path),
+            ],
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        output, _ = process.communicate()
+        if process.returncode:
+            return f'код {process.returncode}', 0
+        status, peak = output.strip().rsplit('\t', 1)
+        return status, int(peak)
+
+    def run_child(self, mode, body_path):
+        # Как в тестовом клиенте: соединение с базой не должно закрываться
+        # в конце запроса, иначе откатываемая транзакция оборвётся
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        handler = WSGIHandler()
+        content_type = {
+            'json': 'application/json',
+            'multipart': MULTIPART_CONTENT,
+        }.get(mode, '')
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root,
+                                      ALLOWED_HOSTS=['*']), \
+                    transaction.atomic(), \
+                    open(body_path, 'rb') as body:
+                user = User.objects.create(
+                    username='bench_image_upload',
+                    email='bench_image_upload@example.com',
+                )
+                token = Token.objects.create(user=user)
+                environ = {
+                    'REQUEST_METHOD': 'PUT' if mode != 'baseline' else 'GET',
+                    'PATH_INFO': AVATAR_URL if mode != 'baseline'
+                    else '/api/users/me/',
+                    'SCRIPT_NAME': '',
+                    'SERVER_NAME': 'localhost',
+                    'SERVER_PORT': '80',
+                    'SERVER_PROTOCOL': 'HTTP/1.1',
+                    'HTTP_HOST': 'localhost',
+                    'HTTP_AUTHORIZATION': f'Token {token.key}',
+                    'CONTENT_TYPE': content_type,
+                    'CONTENT_LENGTH': str(os.path.getsize(body_path)),
+                    'wsgi.input': body,
+                    'wsgi.errors': sys.stderr,
+                    'wsgi.url_scheme': 'http',
+                }
+                statuses = []
+                response = handler(
+                    environ, lambda status, headers: statuses.append(status)
+                )
+                for _ in response:
+                    pass
+                response.close()
+                self.stdout.write(f'{statuses[0]}\t{self.peak_rss()}')
+                raise Rollback
+        except Rollback:
+            pass
+
+    def peak_rss(self):
+        """Пик RSS текущего процесса в КБ (Linux)."""
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+        return 0
+
@@ -0,0 +1,125 @@
+"""
+Management команда для замера построения URL медиафайлов.
+
+Сравнивает прежнюю схему (абсолютный URL через build_absolute_uri и
+исправление порта регулярными выражениями на каждый объект) с общим
+построителем URL, который собирает префикс один раз на запрос.
+Объекты создаются в памяти, база данных не используется.
+"""
+import re
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from recipes.models import Recipe
+from recipes.serializers import RecipeMinifiedSerializer
+from users.serializers import get_avatar_url
+
+User = get_user_model()
+
+LOCAL_HOSTS = (
+    (re.compile(r'http://localhost(?!:8080)(?::\d+)?'),
+     'http://localhost:8080'),
+    (re.compile(r'http://127\.0\.0\.1(?!:8080)(?::\d+)?'),
+     'http://127.0.0.1:8080'),
+)
+
+
+def legacy_media_url(url, request):
+    """Прежняя схема: URL хранилища, build_absolute_uri и правка порта."""
+    url = request.build_absolute_uri(url)
+    for pattern, replacement in LOCAL_HOSTS:
+        url = pattern.sub(replacement, url)
+    return url
+
+
+class Command(BaseCommand):
+    help = 'Замеряет стоимость построения URL аватаров и изображений'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--objects',
+            type=int,
+            default=10_000,
+            help='Количество объектов в одном проходе'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Количество проходов, берётся лучший'
+        )
+        parser.add_argument(
+            '--host',
+            default='localhost:8000',
+            help='Хост запроса'
+        )
+
+    def handle(self, *args, **options):
+        count = options['objects']
+        users = [
+            User(id=number, username=f'user{number}',
+                 avatar=f'users/{number:064x}.png')
+            for number in range(count)
+        ]
+        recipes = [
+            Recipe(id=number, name=f'Рецепт {number}', cooking_time=10,
+                   image=f'recipes/images/{number:064x}.png')
+            for number in range(count)
+        ]
+
+        def new_request():
+            return Request(RequestFactory().get(
+                '/api/recipes/', HTTP_HOST=options['host']
+            ))
+
+        def legacy_avatars():
+            request = new_request()
+            return [
+                legacy_media_url(user.avatar.url, request) for user in users
+            ]
+
+        def avatars():
+            request = new_request()
+            return [get_avatar_url(user, request) for user in users]
+
+        def legacy_images():
+            request = new_request()
+            return [
+                legacy_media_url(recipe.image.url, request)
+                for recipe in recipes
+            ]
+
+        def images():
+            serializer = RecipeMinifiedSerializer(
+                context={'request': new_request()}
+            )
+            return [serializer.get_image(recipe) for recipe in recipes]
+
+        self.stdout.write(f'Объектов: {count}, хост {options["host"]}')
+        for title, legacy, current in (
+            ('аватар', legacy_avatars, avatars),
+            ('изображение рецепта', legacy_images, images),
+        ):
+            legacy_urls, before = self.best(legacy, options['repeat'])
+            urls, after = self.best(current, options['repeat'])
+            if legacy_urls != urls:
+                self.stdout.write(self.style.WARNING(
+                    f'{title}: URL различаются: {legacy_urls[0]} и {urls[0]}'
+                ))
+            self.stdout.write(
+                f'{title}: было {before / count * 1e9:.0f} нс на объект, '
+                f'стало {after / count * 1e9:.0f} нс '
+                f'(в {before / after:.1f} раза быстрее)'
+            )
+
+    def best(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start)
+        return result, min(timings)
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 06:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Уменьшенные копии аватара в WebP и JPEG', verbose_name='Копии аватара'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-17 06:22
+
+import foodgram.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_avatar_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=models.ImageField(blank=True, help_text='Загрузите изображение аватара', null=True, storage=foodgram.storage.get_image_storage, upload_to='users/', verbose_name='Аватар'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 07:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='feed_materialized',
+            field=models.BooleanField(default=False, editable=False, help_text='Лента подписок читается из FeedEntry', verbose_name='Лента построена'),
+        ),
+    ]
@@ -1,9 +1,17 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from foodgram.counters import CounterFieldsMixin
+from foodgram.storage import get_image_storage
 
-class User(AbstractUser):
+
+class User(CounterFieldsMixin, AbstractUser):
     """Кастомная модель пользователя."""
+    counter_fields = (
+        'recipes_count', 'subscribers_count', 'subscriptions_count'
+    )
+    task_fields = ('avatar_variants', 'feed_materialized')
+
     email = models.EmailField(
         'email адрес',
         max_length=254,
@@ -23,10 +31,43 @@ class User(AbstractUser):
     avatar = models.ImageField(
         'Аватар',
         upload_to='users/',
+        storage=get_image_storage,
         blank=True,
         null=True,
         help_text='Загрузите изображение аватара'
     )
+    avatar_variants = models.JSONField(
+        'Копии аватара',
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text='Уменьшенные копии аватара в WebP и JPEG'
+    )
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
+    recipes_count = models.PositiveIntegerField(
+        'Кол-во рецептов',
+        default=0,
+        editable=False
+    )
+    subscribers_count = models.PositiveIntegerField(
+        'Кол-во подписчиков',
+        default=0,
+        editable=False
+    )
+    subscriptions_count = models.PositiveIntegerField(
+        'Кол-во подписок',
+        default=0,
+        editable=False
+    )
+    feed_materialized = models.BooleanField(
+        'Лента построена',
+        default=False,
+        editable=False,
+        help_text='Лента подписок читается из FeedEntry'
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
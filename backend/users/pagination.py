@@ -1,9 +1,221 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Keyset-пагинация по набору полей без COUNT(*) и OFFSET.
+
+    Позиция кодируется в непрозрачный токен cursor со значениями полей
+    сортировки последней (или первой) записи страницы.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def __init__(self, ordering, page_size):
+        self.ordering = tuple(ordering)
+        self.page_size = page_size
+
+    def encode_cursor(self, values, reverse=False):
+        payload = json.dumps(
+            {'v': values, 'r': int(reverse)},
+            default=str,
+            separators=(',', ':')
+        )
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, request):
+        """Возвращает (values, reverse) или None для первой страницы."""
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+            values = payload['v']
+            reverse = bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def get_output_field(self, queryset, name):
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.get_field(name)
+
+    def clean_values(self, queryset, values):
+        """Приводит значения курсора к типам полей сортировки."""
+        cleaned = []
+        for field, value in zip(self.ordering, values):
+            if isinstance(value, bool) or not isinstance(
+                value, (str, int, float)
+            ):
+                raise NotFound(self.invalid_cursor_message)
+            output_field = self.get_output_field(queryset, field.lstrip('-'))
+            try:
+                value = output_field.to_python(value)
+                output_field.run_validators(value)
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            cleaned.append(value)
+        return cleaned
+
+    def get_ordering(self, reverse):
+        if not reverse:
+            return self.ordering
+        return tuple(
+            field[1:] if field.startswith('-') else f'-{field}'
+            for field in self.ordering
+        )
+
+    def get_position_filter(self, values, reverse):
+        """Условие «строго после позиции» в порядке выдачи."""
+        condition = Q()
+        for index, field in enumerate(self.get_ordering(reverse)):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[index]})
+            for prev_field, prev_value in zip(
+                self.ordering[:index], values[:index]
+            ):
+                step &= Q(**{prev_field.lstrip('-'): prev_value})
+            condition |= step
+        return condition
+
+    def get_values(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor[1])
+
+        queryset = queryset.order_by(*self.get_ordering(reverse))
+        if cursor:
+            queryset = queryset.filter(self.get_position_filter(
+                self.clean_values(queryset, cursor[0]), reverse
+            ))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if reverse:
+            rows.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = cursor is not None, has_more
+
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        token = self.encode_cursor(self.get_values(self.page[-1]))
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            token
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        token = self.encode_cursor(
+            self.get_values(self.page[0]),
+            reverse=True
+        )
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            token
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
 
 
 class CustomPageNumberPagination(PageNumberPagination):
-    """Кастомная пагинация с поддержкой параметра limit."""
+    """Кастомная пагинация с поддержкой параметра limit.
+
+    Если задан keyset_ordering, клиент может включить курсорный режим
+    параметром pagination=cursor (или передав токен cursor); без него
+    работает привычная пагинация по page/limit.
+    """
     page_size = 6
     page_size_query_param = 'limit'
     max_page_size = 100
+    keyset_ordering = None
+    keyset = None
+
+    def get_keyset_ordering(self, request):
+        return self.keyset_ordering
+
+    def is_cursor_request(self, request):
+        params = request.query_params
+        return bool(self.get_keyset_ordering(request)) and (
+            params.get('pagination') == 'cursor'
+            or KeysetPagination.cursor_query_param in params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.is_cursor_request(request):
+            self.keyset = KeysetPagination(
+                self.get_keyset_ordering(request),
+                self.get_page_size(request)
+            )
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class RecipePagination(CustomPageNumberPagination):
+    """Пагинация ленты рецептов (курсор по дате создания и id).
+
+    Результаты поиска упорядочены по релевантности, поэтому курсор
+    строится по search_rank и id; при ordering=popular — по оценке
+    популярности.
+    """
+    keyset_ordering = ('-created', '-id')
+    search_keyset_ordering = ('-search_rank', '-id')
+    popular_keyset_ordering = ('-popular_score', '-id')
+
+    def get_keyset_ordering(self, request):
+        if request.query_params.get('search', '').strip():
+            return self.search_keyset_ordering
+        if request.query_params.get('ordering') == 'popular':
+            return self.popular_keyset_ordering
+        return self.keyset_ordering
+
+
+class TrendingPagination(CustomPageNumberPagination):
+    """Пагинация набирающих популярность рецептов."""
+    keyset_ordering = ('-trending_score', '-id')
+
+
+class FeedPagination(CustomPageNumberPagination):
+    """Пагинация ленты подписок (курсор по дате рецепта и его id)."""
+    keyset_ordering = ('-created', '-recipe_id')
+
 
+class UserPagination(CustomPageNumberPagination):
+    """Пагинация пользователей и подписок (курсор по username и id)."""
+    keyset_ordering = ('username', 'id')
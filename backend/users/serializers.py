@@ -1,49 +1,38 @@
 from django.contrib.auth import get_user_model
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
+from foodgram.images import get_variant_url
+from foodgram.media import get_media_resolver
+from foodgram.uploads import ImageUploadField
 from .validators import validate_current_password
 
 
-def fix_media_url(url, request=None):
-    """Исправляет URL медиафайла, добавляя порт 8080 если его нет."""
-    if not url:
-        return url
-    
-    # Если URL уже абсолютный
-    if url.startswith('http://'):
-        # Заменяем localhost без порта или с другим портом на localhost:8080
-        import re
-        # Заменяем http://localhost/ или http://localhost:8000/ на http://localhost:8080/
-        url = re.sub(r'http://localhost(?!:8080)(?::\d+)?/', 'http://localhost:8080/', url)
-        # Заменяем http://127.0.0.1/ или http://127.0.0.1:8000/ на http://127.0.0.1:8080/
-        url = re.sub(r'http://127\.0\.0\.1(?!:8080)(?::\d+)?/', 'http://127.0.0.1:8080/', url)
-        return url
-    
-    # Если URL относительный, делаем его абсолютным с портом
-    if url.startswith('/media/'):
-        if request:
-            # Пытаемся использовать request, но исправляем порт
-            base_url = request.build_absolute_uri('/')
-            # Заменяем порт на 8080 если это localhost
-            import re
-            base_url = re.sub(r'http://localhost(?!:8080)(?::\d+)?', 'http://localhost:8080', base_url)
-            base_url = re.sub(r'http://127\.0\.0\.1(?!:8080)(?::\d+)?', 'http://127.0.0.1:8080', base_url)
-            return base_url.rstrip('/') + url
-        else:
-            return f'http://localhost:8080{url}'
-    
-    return url
-
 User = get_user_model()
 
 
-def get_subscription_status(user, obj):
+def get_avatar_url(user, request=None):
+    """Полный URL уменьшенной копии аватара (или оригинала, пока копии нет)."""
+    if not user.avatar:
+        return None
+    return get_variant_url(
+        user.avatar_variants, 'avatar', request=request
+    ) or get_media_resolver(request).file_url(user.avatar.name)
+
+
+def get_recipes_limit(request):
+    """Значение recipes_limit из запроса или None, если оно не задано."""
+    value = request.query_params.get('recipes_limit') if request else None
+    try:
+        recipes_limit = int(value) if value else None
+    except (ValueError, TypeError):
+        return None
+    return recipes_limit if recipes_limit and recipes_limit > 0 else None
+
+
+def get_subscription_status(request, obj):
     """Проверка подписки пользователя на автора."""
-    if user and user.is_authenticated:
-        from .models import Subscription
-        return Subscription.objects.filter(user=user, author=obj).exists()
-    return False
+    from recipes.viewer_state import get_viewer_state
+    return get_viewer_state(request).is_subscribed(obj)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -67,18 +56,11 @@ class UserSerializer(serializers.ModelSerializer):
     def get_is_subscribed(self, obj):
         """Проверка подписки."""
         request = self.context.get('request')
-        user = request.user if request else None
-        return get_subscription_status(user, obj)
+        return get_subscription_status(request, obj)
 
     def get_avatar(self, obj):
         """Возвращает полный URL аватара."""
-        if obj.avatar:
-            request = self.context.get('request')
-            if request:
-                url = request.build_absolute_uri(obj.avatar.url)
-                return fix_media_url(url, request)
-            return fix_media_url(obj.avatar.url)
-        return None
+        return get_avatar_url(obj, self.context.get('request'))
 
 
 class UserCreateSerializer(serializers.ModelSerializer):
@@ -128,7 +110,7 @@ class SetPasswordSerializer(serializers.Serializer):
 
 class SetAvatarSerializer(serializers.Serializer):
     """Сериализатор для добавления аватара."""
-    avatar = Base64ImageField()
+    avatar = ImageUploadField()
 
 
 class SetAvatarResponseSerializer(serializers.ModelSerializer):
@@ -141,20 +123,13 @@ class SetAvatarResponseSerializer(serializers.ModelSerializer):
 
     def get_avatar(self, obj):
         """Возвращает полный URL аватара."""
-        if obj.avatar:
-            request = self.context.get('request')
-            if request:
-                url = request.build_absolute_uri(obj.avatar.url)
-                return fix_media_url(url, request)
-            return fix_media_url(obj.avatar.url)
-        return None
+        return get_avatar_url(obj, self.context.get('request'))
 
 
 class UserWithRecipesSerializer(serializers.ModelSerializer):
     """Сериализатор для пользователя с рецептами (для подписок)."""
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
     avatar = serializers.SerializerMethodField()
 
     class Meta:
@@ -174,40 +149,29 @@ class UserWithRecipesSerializer(serializers.ModelSerializer):
     def get_is_subscribed(self, obj):
         """Проверка подписки."""
         request = self.context.get('request')
-        user = request.user if request else None
-        return get_subscription_status(user, obj)
+        return get_subscription_status(request, obj)
 
     def get_recipes(self, obj):
-        """Получение рецептов автора с ограничением количества."""
+        """Получение рецептов автора с ограничением количества.
+
+        Если рецепты уже выбраны в recent_recipes (см.
+        UserViewSet.get_authors_with_recipes), ограничение применено там.
+        """
         from recipes.serializers import RecipeMinifiedSerializer
-        request = self.context.get('request')
 
-        recipes_limit = request.query_params.get('recipes_limit') if request else None
-        try:
-            recipes_limit = int(recipes_limit) if recipes_limit else None
-        except (ValueError, TypeError):
-            recipes_limit = None
+        recipes = getattr(obj, 'recent_recipes', None)
+        if recipes is None:
+            recipes = obj.recipes.all()
+            recipes_limit = get_recipes_limit(self.context.get('request'))
+            if recipes_limit:
+                recipes = recipes[:recipes_limit]
 
-        recipes = obj.recipes.all()
-        if recipes_limit:
-            recipes = recipes[:recipes_limit]
-        
         return RecipeMinifiedSerializer(
             recipes,
             many=True,
             context=self.context
         ).data
 
-    def get_recipes_count(self, obj):
-        """Общее количество рецептов автора."""
-        return obj.recipes.count()
-
     def get_avatar(self, obj):
         """Возвращает полный URL аватара."""
-        if obj.avatar:
-            request = self.context.get('request')
-            if request:
-                url = request.build_absolute_uri(obj.avatar.url)
-                return fix_media_url(url, request)
-            return fix_media_url(obj.avatar.url)
-        return None
+        return get_avatar_url(obj, self.context.get('request'))
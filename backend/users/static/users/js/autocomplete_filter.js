@@ -0,0 +1,17 @@
+'use strict';
+{
+    const $ = django.jQuery;
+
+    // Выбор значения в фильтре с поиском открывает отфильтрованный список
+    $(function() {
+        $('.autocomplete-filter').on('change', function() {
+            let query = this.dataset.queryString;
+            if (this.value) {
+                query += (query === '?' ? '' : '&')
+                    + encodeURIComponent(this.name) + '='
+                    + encodeURIComponent(this.value);
+            }
+            window.location.search = query;
+        });
+    });
+}
@@ -0,0 +1,39 @@
+from celery import shared_task
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from foodgram.images import get_variant_urls, process_image_variants
+from recipes.caching import invalidate_author
+
+User = get_user_model()
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(OSError,),
+    retry_kwargs={'max_retries': 3, 'countdown': 5}
+)
+def generate_avatar_variants(
+    self, user_id: int, image_name: str
+) -> dict:
+    """
+    Строит уменьшенные копии аватара в WebP и JPEG.
+
+    Args:
+        user_id: id пользователя.
+        image_name: Имя файла, для которого поставлена задача.
+
+    Returns:
+        dict с URL копий (None, если аватар уже сменился).
+    """
+    variants = process_image_variants(
+        User, user_id, 'avatar', 'avatar_variants', image_name,
+        settings.AVATAR_IMAGE_VARIANTS, settings.IMAGE_VARIANT_QUALITY
+    )
+    if variants is not None:
+        invalidate_author(user_id)
+    return {
+        "user_id": user_id,
+        "variants": get_variant_urls(variants),
+        "task_id": self.request.id,
+    }
@@ -0,0 +1,303 @@
+import base64
+import io
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import urlencode
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from recipes.models import Favorite, Recipe
+from users.models import Subscription
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+AVATAR_URL = '/api/users/me/avatar/'
+
+
+def make_png(size=(2, 2), mode='RGB'):
+    buffer = io.BytesIO()
+    Image.new(mode, size).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AvatarUploadTest(APITestCase):
+    """Загрузка аватара в base64 и файлом, ограничения размера."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user',
+            email='user@example.com',
+            password='password',
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def put_file(self, content, name='avatar.png'):
+        return self.client.put(
+            AVATAR_URL,
+            {'avatar': SimpleUploadedFile(name, content)},
+            format='multipart'
+        )
+
+    def test_multipart_upload(self):
+        response = self.put_file(make_png())
+        self.assertEqual(response.status_code, 200, response.content)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.avatar.name.endswith('.png'))
+
+    def test_base64_upload(self):
+        encoded = base64.b64encode(make_png()).decode()
+        response = self.client.put(
+            AVATAR_URL,
+            {'avatar': f'data:image/png;base64,{encoded}'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=10_000)
+    def test_too_many_pixels_rejected_by_header(self):
+        # Сжатый файл маленький, а при декодировании занял бы 4 МБ
+        bomb = make_png((2000, 2000), mode='L')
+        for response in (
+            self.put_file(bomb),
+            self.client.put(
+                AVATAR_URL,
+                {'avatar': base64.b64encode(bomb).decode()},
+                format='json'
+            ),
+        ):
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('пикселей', response.data['avatar'][0])
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.avatar)
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=100)
+    def test_too_large_file_rejected(self):
+        response = self.put_file(make_png((200, 200)))
+        self.assertEqual(response.status_code, 413)
+
+    @override_settings(
+        IMAGE_UPLOAD_MAX_SIZE=100, DATA_UPLOAD_MAX_MEMORY_SIZE=100
+    )
+    def test_too_large_json_rejected_before_parsing(self):
+        encoded = base64.b64encode(make_png((200, 200))).decode()
+        response = self.client.put(
+            AVATAR_URL, {'avatar': encoded}, format='json'
+        )
+        self.assertEqual(response.status_code, 413)
+
+
+    def test_form_upload(self):
+        encoded = base64.b64encode(make_png()).decode()
+        response = self.client.put(
+            AVATAR_URL,
+            urlencode({'avatar': f'data:image/png;base64,{encoded}'}),
+            content_type='application/x-www-form-urlencoded'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+
+    @override_settings(
+        IMAGE_UPLOAD_MAX_SIZE=100, DATA_UPLOAD_MAX_MEMORY_SIZE=100
+    )
+    def test_too_large_form_rejected(self):
+        encoded = base64.b64encode(make_png((200, 200))).decode()
+        response = self.client.put(
+            AVATAR_URL,
+            urlencode({'avatar': encoded}),
+            content_type='application/x-www-form-urlencoded'
+        )
+        self.assertEqual(response.status_code, 413)
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=100)
+    def test_limit_applies_only_to_api(self):
+        # Вне DRF работают обычные обработчики загрузки Django
+        response = self.client.post('/admin/login/', {
+            'username': 'user',
+            'file': SimpleUploadedFile('big.png', make_png((200, 200))),
+        })
+        self.assertEqual(response.status_code, 200)
+
+class SubscriptionsQueryTest(APITestCase):
+    """Список подписок: число запросов не зависит от авторов и лимита."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='password',
+        )
+        for number in range(6):
+            author = User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+                password='password',
+            )
+            Subscription.objects.create(user=cls.reader, author=author)
+            for index in range(number + 1):
+                Recipe.objects.create(
+                    author=author,
+                    name=f'Рецепт {index}',
+                    text='Описание',
+                    cooking_time=10,
+                    image=f'recipes/images/{index}.png',
+                )
+
+    def setUp(self):
+        self.client.force_authenticate(self.reader)
+
+    def get_subscriptions(self, query):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'/api/users/subscriptions/?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data['results'], len(context.captured_queries)
+
+    def test_query_count_is_constant(self):
+        self.get_subscriptions('limit=1')
+        _, few = self.get_subscriptions('limit=1&recipes_limit=1')
+        _, many = self.get_subscriptions('limit=6&recipes_limit=5')
+        _, unlimited = self.get_subscriptions('limit=6')
+        self.assertEqual(few, many)
+        self.assertEqual(few, unlimited)
+
+    def test_recipes_limit_and_count(self):
+        results, _ = self.get_subscriptions('limit=6&recipes_limit=2')
+        self.assertEqual(
+            [(author['recipes_count'], len(author['recipes']))
+             for author in results],
+            [(1, 1), (2, 2), (3, 2), (4, 2), (5, 2), (6, 2)]
+        )
+        newest = Recipe.objects.filter(author__username='author5').order_by(
+            '-created', '-id'
+        ).values_list('id', flat=True)[:2]
+        self.assertEqual(
+            [recipe['id'] for recipe in results[-1]['recipes']], list(newest)
+        )
+
+
+class CountersTest(APITestCase):
+    """Хранимые счётчики следуют за API и чинятся командой recount."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='password',
+        )
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.reader)
+        self.recipe = Recipe.objects.create(
+            author=self.author,
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/images/recipe.png',
+        )
+
+    def counters(self):
+        self.recipe.refresh_from_db()
+        self.reader.refresh_from_db()
+        self.author.refresh_from_db()
+        return (
+            self.recipe.favorites_count,
+            self.author.recipes_count,
+            self.author.subscribers_count,
+            self.reader.subscriptions_count,
+        )
+
+    def test_counters_follow_api(self):
+        subscribe_url = f'/api/users/{self.author.id}/subscribe/'
+        favorite_url = f'/api/recipes/{self.recipe.id}/favorite/'
+        self.assertEqual(self.counters(), (0, 1, 0, 0))
+
+        self.assertEqual(self.client.post(subscribe_url).status_code, 201)
+        self.assertEqual(self.client.post(favorite_url).status_code, 201)
+        self.assertEqual(self.client.post(favorite_url).status_code, 400)
+        self.assertEqual(self.counters(), (1, 1, 1, 1))
+
+        # Сохранение рецепта, прочитанного до добавления в избранное,
+        # не затирает счётчик
+        stale = Recipe.objects.get(pk=self.recipe.pk)
+        Favorite.objects.filter(recipe=self.recipe).delete()
+        stale.name = 'Новое название'
+        stale.save()
+        self.assertEqual(self.counters(), (0, 1, 1, 1))
+
+        self.assertEqual(self.client.delete(subscribe_url).status_code, 204)
+        self.recipe.delete()
+        self.author.refresh_from_db()
+        self.reader.refresh_from_db()
+        self.assertEqual(
+            (self.author.recipes_count, self.author.subscribers_count,
+             self.reader.subscriptions_count),
+            (0, 0, 0)
+        )
+
+    def test_save_keeps_task_fields(self):
+        stale_user = User.objects.get(pk=self.reader.pk)
+        stale_recipe = Recipe.objects.get(pk=self.recipe.pk)
+        # Поля, которые тем временем записали фоновые задачи
+        User.objects.filter(pk=self.reader.pk).update(
+            feed_materialized=True, avatar_variants={'small': {}}
+        )
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            image_variants={'card': {}}
+        )
+
+        stale_user.first_name = 'Читатель'
+        stale_user.save()
+        stale_recipe.name = 'Новое название'
+        stale_recipe.save()
+
+        self.reader.refresh_from_db()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.reader.first_name, 'Читатель')
+        self.assertTrue(self.reader.feed_materialized)
+        self.assertEqual(self.reader.avatar_variants, {'small': {}})
+        self.assertEqual(self.recipe.name, 'Новое название')
+        self.assertEqual(self.recipe.image_variants, {'card': {}})
+
+    def test_recount_repairs_drift(self):
+        Favorite.objects.bulk_create([
+            Favorite(user=self.reader, recipe=self.recipe),
+            Favorite(user=self.author, recipe=self.recipe),
+        ])
+        Subscription.objects.bulk_create([
+            Subscription(user=self.reader, author=self.author)
+        ])
+        User.objects.filter(pk=self.author.pk).update(recipes_count=5)
+        self.assertEqual(self.counters(), (0, 5, 0, 0))
+
+        call_command(
+            'recount', batch_size=1, dry_run=True, stdout=io.StringIO()
+        )
+        self.assertEqual(self.counters(), (0, 5, 0, 0))
+
+        output = io.StringIO()
+        call_command('recount', batch_size=1, stdout=output)
+        self.assertEqual(self.counters(), (2, 1, 1, 1))
+        self.assertIn('исправлено 1', output.getvalue())
@@ -1,11 +1,19 @@
 """Views для работы с пользователями."""
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
+from foodgram.conditional import conditional_response, make_etag
+from foodgram.images import reset_image_variants, schedule_image_variants
+from foodgram.uploads import UPLOAD_PARSER_CLASSES
+from recipes.models import Recipe
 from .serializers import (
+    get_recipes_limit,
+    get_subscription_status,
     UserSerializer,
     UserCreateSerializer,
     SetPasswordSerializer,
@@ -13,7 +21,8 @@ from .serializers import (
     SetAvatarResponseSerializer,
     UserWithRecipesSerializer,
 )
-from .pagination import CustomPageNumberPagination
+from .pagination import UserPagination
+from .tasks import generate_avatar_variants
 from .models import Subscription
 
 User = get_user_model()
@@ -25,7 +34,7 @@ class UserViewSet(viewsets.ModelViewSet):
     serializer_class = UserSerializer
     permission_classes = [AllowAny]
     lookup_field = 'id'
-    pagination_class = CustomPageNumberPagination
+    pagination_class = UserPagination
 
     def get_serializer_class(self):
         """Выбор сериализатора в зависимости от действия."""
@@ -41,6 +50,53 @@ class UserViewSet(viewsets.ModelViewSet):
             return [AllowAny()]
         return [IsAuthenticated()]
 
+    def get_authors_with_recipes(self, queryset):
+        """Авторы с последними рецептами.
+
+        Срез в Prefetch Django выполняет одним запросом с
+        ROW_NUMBER() OVER (PARTITION BY author_id), поэтому число
+        запросов не зависит ни от числа авторов, ни от recipes_limit.
+        """
+        recipes = Recipe.objects.only(
+            'id', 'author_id', 'name', 'image', 'image_variants',
+            'cooking_time'
+        ).order_by('-created', '-id')
+        recipes_limit = get_recipes_limit(self.request)
+        if recipes_limit:
+            recipes = recipes[:recipes_limit]
+        return queryset.prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='recent_recipes')
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """Профиль пользователя с поддержкой ETag."""
+        try:
+            updated = User.objects.filter(id=kwargs.get('id')).values_list(
+                'updated', flat=True
+            ).first()
+        except (TypeError, ValueError):
+            updated = None
+        if updated is None:
+            return super().retrieve(request, *args, **kwargs)
+        return conditional_response(
+            request,
+            lambda: super(UserViewSet, self).retrieve(
+                request, *args, **kwargs
+            ),
+            self.get_user_etag(request, User(id=int(kwargs['id'])), updated),
+            # Подписка меняется без изменения даты профиля
+            None if request.user.is_authenticated else updated
+        )
+
+    def get_user_etag(self, request, user, updated):
+        """ETag профиля: версия строки, подписка и хост для URL аватара."""
+        return make_etag(
+            user.pk,
+            updated.isoformat(),
+            get_subscription_status(request, user),
+            request.get_host(),
+        )
+
     @action(
         detail=False,
         methods=['get'],
@@ -48,8 +104,13 @@ class UserViewSet(viewsets.ModelViewSet):
     )
     def me(self, request):
         """Получение информации о текущем пользователе."""
-        serializer = self.get_serializer(request.user)
-        return Response(serializer.data)
+        user = request.user
+        return conditional_response(
+            request,
+            lambda: Response(self.get_serializer(user).data),
+            self.get_user_etag(request, user, user.updated),
+            user.updated
+        )
 
     @action(
         detail=False,
@@ -69,7 +130,8 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(
         detail=False,
         methods=['put', 'delete'],
-        url_path='me/avatar'
+        url_path='me/avatar',
+        parser_classes=UPLOAD_PARSER_CLASSES
     )
     def avatar(self, request):
         """Добавление или удаление аватара текущего пользователя."""
@@ -82,6 +144,10 @@ class UserViewSet(viewsets.ModelViewSet):
             user = request.user
             user.avatar = serializer.validated_data['avatar']
             user.save()
+            reset_image_variants(user, 'avatar_variants')
+            schedule_image_variants(
+                generate_avatar_variants, user.pk, user.avatar.name
+            )
             response_serializer = SetAvatarResponseSerializer(
                 user,
                 context={'request': request}
@@ -93,8 +159,10 @@ class UserViewSet(viewsets.ModelViewSet):
         elif request.method == 'DELETE':
             user = request.user
             if user.avatar:
-                user.avatar.delete()
+                # Файл может быть общим, его удалит collect_media_garbage
+                user.avatar = None
                 user.save()
+                reset_image_variants(user, 'avatar_variants')
             return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -118,9 +186,12 @@ class UserViewSet(viewsets.ModelViewSet):
                     {'errors': 'Нельзя подписаться на самого себя.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            Subscription.objects.create(user=user, author=author)
+            with transaction.atomic():
+                Subscription.objects.create(user=user, author=author)
             serializer = UserWithRecipesSerializer(
-                author,
+                self.get_authors_with_recipes(
+                    User.objects.filter(pk=author.pk)
+                ).get(),
                 context={'request': request}
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -147,9 +218,11 @@ class UserViewSet(viewsets.ModelViewSet):
         """Получение списка подписок пользователя."""
         user = request.user
 
-        subscribed_authors = User.objects.filter(
-            subscribers__user=user
-        ).prefetch_related('recipes')
+        subscribed_authors = self.get_authors_with_recipes(
+            User.objects.filter(subscribers__user=user).order_by(
+                'username', 'id'
+            )
+        )
 
         paginated_queryset = self.paginate_queryset(subscribed_authors)
 